@@ -0,0 +1,61 @@
+import sys
+import time
+import random
+import argparse
+
+from bench_universal_parser import median
+from geofence_engine import CircleFence, GeofenceEngine, GeofenceIndex
+from universal_gps_parser import GPSFix
+
+
+def build(fences, devices, fixes, seed=1):
+    """
+    `fences` random circles and `fixes` random fixes over `devices` devices,
+    all of one tenant within a 1 x 1 degree square (as in test_geofence_engine).
+    """
+    rng = random.Random(seed)
+    index = GeofenceIndex()
+    for i in range(fences):
+        index.add(CircleFence(i, 1, 33.5 + rng.random(), -8.0 + rng.random(), rng.uniform(100, 1000)))
+    imeis = [f"3595860000{i:05d}" for i in range(devices)]
+    batch = [GPSFix('location_update', 'hq', imeis[i % devices], 1698064500 + i,
+                    33.5 + rng.random(), -8.0 + rng.random(), 40.0, 0.0, GPSFix.FLAG_GPS_VALID)
+             for i in range(fixes)]
+    return index, {imei: 1 for imei in imeis}, batch
+
+
+def measure(index, device_tenants, fixes, repeat):
+    """
+    Median fixes/s of GeofenceEngine.apply_many over `repeat` fresh engines.
+    """
+    rates = []
+    for _ in range(repeat):
+        engine = GeofenceEngine(index, dict(device_tenants))
+        started = time.perf_counter()
+        engine.apply_many(fixes)
+        rates.append(len(fixes) / (time.perf_counter() - started))
+    return median(rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GeofenceEngine throughput benchmark")
+    parser.add_argument('--fences', type=int, default=2000)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--fixes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs; the median is reported")
+    parser.add_argument('--min-rate', type=float,
+                        help="Fail (exit 1) when the median is below this many fixes/s")
+    args = parser.parse_args()
+
+    index, device_tenants, fixes = build(args.fences, args.devices, args.fixes)
+    rate = measure(index, device_tenants, fixes, args.repeat)
+    print(f"{args.fixes:,} fixes, {args.fences:,} fences, {args.devices:,} devices: "
+          f"{rate:,.0f} fixes/s (median of {args.repeat})")
+    if args.min_rate is not None and rate < args.min_rate:
+        print(f"\nREGRESSION: below {args.min_rate:,.0f} fixes/s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
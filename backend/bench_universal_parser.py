@@ -0,0 +1,374 @@
+import gc
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime, timedelta
+
+from universal_gps_parser import UniversalGPSParser
+from simulate_movement_hq import build_packet, build_standard_packet, build_heartbeat
+
+# One representative message per format
+SAMPLES = {
+    'standard': "imei:359586018966098,tracker,231023123519,,F,123519,A,3123.1234,N,00433.9876,E,40.00,90.0,10.0,0,0,80%,80%,25;",
+    'hq': "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000001#",
+    'simulator': "(359586018966098,LOC,33.5731,-7.5896,42.5,1,12.4,1)",
+    'heartbeat_simple': "359586018966098;",
+    'heartbeat_command': "##,imei:359586018966098,A",
+    'invalid': "GET / HTTP/1.1",
+}
+
+# Share of each family in the 'mixed' corpus (realistic ingest traffic)
+MIXED_WEIGHTS = {
+    'hq': 0.70,
+    'standard': 0.10,
+    'heartbeat_simple': 0.08,
+    'heartbeat_command': 0.07,
+    'invalid': 0.05,
+}
+
+GARBAGE = [
+    "GET / HTTP/1.1",
+    "*HQ,359586018966098,V1,123519,A,3123.12",
+    "imei:359586018966098,tracker",
+    "\x16\x03\x01\x02\x00\x01\x00\x01\xfc\x03\x03",
+    "12345678901234;",
+    "##,imei",
+]
+
+DEFAULT_THRESHOLD = 0.25
+# Every timed sample runs for at least this long (parse_many is looped), so
+# small corpora are not dominated by timer and scheduler jitter
+MIN_SAMPLE_SECONDS = 0.2
+# A regression must also exceed this many standard errors of the difference
+# between the baseline and current medians (from the measured noise)
+NOISE_SIGMAS = 3.0
+
+
+def legacy_parse_message(message):
+    """
+    Routing as it was before the dispatch table: a linear chain of
+    startswith() checks with an un-compiled re.match for the heartbeat.
+    (The per-format parsers are shared, so only routing cost differs.)
+    """
+    if not message or not isinstance(message, str):
+        return None
+
+    message = message.strip()
+
+    if message.startswith('imei:'):
+        return UniversalGPSParser.parse_standard_data(message)
+
+    if re.match(r'^\d{15};?$', message):
+        return {
+            'type': 'heartbeat_simple',
+            'imei': message.strip(';')
+        }
+
+    if message.startswith('##,imei:'):
+        return UniversalGPSParser.parse_command_heartbeat(message)
+
+    if message.startswith('*HQ,'):
+        return UniversalGPSParser.parse_hq_data(message)
+
+    return None
+
+
+def build_corpus(family, size, seed=1):
+    """
+    `size` distinct messages of one family (varying IMEI, position, time).
+    """
+    rng = random.Random(f"{seed}:{family}")
+    start = datetime(2024, 1, 1)
+    messages = []
+    for i in range(size):
+        imei = str(359586000000000 + rng.randrange(10000))
+        lat = 33.5 + rng.uniform(-0.5, 0.5)
+        lng = -7.6 + rng.uniform(-0.5, 0.5)
+        speed = rng.choice([0.0, rng.uniform(0, 120)])
+        course = rng.uniform(0, 360)
+        acc_on = rng.random() < 0.8
+        now = start + timedelta(seconds=i * 3)
+        if family == 'hq':
+            messages.append(build_packet(lat, lng, speed, course, acc_on, False, None, imei, now))
+        elif family == 'standard':
+            messages.append(build_standard_packet(lat, lng, speed, course, acc_on, imei, now))
+        elif family == 'heartbeat_simple':
+            messages.append(build_heartbeat(imei))
+        elif family == 'heartbeat_command':
+            messages.append(build_heartbeat(imei, command=True))
+        elif family == 'invalid':
+            messages.append(rng.choice(GARBAGE))
+        elif family == 'mixed':
+            choice = rng.choices(list(MIXED_WEIGHTS), list(MIXED_WEIGHTS.values()))[0]
+            messages.append(build_corpus(choice, 1, rng.random())[0])
+        else:
+            raise ValueError(f"Unknown family: {family}")
+    return messages
+
+
+def load_corpus(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='latin-1') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+CALIBRATION_DATA = [f"*HQ,{i},V1,123519,A,3123.{i % 10000:04d},N" for i in range(5000)]
+
+
+def calibrate(rounds=1):
+    """
+    ns per item for a fixed pure-Python reference workload (split, float and
+    dict building, like the parser). Timed right next to every parse sample
+    so comparisons are normalised for machine speed and noisy hosts.
+    """
+    started = time.perf_counter_ns()
+    for _ in range(rounds):
+        for item in CALIBRATION_DATA:
+            parts = item.split(',')
+            {'imei': parts[1], 'lat': float(parts[5]), 'dir': parts[6].upper()}
+    return (time.perf_counter_ns() - started) / (len(CALIBRATION_DATA) * rounds)
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def noise_of(values):
+    """
+    Relative noise of repeated samples: 1.4826 * MAD / median (a robust
+    standard deviation, as a fraction of the median).
+    """
+    center = median(values)
+    if len(values) < 2 or not center:
+        return 0.0
+    return 1.4826 * median([abs(value - center) for value in values]) / center
+
+
+def measure(messages, mode='str', repeat=7):
+    """
+    Returns msgs_per_sec, ns_per_msg (best of `repeat` samples),
+    relative_cost (median over samples of ns_per_msg / calibration ns, the
+    machine-independent figure used by the regression gate), noise (relative
+    spread of those samples, see noise_of) and allocs_per_msg /
+    bytes_per_msg (memory blocks/bytes still allocated per parsed message,
+    i.e. what holding the results costs).
+    Each sample loops parse_many for at least MIN_SAMPLE_SECONDS.
+    """
+    if mode == 'bytes':
+        messages = [message.encode('latin-1') for message in messages]
+    record = mode == 'record'
+    parse_many = UniversalGPSParser.parse_many
+    count = len(messages)
+
+    started = time.perf_counter()
+    parse_many(messages, record=record)
+    rounds = max(1, int(MIN_SAMPLE_SECONDS / max(time.perf_counter() - started, 1e-9)))
+    calibration_rounds = max(1, int(MIN_SAMPLE_SECONDS / max(calibrate() * len(CALIBRATION_DATA) / 1e9, 1e-9)))
+
+    best = None
+    ratios = []
+    gc_enabled = gc.isenabled()
+    gc.disable()  # as timeit does: collections would land in random samples
+    try:
+        for _ in range(repeat):
+            before = calibrate(calibration_rounds)
+            started = time.perf_counter_ns()
+            for _ in range(rounds):
+                parse_many(messages, record=record)
+            elapsed = (time.perf_counter_ns() - started) / (count * rounds)
+            reference = (before + calibrate(calibration_rounds)) / 2
+            best = elapsed if best is None else min(best, elapsed)
+            ratios.append(elapsed / reference)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = parse_many(messages, record=record)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    size = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    del results
+
+    return {
+        'messages': count,
+        'msgs_per_sec': 1e9 / best,
+        'ns_per_msg': best,
+        'relative_cost': median(ratios),
+        'noise': noise_of(ratios),
+        'samples': repeat,
+        'allocs_per_msg': blocks / count,
+        'bytes_per_msg': size / count,
+    }
+
+
+def measure_family(family, size, mode, repeat, corpus=None):
+    messages = load_corpus(corpus) if family == 'corpus' else build_corpus(family, size)
+    return measure(messages, mode, repeat)
+
+
+def run_suite(families, size, mode, repeat, corpus=None):
+    results = {}
+    for family in families:
+        results[family] = measure_family(family, size, mode, repeat)
+    if corpus:
+        results['corpus'] = measure_family('corpus', size, mode, repeat, corpus)
+    return results
+
+
+def median_error(result):
+    """
+    Relative standard error of a run's median cost (1.2533 * sigma / sqrt(n)).
+    """
+    return 1.2533 * result.get('noise', 0.0) / max(result.get('samples', 1), 1) ** 0.5
+
+
+def allowed_slowdown(current, base, threshold, sigmas=NOISE_SIGMAS):
+    """
+    Relative slowdown tolerated for one family: `threshold`, or `sigmas`
+    standard errors of the difference of the two medians when that is
+    larger (noisy or short runs gate less tightly).
+    """
+    error = (median_error(current) ** 2 + median_error(base) ** 2) ** 0.5
+    return max(threshold, sigmas * error)
+
+
+def compare(results, baseline, threshold, sigmas=NOISE_SIGMAS):
+    """
+    List of (family, description) regressions: median relative cost
+    (machine-normalised ns/msg) above baseline * (1 + allowed_slowdown()),
+    or more allocations per message than baseline * (1 + threshold)
+    (+0.5 block).
+    """
+    regressions = []
+    for family, current in results.items():
+        base = baseline.get('results', {}).get(family)
+        if not base:
+            continue
+        allowed = allowed_slowdown(current, base, threshold, sigmas)
+        if current['relative_cost'] > base['relative_cost'] * (1 + allowed):
+            regressions.append((family, f"cost {current['relative_cost']:.2f} vs baseline "
+                                        f"{base['relative_cost']:.2f} (allowed +{allowed:.0%}, "
+                                        f"{current['ns_per_msg']:.0f} ns/msg)"))
+        if current['allocs_per_msg'] > base['allocs_per_msg'] * (1 + threshold) + 0.5:
+            regressions.append((family, f"{current['allocs_per_msg']:.1f} allocs/msg vs baseline "
+                                        f"{base['allocs_per_msg']:.1f}"))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'family':<20}{'msgs/sec':>12}{'ns/msg':>10}{'rel cost':>10}{'noise':>8}{'allocs/msg':>12}"
+          f"{'bytes/msg':>11}{'vs base':>10}")
+    for family, r in results.items():
+        delta = ''
+        base = (baseline or {}).get('results', {}).get(family)
+        if base:
+            delta = f"{(r['relative_cost'] / base['relative_cost'] - 1) * 100:+.1f}%"
+        print(f"{family:<20}{r['msgs_per_sec']:>12,.0f}{r['ns_per_msg']:>10.0f}{r['relative_cost']:>10.2f}"
+              f"{r.get('noise', 0.0):>8.1%}{r['allocs_per_msg']:>12.1f}{r['bytes_per_msg']:>11.0f}{delta:>10}")
+
+
+def compare_legacy(number=50000, repeat=5):
+    import timeit
+
+    def ns_per_call(func, message):
+        timer = timeit.Timer(lambda: func(message))
+        return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+    print(f"{'format':<20}{'before (ns)':>14}{'after (ns)':>14}{'speedup':>10}")
+    for name, message in SAMPLES.items():
+        after = ns_per_call(UniversalGPSParser._route_message, message)
+        if name == 'simulator':
+            # Not supported by the legacy chain
+            print(f"{name:<20}{'n/a':>14}{after:>14.0f}{'':>10}")
+            continue
+        before = ns_per_call(legacy_parse_message, message)
+        print(f"{name:<20}{before:>14.0f}{after:>14.0f}{before / after:>9.2f}x")
+
+
+def main():
+    families = list(MIXED_WEIGHTS) + ['mixed']
+    parser = argparse.ArgumentParser(description="UniversalGPSParser benchmark suite with regression gate")
+    parser.add_argument('--families', default=','.join(families))
+    parser.add_argument('--size', type=int, default=20000, help="Messages per corpus")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help=f"Timed samples per family (each at least {MIN_SAMPLE_SECONDS}s); the gate uses their median")
+    parser.add_argument('--mode', choices=['str', 'bytes', 'record'], default='str')
+    parser.add_argument('--corpus', help="Also benchmark a corpus file (e.g. from generate_corpus.py)")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against (fails on regression)")
+    parser.add_argument('--save-baseline', help="Write the results as a baseline JSON")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown / allocation growth (0.25 = 25%%); the slowdown allowance "
+                             f"grows to {NOISE_SIGMAS:g}x the measured noise when that is larger")
+    parser.add_argument('--confirm', type=int, default=2,
+                        help="Re-measure a family that looks regressed up to this many times and keep its "
+                             "best run, so one noisy run does not fail the gate")
+    parser.add_argument('--compare-legacy', action='store_true',
+                        help="Per-format routing cost vs the pre-dispatch-table chain")
+    args = parser.parse_args()
+
+    if args.compare_legacy:
+        compare_legacy()
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('mode') != args.mode:
+            print(f"Baseline was recorded in mode '{baseline.get('mode')}', running '{args.mode}'")
+
+    results = run_suite(args.families.split(','), args.size, args.mode, args.repeat, args.corpus)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'mode': args.mode,
+                'size': args.size,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for _ in range(args.confirm):
+            if not regressions:
+                break
+            # Noise only ever slows a run down: keep the faster measurement
+            for family in {family for family, _ in regressions}:
+                print(f"Re-measuring {family}...")
+                again = measure_family(family, args.size, args.mode, args.repeat, args.corpus)
+                if again['relative_cost'] < results[family]['relative_cost']:
+                    results[family] = again
+            regressions = compare(results, baseline, args.threshold)
+        for family, current in results.items():
+            base = baseline.get('results', {}).get(family)
+            allowed = allowed_slowdown(current, base, args.threshold) if base else 0.0
+            if allowed > 2 * args.threshold:
+                print(f"warning: {family} is too noisy to gate at {args.threshold:.0%} (allowing +{allowed:.0%}); "
+                      f"use more --repeat or a quieter host")
+        if regressions:
+            print(f"\nREGRESSION (threshold {args.threshold:.0%} or {NOISE_SIGMAS:g}x noise):")
+            for family, description in regressions:
+                print(f"  {family}: {description}")
+            return 1
+        print(f"\nNo regression beyond {args.threshold:.0%} (or {NOISE_SIGMAS:g}x noise)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
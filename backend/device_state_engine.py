@@ -0,0 +1,249 @@
+import sys
+import time
+
+from universal_gps_parser import GPSFix, epoch_to_timestamp, _timestamp_to_epoch
+
+MOVING = 'moving'
+IDLING = 'idling'
+PARKED = 'parked'
+
+# Speed (km/h) above which a fix with ACC on counts as moving (trackingService.ts)
+MOVING_SPEED = 5
+
+
+def classify(fix):
+    """
+    moving / idling / parked for one fix, same rules as processLocationUpdate.
+    """
+    if not fix.acc_status:
+        return PARKED
+    if fix.speed and fix.speed > MOVING_SPEED:
+        return MOVING
+    return IDLING
+
+
+class DeviceState:
+    """
+    Current state of one device (one row of the engine's table).
+    Timestamps are epoch seconds. last_seen is liveness (newest fix or
+    heartbeat); last_fix_at is the device time of the newest fix and is what
+    late fixes are checked against.
+    """
+
+    __slots__ = ('imei', 'state', 'state_start', 'last_seen', 'last_fix', 'last_alarm', 'last_fix_at')
+
+    def __init__(self, imei, state=None, state_start=None, last_seen=None, last_fix=None, last_alarm=None,
+                 last_fix_at=None):
+        self.imei = imei
+        self.state = state
+        self.state_start = state_start
+        self.last_seen = last_seen
+        self.last_fix = last_fix
+        self.last_alarm = last_alarm
+        self.last_fix_at = last_fix_at
+
+    def to_dict(self, now=None):
+        now = time.time() if now is None else now
+        return {
+            'imei': self.imei,
+            'state': self.state,
+            'state_start_time': epoch_to_timestamp(self.state_start),
+            'state_duration': now - self.state_start if self.state_start is not None else None,
+            'last_seen': epoch_to_timestamp(self.last_seen),
+            'last_alarm': self.last_alarm,
+            'latitude': self.last_fix.latitude if self.last_fix else None,
+            'longitude': self.last_fix.longitude if self.last_fix else None,
+            'speed': self.last_fix.speed if self.last_fix else None,
+        }
+
+    def __repr__(self):
+        return f"DeviceState(imei={self.imei!r}, state={self.state!r}, since={epoch_to_timestamp(self.state_start)!r})"
+
+
+class DeviceStateEngine:
+    """
+    In-memory moving / idling / parked tracking keyed by IMEI.
+    Replaces the UPDATE ... CASE + SELECT back of processLocationUpdate:
+    - apply() updates the device's row and returns a transition event when
+      the state changed (None otherwise); fixes older than the device's last
+      fix update nothing, so late packets cannot flip the state back
+    - heartbeats only refresh last_seen; they are stamped with server time,
+      so they never take part in the fix-ordering check (a device clock
+      behind the server would otherwise make every later fix look stale)
+    - flush() persists devices that changed state since the last flush and,
+      every `snapshot_interval` seconds, last_seen / last_alarm of every
+      device seen since the previous snapshot
+
+    Single writer: apply() and flush() are meant to be called from one
+    thread (the ingest loop); reads (get(), state_of()) are safe from others.
+    """
+
+    def __init__(self, snapshot_interval=60.0, placeholder='?'):
+        self.snapshot_interval = snapshot_interval
+        self.placeholder = placeholder
+        self.devices = {}
+        self.listeners = []
+
+        self._transitioned = set()
+        self._touched = set()
+        self._last_snapshot = time.monotonic()
+
+        self.stats = {
+            'fixes': 0,
+            'heartbeats': 0,
+            'stale': 0,
+            'transitions': 0,
+            'rows_persisted': 0,
+        }
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, imei):
+        return self.devices.get(imei)
+
+    def state_of(self, imei, now=None):
+        """
+        Dashboard view of one device (dict), or None if never seen.
+        """
+        device = self.devices.get(imei)
+        return device.to_dict(now) if device else None
+
+    def load(self, conn):
+        """
+        Warm start from the devices table so a restart does not report
+        spurious transitions.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT device_id, current_state, state_start_time, last_alarm, last_seen FROM devices')
+        for imei, state, state_start, last_alarm, last_seen in cursor.fetchall():
+            imei = sys.intern(str(imei))
+            state_start, last_seen = self._to_epoch(state_start), self._to_epoch(last_seen)
+            # state_start is the device time of a fix, so it bounds late fixes;
+            # a device that never reported only has its registration time there
+            last_fix_at = state_start if last_seen is not None else None
+            self.devices[imei] = DeviceState(imei, state, state_start, last_seen, None, last_alarm, last_fix_at)
+        return len(self.devices)
+
+    @staticmethod
+    def _to_epoch(value):
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        if hasattr(value, 'strftime'):
+            value = value.strftime("%Y-%m-%d %H:%M:%S")
+        return _timestamp_to_epoch(str(value)[:19])
+
+    def apply(self, fix, now=None):
+        """
+        Applies one fix (GPSFix or parse_message() dict). Returns a transition
+        event dict (imei, previous, state, since, fix) or None.
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None:
+            return None
+        at = fix.timestamp if fix.timestamp is not None else (time.time() if now is None else now)
+
+        device = self.devices.get(fix.imei)
+        if device is None:
+            device = self.devices[fix.imei] = DeviceState(fix.imei)
+
+        if fix.type != 'location_update':
+            self.stats['heartbeats'] += 1
+            if device.last_seen is None or at > device.last_seen:
+                device.last_seen = at
+                self._touched.add(device.imei)
+            return None
+
+        if device.last_fix_at is not None and at < device.last_fix_at:
+            self.stats['stale'] += 1
+            return None
+        device.last_fix_at = at
+        if device.last_seen is None or at > device.last_seen:
+            device.last_seen = at
+        self._touched.add(device.imei)
+
+        self.stats['fixes'] += 1
+        device.last_fix = fix
+        if fix.alarm:
+            device.last_alarm = fix.alarm
+
+        state = classify(fix)
+        if state == device.state:
+            return None
+
+        previous = device.state
+        device.state = state
+        device.state_start = at
+        self._transitioned.add(device.imei)
+        self.stats['transitions'] += 1
+
+        event = {
+            'imei': device.imei,
+            'previous': previous,
+            'state': state,
+            'since': at,
+            'fix': fix,
+        }
+        for listener in self.listeners:
+            listener(event)
+        return event
+
+    def apply_many(self, fixes, now=None):
+        """
+        Applies fixes in order; returns the list of transition events.
+        """
+        apply = self.apply
+        events = []
+        for fix in fixes:
+            event = apply(fix, now)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def snapshot_due(self):
+        return time.monotonic() - self._last_snapshot >= self.snapshot_interval
+
+    def flush(self, conn, snapshot=None):
+        """
+        Writes pending transitions (and a snapshot when due, or when
+        `snapshot` is True) to the devices table. Returns rows written.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot_due()
+        p = self.placeholder
+        cursor = conn.cursor()
+        written = 0
+
+        if self._transitioned:
+            rows = []
+            for imei in self._transitioned:
+                device = self.devices[imei]
+                rows.append((device.state, epoch_to_timestamp(device.state_start),
+                             epoch_to_timestamp(device.last_seen), device.last_alarm, imei))
+            cursor.executemany(
+                f"UPDATE devices SET current_state = {p}, state_start_time = {p}, last_seen = {p}, "
+                f"status = 'online', last_alarm = COALESCE({p}, last_alarm) WHERE device_id = {p}",
+                rows
+            )
+            written += len(rows)
+            self._touched.difference_update(self._transitioned)
+
+        if snapshot and self._touched:
+            rows = [(epoch_to_timestamp(self.devices[imei].last_seen), self.devices[imei].last_alarm, imei)
+                    for imei in self._touched]
+            cursor.executemany(
+                f"UPDATE devices SET last_seen = {p}, status = 'online', "
+                f"last_alarm = COALESCE({p}, last_alarm) WHERE device_id = {p}",
+                rows
+            )
+            written += len(rows)
+
+        conn.commit()
+        self._transitioned.clear()
+        if snapshot:
+            self._touched.clear()
+            self._last_snapshot = time.monotonic()
+        self.stats['rows_persisted'] += written
+        return written
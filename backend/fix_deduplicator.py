@@ -0,0 +1,192 @@
+import time
+import heapq
+from collections import deque
+
+from universal_gps_parser import GPSFix
+
+
+class _DeviceBuffer:
+    """
+    Per-device state: reorder heap, fingerprint ring + set, watermarks.
+    """
+
+    __slots__ = ('pending', 'ring', 'seen', 'newest', 'released', 'arrived', 'scheduled')
+
+    def __init__(self, history):
+        self.pending = []  # heap of (timestamp, seq, fix)
+        self.ring = deque(maxlen=history)
+        self.seen = set()
+        self.newest = None  # newest timestamp pushed
+        self.released = None  # timestamp of the last fix released
+        self.arrived = 0.0  # monotonic time of the last push
+        self.scheduled = False  # has an entry in FixDeduplicator._deadlines
+
+
+class FixDeduplicator:
+    """
+    Per-IMEI dedupe / reorder stage in front of storage.
+    - location fixes without a usable position (missing, 0/0, out of range,
+      or gps_status invalid when `drop_invalid`) are dropped
+    - exact duplicates (same timestamp and position among the device's last
+      `history` fixes) are dropped; the fingerprints live in a bounded ring
+      plus a set, so the check is O(1)
+    - fixes wait in a per-device heap until the device has sent a fix
+      `window` seconds newer (or `max_pending` are waiting, or
+      release_expired() finds the device quiet), then leave in timestamp
+      order; quiet devices are found through a heap of deadlines (one entry
+      per device with buffered fixes), so release_expired() only touches
+      devices whose deadline has passed
+    - a fix older than what was already released cannot be reordered any
+      more; it is passed through and counted as 'late'
+    - other messages (heartbeats) and fixes without a timestamp pass straight
+      through
+
+    Memory is bounded per device by `history` + `max_pending` entries.
+    Not thread-safe: use one instance per ingest thread, or lock around it.
+    """
+
+    def __init__(self, window=30.0, history=64, max_pending=256, drop_invalid=True):
+        self.window = window
+        self.history = history
+        self.max_pending = max_pending
+        self.drop_invalid = drop_invalid
+        self.devices = {}
+        self._seq = 0
+        self._deadlines = []  # heap of (deadline, seq, imei, _DeviceBuffer)
+        self.stats = {
+            'received': 0,
+            'released': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'reordered': 0,
+            'late': 0,
+        }
+
+    def _usable(self, fix):
+        lat, lng = fix.latitude, fix.longitude
+        if lat is None or lng is None or (lat == 0 and lng == 0):
+            return False
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return False
+        return fix.gps_valid or not self.drop_invalid
+
+    def push(self, fix, now=None):
+        """
+        Takes one fix (GPSFix or parse_message() dict); returns the list of
+        fixes released by it, in timestamp order per device.
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None:
+            return []
+        self.stats['received'] += 1
+        if fix.type != 'location_update' or fix.timestamp is None:
+            if fix.type == 'location_update' and not self._usable(fix):
+                self.stats['invalid'] += 1
+                return []
+            self.stats['released'] += 1
+            return [fix]
+        if not self._usable(fix):
+            self.stats['invalid'] += 1
+            return []
+
+        device = self.devices.get(fix.imei)
+        if device is None:
+            device = self.devices[fix.imei] = _DeviceBuffer(self.history)
+        device.arrived = time.monotonic() if now is None else now
+
+        fingerprint = (fix.timestamp, fix.latitude, fix.longitude)
+        if fingerprint in device.seen:
+            self.stats['duplicates'] += 1
+            return []
+        if len(device.ring) == self.history:
+            device.seen.discard(device.ring[0])
+        device.ring.append(fingerprint)
+        device.seen.add(fingerprint)
+
+        timestamp = fix.timestamp
+        if device.released is not None and timestamp < device.released:
+            self.stats['late'] += 1
+            self.stats['released'] += 1
+            return [fix]
+        if device.newest is not None and timestamp < device.newest:
+            self.stats['reordered'] += 1
+        if device.newest is None or timestamp > device.newest:
+            device.newest = timestamp
+
+        self._seq += 1
+        heapq.heappush(device.pending, (timestamp, self._seq, fix))
+
+        horizon = device.newest - self.window
+        released = []
+        pending = device.pending
+        while pending and (pending[0][0] <= horizon or len(pending) > self.max_pending):
+            released.append(heapq.heappop(pending)[2])
+        if released:
+            device.released = released[-1].timestamp
+            self.stats['released'] += len(released)
+        if pending and not device.scheduled:
+            self._schedule(fix.imei, device)
+        return released
+
+    def _schedule(self, imei, device):
+        self._seq += 1
+        heapq.heappush(self._deadlines, (device.arrived + self.window, self._seq, imei, device))
+        device.scheduled = True
+
+    def push_many(self, fixes, now=None):
+        push = self.push
+        released = []
+        for fix in fixes:
+            out = push(fix, now)
+            if out:
+                released.extend(out)
+        return released
+
+    def _drain(self, device):
+        released = [heapq.heappop(device.pending)[2] for _ in range(len(device.pending))]
+        if released:
+            device.released = released[-1].timestamp
+            self.stats['released'] += len(released)
+        return released
+
+    def release_expired(self, now=None):
+        """
+        Releases the fixes of devices that have been quiet for `window`
+        seconds (their buffered fixes would otherwise wait for the next one).
+        """
+        now = time.monotonic() if now is None else now
+        released = []
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, _, imei, device = heapq.heappop(deadlines)
+            if self.devices.get(imei) is not device:
+                continue  # forgotten
+            device.scheduled = False
+            if not device.pending:
+                continue
+            if now - device.arrived >= self.window:
+                released.extend(self._drain(device))
+            else:
+                # Heard from since this entry was made: wait for the new deadline
+                self._schedule(imei, device)
+        return released
+
+    def flush(self):
+        """
+        Releases everything still buffered (e.g. on shutdown).
+        """
+        released = []
+        for device in self.devices.values():
+            if device.pending:
+                released.extend(self._drain(device))
+        return released
+
+    def pending(self):
+        return sum(len(device.pending) for device in self.devices.values())
+
+    def forget(self, imei):
+        """
+        Drops a device's state; returns its buffered fixes.
+        """
+        device = self.devices.pop(imei, None)
+        return self._drain(device) if device else []
@@ -0,0 +1,203 @@
+import bz2
+import gzip
+import lzma
+import random
+import argparse
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional for the backend, but this tool is NumPy only
+    raise ImportError("generate_corpus needs NumPy; simulate_fleet.py generates traffic without it") from None
+
+from simulate_movement_hq import (
+    SPEED_FACTOR, interpolate, get_bearing, scenario_state,
+    build_heartbeat, build_packet, build_standard_packet,
+)
+from simulate_fleet import IMEI_BASE, make_route, parse_mix
+
+OPENERS = {
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+    'none': open,
+}
+
+# Scenario table for the 100-step cycle: speed, acc, sos, advancing
+_SCENARIO = [scenario_state(cycle) for cycle in range(100)]
+SCENARIO_SPEED = np.array([state[0] for state in _SCENARIO])
+SCENARIO_ACC = np.array([state[1] for state in _SCENARIO])
+SCENARIO_SOS = np.array([state[2] == 'sos' for state in _SCENARIO])
+SCENARIO_ADVANCING = np.array([state[3] for state in _SCENARIO], dtype=np.int64)
+# Advancing steps before each position of the cycle (prefix sum)
+SCENARIO_ADVANCED_BEFORE = np.concatenate(([0], np.cumsum(SCENARIO_ADVANCING)[:-1]))
+ADVANCING_PER_CYCLE = int(SCENARIO_ADVANCING.sum())
+STEPS_PER_SEGMENT = int(round(1.0 / SPEED_FACTOR))
+
+
+class FleetTrajectories:
+    """
+    Closed-form trajectories for a whole fleet: position of device d at step t
+    is computed directly (no per-step state), so any [devices x steps] block
+    can be evaluated in one vectorized pass. Same scenario cycle, speed factor
+    and interpolation as simulate_movement_hq.py (progress advances in whole
+    1/SPEED_FACTOR steps per segment).
+    """
+
+    def __init__(self, devices, seed, route_points=6):
+        self.devices = devices
+        self.imeis = [str(IMEI_BASE + i) for i in range(devices)]
+        routes = []
+        cycle0 = np.empty(devices, dtype=np.int64)
+        step0 = np.empty(devices, dtype=np.int64)
+        phase = np.empty(devices)
+        for i in range(devices):
+            rng = random.Random(f"{seed}:{i}")
+            routes.append(make_route(rng, route_points))
+            cycle0[i] = rng.randrange(100)
+            step0[i] = rng.randrange(STEPS_PER_SEGMENT * (route_points - 1))
+            phase[i] = rng.random()
+
+        self.routes = np.array(routes)  # (devices, points, 2)
+        segments = route_points - 1
+        self.segments = segments
+        # Bearing of every route segment, from the simulator's get_bearing
+        self.bearings = np.array([[get_bearing(route[k][0], route[k][1], route[k + 1][0], route[k + 1][1])
+                                   for k in range(segments)] for route in routes])
+        self.cycle0 = cycle0
+        self.step0 = step0
+        self.phase = phase
+
+    def block(self, t0, steps):
+        """
+        State of every device for steps t0 .. t0 + steps - 1.
+        Returns dict of (devices, steps) arrays: lat, lng, speed, course, acc, sos.
+        """
+        t = np.arange(t0, t0 + steps, dtype=np.int64)[None, :]
+        # Cycle position of step t (the simulator increments before using it)
+        full_cycles, cycle = np.divmod(self.cycle0[:, None] + 1 + t, 100)
+
+        # Advancing steps taken before this one since the device started
+        start_full, start_offset = np.divmod(self.cycle0 + 1, 100)
+        advanced = (full_cycles * ADVANCING_PER_CYCLE + SCENARIO_ADVANCED_BEFORE[cycle]
+                    - (start_full * ADVANCING_PER_CYCLE + SCENARIO_ADVANCED_BEFORE[start_offset])[:, None])
+        progress_steps = self.step0[:, None] + advanced
+
+        segment = (progress_steps // STEPS_PER_SEGMENT) % self.segments
+        fraction = (progress_steps % STEPS_PER_SEGMENT) * SPEED_FACTOR
+
+        rows = np.arange(self.devices)[:, None]
+        p1 = (self.routes[rows, segment, 0], self.routes[rows, segment, 1])
+        p2 = (self.routes[rows, segment + 1, 0], self.routes[rows, segment + 1, 1])
+        lat, lng = interpolate(p1, p2, fraction)
+
+        return {
+            'lat': lat,
+            'lng': lng,
+            'speed': SCENARIO_SPEED[cycle],
+            'course': self.bearings[rows, segment],
+            'acc': SCENARIO_ACC[cycle],
+            'sos': SCENARIO_SOS[cycle],
+        }
+
+
+def corrupt(packet, rng):
+    """
+    Malformed variants seen on real links: truncation, dropped field, noise.
+    """
+    kind = rng.randrange(3)
+    if kind == 0:
+        return packet[:rng.randrange(1, max(2, len(packet)))]
+    if kind == 1:
+        parts = packet.split(',')
+        if len(parts) > 2:
+            del parts[rng.randrange(1, len(parts))]
+        return ','.join(parts)
+    pos = rng.randrange(len(packet))
+    return packet[:pos] + chr(rng.randrange(33, 127)) + packet[pos + 1:]
+
+
+def generate(output, devices=1000, steps=1000, interval=2.0, start=None, seed=1,
+             malformed=0.0, mix='hq=0.8,standard=0.1,heartbeat=0.1', compression='gzip',
+             block_steps=64):
+    """
+    Streams `devices` x `steps` packets to `output` (one per line), in
+    simulated time order: every step is written device by device in order
+    of their phase offset. Returns the number of packets written.
+    """
+    start = start or datetime(2024, 1, 1)
+    fleet = FleetTrajectories(devices, seed)
+    rng = random.Random(seed)
+    protocols = parse_mix(mix)
+    names = [name for name, _ in protocols]
+    weights = [weight for _, weight in protocols]
+    imeis = fleet.imeis
+    offsets = fleet.phase * interval
+    # Offsets are below one interval, so this order keeps the whole file sorted
+    by_offset = sorted(range(devices), key=lambda d: offsets[d])
+    times = {}
+
+    written = 0
+    with OPENERS[compression](output, 'wt') as out:
+        for t0 in range(0, steps, block_steps):
+            count = min(block_steps, steps - t0)
+            state = fleet.block(t0, count)
+            lat, lng, speed, course = state['lat'].tolist(), state['lng'].tolist(), state['speed'].tolist(), state['course'].tolist()
+            acc, sos = state['acc'].tolist(), state['sos'].tolist()
+
+            lines = []
+            for j in range(count):
+                base = (t0 + j) * interval
+                for d in by_offset:
+                    seconds = int(base + offsets[d])
+                    now = times.get(seconds)
+                    if now is None:
+                        now = times[seconds] = start + timedelta(seconds=seconds)
+
+                    if sos[d][j]:
+                        packet = build_packet(lat[d][j], lng[d][j], speed[d][j], course[d][j], acc[d][j],
+                                              False, 'sos', imeis[d], now)
+                    else:
+                        protocol = rng.choices(names, weights)[0]
+                        if protocol == 'heartbeat':
+                            packet = build_heartbeat(imeis[d], command=rng.random() < 0.5)
+                        elif protocol == 'standard':
+                            packet = build_standard_packet(lat[d][j], lng[d][j], speed[d][j], course[d][j],
+                                                           acc[d][j], imeis[d], now)
+                        else:
+                            packet = build_packet(lat[d][j], lng[d][j], speed[d][j], course[d][j], acc[d][j],
+                                                  False, None, imeis[d], now)
+
+                    if malformed and rng.random() < malformed:
+                        packet = corrupt(packet, rng)
+                    lines.append(packet)
+
+            out.write('\n'.join(lines))
+            out.write('\n')
+            written += len(lines)
+            if len(times) > 100000:
+                times.clear()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline, seeded packet corpus generator (simulated time)")
+    parser.add_argument('output')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=1000, help="Packets per device")
+    parser.add_argument('--interval', type=float, default=2.0, help="Simulated seconds between packets")
+    parser.add_argument('--start', default='2024-01-01 00:00:00', help="Simulated start time")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--malformed', type=float, default=0.0, help="Share of malformed/truncated packets")
+    parser.add_argument('--mix', default='hq=0.8,standard=0.1,heartbeat=0.1')
+    parser.add_argument('--compression', choices=sorted(OPENERS), default='gzip')
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S")
+    written = generate(args.output, args.devices, args.steps, args.interval, start, args.seed,
+                       args.malformed, args.mix, args.compression)
+    print(f"Wrote {written} packets to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
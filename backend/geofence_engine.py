@@ -0,0 +1,221 @@
+import math
+import time
+
+from universal_gps_parser import GPSFix, STANDARD_ALARMS
+
+METRES_PER_DEGREE = 6371000.0 * math.pi / 180
+
+# Alarm name used for fence events (tk103.ts: 'stockade' -> 'geofence')
+GEOFENCE_ALARM = STANDARD_ALARMS['stockade']
+
+
+class PolygonFence:
+    """
+    Polygon fence; `points` is a list of (lat, lng) vertices (open or closed
+    ring). Containment uses ray casting in degrees, which is exact enough for
+    fences up to city size.
+    """
+
+    __slots__ = ('fence_id', 'tenant_id', 'name', 'lats', 'lngs', 'bbox')
+
+    def __init__(self, fence_id, tenant_id, points, name=None):
+        if len(points) > 3 and tuple(points[0]) == tuple(points[-1]):
+            points = points[:-1]
+        if len(points) < 3:
+            raise ValueError(f"Polygon fence {fence_id} needs at least 3 points")
+        self.fence_id = fence_id
+        self.tenant_id = tenant_id
+        self.name = name
+        self.lats = [float(lat) for lat, _ in points]
+        self.lngs = [float(lng) for _, lng in points]
+        self.bbox = (min(self.lats), min(self.lngs), max(self.lats), max(self.lngs))
+
+    def contains(self, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if lat < min_lat or lat > max_lat or lng < min_lng or lng > max_lng:
+            return False
+        lats, lngs = self.lats, self.lngs
+        inside = False
+        j = len(lats) - 1
+        for i in range(len(lats)):
+            if (lats[i] > lat) != (lats[j] > lat):
+                if lng < (lngs[j] - lngs[i]) * (lat - lats[i]) / (lats[j] - lats[i]) + lngs[i]:
+                    inside = not inside
+            j = i
+        return inside
+
+    def __repr__(self):
+        return f"PolygonFence({self.fence_id!r}, tenant={self.tenant_id!r}, points={len(self.lats)})"
+
+
+class CircleFence:
+    """
+    Circle fence around (lat, lng) with a radius in metres.
+    """
+
+    __slots__ = ('fence_id', 'tenant_id', 'name', 'lat', 'lng', 'radius', 'bbox', '_radius2', '_scale_lng')
+
+    def __init__(self, fence_id, tenant_id, lat, lng, radius, name=None):
+        self.fence_id = fence_id
+        self.tenant_id = tenant_id
+        self.name = name
+        self.lat = float(lat)
+        self.lng = float(lng)
+        self.radius = float(radius)
+        self._scale_lng = math.cos(math.radians(self.lat))
+        d_lat = self.radius / METRES_PER_DEGREE
+        d_lng = d_lat / max(self._scale_lng, 1e-6)
+        self.bbox = (self.lat - d_lat, self.lng - d_lng, self.lat + d_lat, self.lng + d_lng)
+        self._radius2 = (self.radius / METRES_PER_DEGREE) ** 2
+
+    def contains(self, lat, lng):
+        # Equirectangular distance in degrees of latitude
+        d_lat = lat - self.lat
+        d_lng = (lng - self.lng) * self._scale_lng
+        return d_lat * d_lat + d_lng * d_lng <= self._radius2
+
+    def __repr__(self):
+        return f"CircleFence({self.fence_id!r}, tenant={self.tenant_id!r}, radius={self.radius:g}m)"
+
+
+class GeofenceIndex:
+    """
+    Uniform grid over (tenant, cell) -> fences whose bounding box touches the
+    cell. A lookup is one dict access plus a bounding-box prefilter over the
+    few fences of that cell.
+    """
+
+    def __init__(self, cell_size=0.01):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.fences = {}
+
+    def __len__(self):
+        return len(self.fences)
+
+    def _cells(self, fence):
+        min_lat, min_lng, max_lat, max_lng = fence.bbox
+        size = self.cell_size
+        for cy in range(math.floor(min_lat / size), math.floor(max_lat / size) + 1):
+            for cx in range(math.floor(min_lng / size), math.floor(max_lng / size) + 1):
+                yield (fence.tenant_id, cy, cx)
+
+    def add(self, fence):
+        if fence.fence_id in self.fences:
+            self.remove(fence.fence_id)
+        self.fences[fence.fence_id] = fence
+        for key in self._cells(fence):
+            self.cells.setdefault(key, []).append(fence)
+
+    def remove(self, fence_id):
+        fence = self.fences.pop(fence_id, None)
+        if fence is None:
+            return None
+        for key in self._cells(fence):
+            bucket = self.cells.get(key)
+            if bucket is not None:
+                bucket.remove(fence)
+                if not bucket:
+                    del self.cells[key]
+        return fence
+
+    def candidates(self, tenant_id, lat, lng):
+        size = self.cell_size
+        return self.cells.get((tenant_id, math.floor(lat / size), math.floor(lng / size)), ())
+
+    def query(self, tenant_id, lat, lng):
+        """
+        Fences of `tenant_id` containing the point.
+        """
+        return [fence for fence in self.candidates(tenant_id, lat, lng) if fence.contains(lat, lng)]
+
+
+class GeofenceEngine:
+    """
+    Server-side geofencing: tracks which fences each device is inside and
+    emits 'enter' / 'exit' events.
+    - a device is checked against its tenant's fences (`device_tenants`,
+      IMEI -> tenant_id; devices without a tenant use fences of tenant None)
+    - fixes without a valid GPS position are skipped, so jitter cannot
+      toggle a fence
+    - removing a fence drops it from every device silently
+    """
+
+    def __init__(self, index=None, device_tenants=None):
+        self.index = index if index is not None else GeofenceIndex()
+        self.device_tenants = device_tenants if device_tenants is not None else {}
+        self.inside = {}  # imei -> frozenset of fence ids
+        self.stats = {'fixes': 0, 'skipped': 0, 'events': 0}
+
+    def load_devices(self, conn):
+        """
+        IMEI -> tenant mapping from the devices table.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT device_id, tenant_id FROM devices')
+        for imei, tenant_id in cursor.fetchall():
+            self.device_tenants[str(imei)] = tenant_id
+        return len(self.device_tenants)
+
+    def add_fence(self, fence):
+        self.index.add(fence)
+
+    def remove_fence(self, fence_id):
+        fence = self.index.remove(fence_id)
+        if fence is not None:
+            for imei, fences in self.inside.items():
+                if fence_id in fences:
+                    self.inside[imei] = fences - {fence_id}
+        return fence
+
+    def fences_of(self, imei):
+        return [self.index.fences[fence_id] for fence_id in self.inside.get(imei, ())]
+
+    def apply(self, fix, now=None):
+        """
+        Checks one fix (GPSFix or parse_message() dict). Returns the list of
+        events: {'event': 'enter' | 'exit', 'alarm': 'geofence', 'imei',
+        'fence_id', 'tenant_id', 'at', 'fix'}.
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None or fix.type != 'location_update' or fix.latitude is None or fix.longitude is None \
+                or not fix.gps_valid:
+            self.stats['skipped'] += 1
+            return []
+        self.stats['fixes'] += 1
+
+        imei = fix.imei
+        lat, lng = fix.latitude, fix.longitude
+        tenant_id = self.device_tenants.get(imei)
+        previous = self.inside.get(imei, frozenset())
+        candidates = self.index.candidates(tenant_id, lat, lng)
+        if not candidates and not previous:
+            return []
+
+        current = frozenset(fence.fence_id for fence in candidates if fence.contains(lat, lng))
+        if current == previous:
+            return []
+        self.inside[imei] = current
+
+        at = fix.timestamp if fix.timestamp is not None else (time.time() if now is None else now)
+        events = []
+        for fence_id in previous - current:
+            events.append({'event': 'exit', 'alarm': GEOFENCE_ALARM, 'imei': imei, 'fence_id': fence_id,
+                           'tenant_id': tenant_id, 'at': at, 'fix': fix})
+        for fence_id in current - previous:
+            events.append({'event': 'enter', 'alarm': GEOFENCE_ALARM, 'imei': imei, 'fence_id': fence_id,
+                           'tenant_id': tenant_id, 'at': at, 'fix': fix})
+        self.stats['events'] += len(events)
+        return events
+
+    def apply_many(self, fixes, now=None):
+        """
+        Checks a batch of fixes in order; returns all events.
+        """
+        apply = self.apply
+        events = []
+        for fix in fixes:
+            found = apply(fix, now)
+            if found:
+                events.extend(found)
+        return events
@@ -0,0 +1,244 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is optional for the backend, but this module is NumPy only
+    raise ImportError("gps_columnar needs NumPy; UniversalGPSParser.parse_many(record=True) "
+                      "decodes the same batches without it") from None
+
+from universal_gps_parser import STANDARD_ALARMS
+
+# Field layout of the record arrays returned by decode_hq() / decode_standard()
+FIX_DTYPE = np.dtype([
+    ('index', np.int64),  # position of the message in the input batch
+    ('imei', 'U20'),
+    ('timestamp', 'datetime64[s]'),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('speed', np.float64),
+    ('course', np.float64),
+    ('gps_valid', np.bool_),
+    ('acc_status', np.bool_),
+    ('door_status', np.bool_),
+    ('alarm', 'U20'),
+])
+
+
+def _to_float(values):
+    """
+    float64 array from numeric strings; empty or malformed entries are NaN.
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        out = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except ValueError:
+                pass
+        return out
+
+
+def _to_int(values):
+    """
+    int64 array from digit strings; anything else is -1.
+    """
+    try:
+        return np.array(values, dtype=np.int64)
+    except ValueError:
+        return np.array([int(value) if value.isdigit() else -1 for value in values], dtype=np.int64)
+
+
+def _to_str(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'S':
+        values = np.char.decode(values, 'latin-1')
+    return values
+
+
+# Hex digit value per code point below 128 (-1 = not a hex digit)
+_HEX_VALUES = np.full(128, -1, dtype=np.int64)
+for _i, _c in enumerate('0123456789abcdef'):
+    _HEX_VALUES[ord(_c)] = _HEX_VALUES[ord(_c.upper())] = _i
+
+
+def _hex_low_nibble(values):
+    """
+    Lowest 4 bits of hex status strings (bits 0-3: ACC, door, ...), the
+    vectorized form of int(value, 16) & 0xF. Shorter than 2 digits or not
+    hex -> 0, as in parse_hq_data.
+    """
+    values = _to_str(values)
+    width = values.dtype.itemsize // 4
+    if not values.size or not width:
+        return np.zeros(values.shape, dtype=np.int64)
+    chars = values.view(np.uint32).reshape(len(values), width)
+    digits = np.where(chars < 128, _HEX_VALUES[np.minimum(chars, 127)], -1)
+    lengths = np.count_nonzero(chars, axis=1)
+    valid = (lengths >= 2) & np.all((digits >= 0) | (chars == 0), axis=1)
+    last = digits[np.arange(len(values)), np.maximum(lengths - 1, 0)]
+    return np.where(valid, last, 0)
+
+
+def decode_ddmm(coords, directions):
+    """
+    Vectorized _convert_ddmm_to_decimal: DDMM.MMMM strings + N/S/E/W flags ->
+    float64 decimal degrees. Missing coordinates or directions are NaN.
+    """
+    value = _to_float(coords)
+    directions = _to_str(directions)
+    degrees = np.trunc(value / 100)
+    decimal = degrees + (value - degrees * 100) / 60
+    south_west = (directions == 'S') | (directions == 'W') | (directions == 's') | (directions == 'w')
+    decimal = np.where(south_west, -decimal, decimal)
+    return np.where(directions == '', np.nan, decimal)
+
+
+def _civil_to_datetime64(year, month, day, seconds_of_day):
+    """
+    datetime64[s] from integer columns; out-of-range dates are NaT.
+    """
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) & (seconds_of_day >= 0)
+    months = (year - 1970) * 12 + (month - 1)
+    days = np.where(valid, months, 0).astype('datetime64[M]').astype('datetime64[D]') + np.where(valid, day - 1, 0)
+    out = days.astype('datetime64[s]') + np.where(valid, seconds_of_day, 0)
+    out[~valid] = np.datetime64('NaT')
+    return out
+
+
+def decode_hq_time(dates, times):
+    """
+    *HQ DDMMYY + HHMMSS columns -> datetime64[s] array (UTC, 20YY).
+    Fields that are not exactly six digits decode to NaT.
+    """
+    date = np.where(np.char.str_len(_to_str(dates)) == 6, _to_int(dates), -1)
+    time = np.where(np.char.str_len(_to_str(times)) == 6, _to_int(times), -1)
+    hour, rest = np.divmod(time, 10000)
+    minute, second = np.divmod(rest, 100)
+    seconds = np.where((time >= 0) & (hour < 24) & (minute < 60) & (second < 60),
+                       hour * 3600 + minute * 60 + second, -1)
+    seconds = np.where(date >= 0, seconds, -1)
+    return _civil_to_datetime64(2000 + date % 100, date // 100 % 100, date // 10000, seconds)
+
+
+def decode_standard_time(stamps):
+    """
+    Standard-protocol YYMMDDHHMM or YYMMDDHHMMSS column -> datetime64[s]
+    array (seconds default to 00, as in parse_standard_data).
+    """
+    lengths = np.char.str_len(_to_str(stamps))
+    value = _to_int(stamps)
+    value = np.where(lengths == 10, value * 100, np.where(lengths == 12, value, -1))
+    date, clock = np.divmod(value, 1000000)
+    hour, rest = np.divmod(clock, 10000)
+    minute, second = np.divmod(rest, 100)
+    seconds = np.where((value >= 0) & (hour < 24) & (minute < 60) & (second < 60),
+                       hour * 3600 + minute * 60 + second, -1)
+    return _civil_to_datetime64(2000 + date // 10000, date // 100 % 100, date % 100, seconds)
+
+
+def to_epoch(timestamps):
+    """
+    datetime64 array -> int64 epoch seconds (NaT -> -1).
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+    return np.where(np.isnat(timestamps), -1, timestamps.astype(np.int64))
+
+
+def _columns(messages, prefix, strip, min_fields, width, texts=None):
+    """
+    Splits the messages starting with `prefix` into fields and transposes
+    them. Returns the input indices of the messages with at least
+    `min_fields` fields and their first `width` columns (missing fields '').
+    The messages are appended to `texts` when given.
+    """
+    index = []
+    selected = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, str):
+            message = bytes(message).decode('latin-1')
+        message = message.strip()
+        if message.startswith(prefix):
+            index.append(i)
+            selected.append(message.rstrip(strip))
+
+    counts = [message.count(',') for message in selected]
+    if counts and min(counts) == max(counts) == width - 1:
+        # Uniform batch (the usual case): one split for all messages
+        if texts is not None:
+            texts.extend(selected)
+        flat = ','.join(selected).split(',')
+        return index, [flat[k::width] for k in range(width)]
+
+    kept = []
+    rows = []
+    padding = [''] * width
+    for i, message, count in zip(index, selected, counts):
+        if count + 1 < min_fields:
+            continue
+        parts = message.split(',')
+        if len(parts) < width:
+            parts += padding[len(parts):]
+        kept.append(i)
+        rows.append(parts)
+        if texts is not None:
+            texts.append(message)
+    return kept, list(zip(*rows)) or [()] * width
+
+
+def decode_hq(messages):
+    """
+    Columnar parse_hq_data for a batch of *HQ messages (str or bytes).
+    Returns a record array (FIX_DTYPE) with one row per decodable message;
+    `index` maps rows back to the input. Other messages are skipped.
+    """
+    index, cols = _columns(messages, '*HQ,', '#', 12, 13)
+    out = np.zeros(len(index), dtype=FIX_DTYPE).view(np.recarray)
+    if not index:
+        return out
+    out.index = index
+    out.imei = cols[1]
+    out.timestamp = decode_hq_time(cols[11], cols[3])
+    out.latitude = decode_ddmm(cols[5], cols[6])
+    out.longitude = decode_ddmm(cols[7], cols[8])
+    out.speed = np.nan_to_num(_to_float([value or '0' for value in cols[9]]))
+    out.course = np.nan_to_num(_to_float([value or '0' for value in cols[10]]))
+    status = np.array(cols[4])
+    out.gps_valid = (status == 'F') | (status == 'A')
+    state = _hex_low_nibble(cols[12])
+    out.acc_status = (state & 1) == 1
+    out.door_status = (state & 2) == 2
+    return out
+
+
+def decode_standard(messages):
+    """
+    Columnar parse_standard_data for a batch of imei:... messages.
+    Same record array layout as decode_hq().
+    """
+    texts = []
+    index, cols = _columns(messages, 'imei:', ';', 12, 13, texts)
+    out = np.zeros(len(index), dtype=FIX_DTYPE).view(np.recarray)
+    if not index:
+        return out
+    out.index = index
+    out.imei = [value[5:] for value in cols[0]]
+    out.timestamp = decode_standard_time(cols[2])
+    out.latitude = decode_ddmm(cols[7], cols[8])
+    out.longitude = decode_ddmm(cols[9], cols[10])
+    out.speed = np.nan_to_num(_to_float([value or '0' for value in cols[11]]))
+    out.course = np.nan_to_num(_to_float([value or '0' for value in cols[12]]))
+    status = np.array(cols[4])
+    out.gps_valid = (status == 'F') | (status == 'A')
+    out.alarm = [STANDARD_ALARMS.get(value.lower(), '') for value in cols[1]]
+    out.acc_status = ['State:ACC=1' in text or 'acc on' in text for text in texts]
+    out.door_status = ['Door=1' in text for text in texts]
+    return out
+
+
+def decode_messages(messages):
+    """
+    All *HQ and standard fixes of a mixed batch as one record array, in
+    input order.
+    """
+    out = np.concatenate([decode_hq(messages), decode_standard(messages)]).view(np.recarray)
+    return out[np.argsort(out.index, kind='stable')]
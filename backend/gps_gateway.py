@@ -0,0 +1,588 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import threading
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from fix_deduplicator import FixDeduplicator
+from gps_stream_framer import GPSStreamFramer, peek_imei
+from latest_position_store import LatestPositionStore
+from liveness_tracker import LivenessTracker
+from parser_metrics import ParserMetrics, render_counters
+from position_writer import PositionWriter
+from universal_gps_parser import UniversalGPSParser, epoch_to_timestamp
+
+HOST = '0.0.0.0'
+PORT = 5001
+# The HTTP endpoint (metrics, /fleet) is internal: loopback unless asked otherwise
+METRICS_HOST = '127.0.0.1'
+LOGIN_REPLY = b'(AP05)'
+# Silence (s) after which /fleet reports a device offline without --offline-after
+OFFLINE_AFTER = 300.0
+
+
+class MemorySink:
+    """
+    In-memory sink for local load tests: counts what would have been stored.
+    """
+
+    def __init__(self, keep=False):
+        self.keep = keep
+        self.frames = 0
+        self.fixes = 0
+        self.stored = []
+        self._lock = threading.Lock()
+
+    def write(self, frames, fixes):
+        with self._lock:
+            self.frames += len(frames)
+            self.fixes += len(fixes)
+            if self.keep:
+                self.stored.extend(fixes)
+
+    def close(self):
+        pass
+
+
+class SQLiteSink:
+    """
+    Local SQLite stand-in for the MySQL database (same raw_logs / positions /
+    devices layout as src/db.ts). One write() = one transaction per batch.
+    With update_devices=False, devices.last_seen is left to a LivenessSink.
+    Concurrent gateway workers can deliver a device's batches out of order,
+    so last_seen only ever moves forward.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id VARCHAR(50) UNIQUE NOT NULL,
+            name VARCHAR(100),
+            status VARCHAR(20) DEFAULT 'offline',
+            current_state VARCHAR(20) DEFAULT 'parked',
+            state_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_alarm VARCHAR(50),
+            last_seen TIMESTAMP,
+            internet_status BOOLEAN DEFAULT FALSE,
+            gps_status BOOLEAN DEFAULT FALSE,
+            tenant_id INT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS positions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id VARCHAR(50),
+            lat DOUBLE NOT NULL,
+            lng DOUBLE NOT NULL,
+            speed DOUBLE DEFAULT 0,
+            course DOUBLE DEFAULT 0,
+            alarm VARCHAR(50),
+            acc_status BOOLEAN DEFAULT FALSE,
+            internet_status BOOLEAN DEFAULT FALSE,
+            gps_status BOOLEAN DEFAULT FALSE,
+            door_status BOOLEAN DEFAULT FALSE,
+            battery_level INT DEFAULT 100,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS raw_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id VARCHAR(50),
+            payload TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    def __init__(self, path=':memory:', update_devices=True):
+        self.update_devices = update_devices
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def write(self, frames, fixes):
+        received_at = epoch_to_timestamp(time.time())
+        positions = []
+        devices = []
+        for fix in fixes:
+            if fix.type == 'location_update' and fix.latitude is not None and fix.longitude is not None:
+                positions.append((
+                    fix.imei, fix.latitude, fix.longitude, fix.speed or 0, fix.course or 0,
+                    fix.alarm, fix.acc_status, True, fix.gps_valid, fix.door_status,
+                    epoch_to_timestamp(fix.timestamp) or received_at
+                ))
+            if self.update_devices:
+                devices.append((epoch_to_timestamp(fix.timestamp) or received_at, fix.imei))
+
+        raw_logs = []
+        for frame in frames:
+            payload = frame.decode('latin-1')
+            imei = peek_imei(payload)
+            raw_logs.append((imei if imei.isdigit() else None, payload, received_at))
+
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO raw_logs (device_id, payload, received_at) VALUES (?, ?, ?)',
+                raw_logs
+            )
+            self.conn.executemany(
+                'INSERT INTO positions (device_id, lat, lng, speed, course, alarm, acc_status, internet_status, gps_status, door_status, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                positions
+            )
+            self.conn.executemany(
+                "UPDATE devices SET last_seen = CASE WHEN last_seen IS NULL OR last_seen < ?1 THEN ?1 "
+                "ELSE last_seen END, status = 'online', internet_status = 1 WHERE device_id = ?2",
+                devices
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class WriterSink:
+    """
+    Hands fixes to a PositionWriter (write-behind, multi-row inserts, one
+    devices UPDATE per IMEI per flush). Raw frames are not logged.
+    submit_many() blocks while the writer is behind, which backs up the
+    gateway queue and in turn the sockets.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, frames, fixes):
+        self.writer.submit_many(fixes)
+
+    def close(self):
+        self.writer.close()
+
+
+class DedupSink:
+    """
+    Runs fixes through a FixDeduplicator (per-device duplicate suppression
+    and reordering) before handing them to `sink`. Fixes held back by the
+    reorder window are written with a later batch, or on close().
+    """
+
+    def __init__(self, sink, deduplicator):
+        self.sink = sink
+        self.deduplicator = deduplicator
+        self._lock = threading.Lock()
+
+    def write(self, frames, fixes):
+        with self._lock:
+            released = self.deduplicator.push_many(fixes)
+            released.extend(self.deduplicator.release_expired())
+        self.sink.write(frames, released)
+
+    def close(self):
+        with self._lock:
+            released = self.deduplicator.flush()
+        if released:
+            self.sink.write([], released)
+        self.sink.close()
+
+
+class LatestPositionSink:
+    """
+    Keeps a LatestPositionStore current with every batch, then hands the
+    batch to `sink`. On close() the store is snapshotted to
+    `snapshot_path` (if given) for the next warm start.
+    """
+
+    def __init__(self, sink, store, snapshot_path=None):
+        self.sink = sink
+        self.store = store
+        self.snapshot_path = snapshot_path
+
+    def write(self, frames, fixes):
+        self.store.update_many(fixes)
+        self.sink.write(frames, fixes)
+
+    def close(self):
+        if self.snapshot_path:
+            self.store.snapshot(self.snapshot_path)
+        self.sink.close()
+
+
+class LivenessSink:
+    """
+    Feeds every batch to a LivenessTracker (arrival time), then hands it to
+    `sink`. tick() expires silent devices and, when the tracker's flush is
+    due, writes last_seen / status in bulk through `conn` (optional; share
+    the sink's connection and lock with SQLiteSink).
+    """
+
+    def __init__(self, sink, tracker, conn=None, lock=None):
+        self.sink = sink
+        self.tracker = tracker
+        self.conn = conn
+        self._lock = lock if lock is not None else threading.Lock()
+
+    def write(self, frames, fixes):
+        with self._lock:
+            self.tracker.apply_many(fixes)
+        self.sink.write(frames, fixes)
+
+    def tick(self, now=None, flush=None):
+        with self._lock:
+            events = self.tracker.expire(now)
+            if self.conn is not None and (flush or (flush is None and self.tracker.flush_due())):
+                self.tracker.flush(self.conn)
+        return events
+
+    def close(self):
+        self.tick(flush=True)
+        self.sink.close()
+
+
+class GPSGateway:
+    """
+    asyncio drop-in for the port 5001 listener in tcpServer.ts.
+    Socket reads and persistence are decoupled by a bounded queue:
+    - connection handlers frame + parse each read (one parse_many per read)
+      and put the batch on the queue; when the queue is full they stop reading,
+      which pushes back on the devices through TCP flow control
+    - `workers` consumers coalesce queued batches up to `batch_size` fixes and
+      hand them to the sink in a thread pool
+    - with a LatestPositionStore (`positions`), the HTTP endpoint also
+      answers GET /fleet?tenant=<id> with the tenant's devices as JSON, to
+      requests that carry `Authorization: Bearer <fleet_token>` (without a
+      token /fleet is refused)
+    """
+
+    def __init__(self, sink, host=HOST, port=PORT, queue_size=1000, workers=4, batch_size=500, positions=None,
+                 fleet_token=None):
+        self.sink = sink
+        self.positions = positions
+        self.fleet_token = fleet_token
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self.server = None
+        self.queue = None
+        self._tasks = []
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        self.stats = {
+            'connections': 0,
+            'active_connections': 0,
+            'frames': 0,
+            'fixes': 0,
+            'invalid': 0,
+            'logins': 0,
+            'stored': 0,
+            'sink_errors': 0,
+        }
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """
+        Stops accepting connections, drains the queue and stops the workers.
+        """
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.queue:
+            await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader, writer):
+        self.stats['connections'] += 1
+        self.stats['active_connections'] += 1
+        framer = GPSStreamFramer()
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                frames = framer.feed(chunk)
+                if frames:
+                    await self._process_frames(frames, writer)
+            frames = framer.flush()
+            if frames:
+                await self._process_frames(frames, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats['active_connections'] -= 1
+            writer.close()
+
+    async def _process_frames(self, frames, writer):
+        results, summary = UniversalGPSParser.parse_many(frames, record=True)
+        fixes = [result for result in results if result is not None]
+        self.stats['frames'] += len(frames)
+        self.stats['fixes'] += len(fixes)
+        self.stats['invalid'] += summary.get('invalid', 0)
+
+        # Specific Protocol Responses (Legacy/BP05), same as tcpServer.ts
+        logins = sum(1 for frame in frames if b'BP05' in frame)
+        if logins:
+            self.stats['logins'] += logins
+            writer.write(LOGIN_REPLY * logins)
+            await writer.drain()
+
+        # Blocks this reader (only) while persistence is behind
+        await self.queue.put((frames, fixes))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            frames, fixes = await self.queue.get()
+            taken = 1
+            frames = list(frames)
+            fixes = list(fixes)
+            while len(fixes) < self.batch_size and not self.queue.empty():
+                more_frames, more_fixes = self.queue.get_nowait()
+                frames.extend(more_frames)
+                fixes.extend(more_fixes)
+                taken += 1
+            try:
+                await loop.run_in_executor(self._executor, self.sink.write, frames, fixes)
+                self.stats['stored'] += len(fixes)
+            except Exception as e:
+                self.stats['sink_errors'] += 1
+                print(f"Error writing batch: {e}")
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    async def run_liveness(self, liveness, interval=1.0):
+        """
+        Calls liveness.tick() (a LivenessSink) every `interval` seconds in
+        the thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(self._executor, liveness.tick)
+
+    async def run_registrations(self, positions, connect, interval=60.0):
+        """
+        Re-reads device registrations (tenant, name) into the position store
+        every `interval` seconds, so devices added through POST /devices
+        appear in their tenant's fleet without a restart.
+        """
+        def refresh():
+            conn = connect()
+            try:
+                positions.load(conn, positions=False)
+            finally:
+                conn.close()
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(self._executor, refresh)
+
+    async def report(self, interval=5.0):
+        """
+        Prints connections / packets per second every `interval` seconds.
+        """
+        last_frames = self.stats['frames']
+        last_time = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            frames = self.stats['frames']
+            rate = (frames - last_frames) / (now - last_time)
+            print(f"[GATEWAY] conns={self.stats['active_connections']} "
+                  f"pkts/s={rate:,.0f} total={frames} fixes={self.stats['fixes']} "
+                  f"stored={self.stats['stored']} queue={self.queue.qsize()}/{self.queue_size}")
+            last_frames, last_time = frames, now
+
+    def metrics_text(self):
+        """
+        Gateway stats plus parser metrics (when enabled) in Prometheus text
+        format.
+        """
+        out = []
+        for name, value in self.stats.items():
+            kind = 'gauge' if name == 'active_connections' else 'counter'
+            suffix = '' if kind == 'gauge' else '_total'
+            out.append(render_counters(f"gps_gateway_{name}{suffix}", f"Gateway {name.replace('_', ' ')}.",
+                                       {None: value}, metric_type=kind))
+        if self.queue is not None:
+            out.append(render_counters('gps_gateway_queue_depth', "Read batches waiting for the sink.",
+                                       {None: self.queue.qsize()}, metric_type='gauge'))
+        metrics = UniversalGPSParser.metrics
+        if metrics is not None:
+            out.append(metrics.to_prometheus())
+        return ''.join(out)
+
+    def fleet_json(self, query):
+        """
+        Body of GET /fleet?tenant=<id>: the tenant's devices from the
+        position store (tenant ids are matched as int when numeric).
+        """
+        tenant_id = parse_qs(query).get('tenant', [None])[0]
+        if tenant_id is not None and tenant_id.isdigit():
+            tenant_id = int(tenant_id)
+        return json.dumps(self.positions.fleet(tenant_id))
+
+    def fleet_authorized(self, request):
+        """
+        True if the raw HTTP request head carries the shared fleet token.
+        """
+        if not self.fleet_token:
+            return False
+        for line in request.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'authorization':
+                scheme, _, token = value.strip().partition(b' ')
+                return scheme.lower() == b'bearer' and hmac.compare_digest(token.strip(), self.fleet_token.encode())
+        return False
+
+    async def _serve_metrics(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            target = request.split(b' ', 2)[1].decode('latin-1') if request.count(b' ') >= 2 else '/'
+            path, _, query = target.partition('?')
+            status = b'200 OK'
+            if path == '/fleet' and self.positions is not None:
+                if self.fleet_authorized(request):
+                    body, content_type = self.fleet_json(query).encode(), b'application/json'
+                else:
+                    status, body, content_type = b'401 Unauthorized', b'{"error": "unauthorized"}', b'application/json'
+            else:
+                body, content_type = self.metrics_text().encode(), b'text/plain; version=0.0.4'
+            writer.write(b'HTTP/1.1 %s\r\nContent-Type: %s\r\n'
+                         b'Content-Length: %d\r\nConnection: close\r\n\r\n' % (status, content_type, len(body)) + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_metrics(self, host=METRICS_HOST, port=9101):
+        """
+        Minimal HTTP endpoint: GET /fleet (see fleet_json) or, for any other
+        path, metrics_text() (Prometheus scrape target).
+        """
+        return await asyncio.start_server(self._serve_metrics, host, port)
+
+
+async def run(args):
+    workers = args.workers
+    if args.sink == 'sqlite':
+        sink = SQLiteSink(args.db, update_devices=args.offline_after is None)
+    elif args.sink == 'sqlite-batched':
+        SQLiteSink(args.db).close()  # create the schema
+        sink = WriterSink(PositionWriter(lambda: sqlite3.connect(args.db)))
+        # A single feeder keeps per-device order into the writer
+        workers = 1
+    else:
+        sink = MemorySink()
+    base = sink
+    positions = None
+    if args.positions_snapshot is not None:
+        positions = LatestPositionStore()
+        restored = positions.restore(args.positions_snapshot)
+        if args.sink != 'memory':
+            # Registrations always come from the database: the snapshot may
+            # predate devices added since
+            conn = sqlite3.connect(args.db)
+            positions.load(conn, positions=not restored)
+            conn.close()
+        sink = LatestPositionSink(sink, positions, args.positions_snapshot)
+    if args.dedupe_window is not None:
+        sink = DedupSink(sink, FixDeduplicator(window=args.dedupe_window))
+    liveness = None
+    if args.offline_after is not None or positions is not None:
+        # Outermost: duplicate and invalid fixes still prove the device is alive.
+        # Without --offline-after the tracker only drives the /fleet status
+        # and writes nothing (the sink keeps updating last_seen per packet)
+        timeout = args.offline_after if args.offline_after is not None else OFFLINE_AFTER
+        tracker = LivenessTracker(timeout=timeout, flush_interval=args.liveness_flush)
+        if args.offline_after is not None and isinstance(base, SQLiteSink):
+            tracker.load(base.conn)
+            liveness = LivenessSink(sink, tracker, base.conn, base._lock)
+        else:
+            if args.sink != 'memory':
+                conn = sqlite3.connect(args.db)
+                tracker.load(conn)
+                conn.close()
+            liveness = LivenessSink(sink, tracker)
+        if positions is not None:
+            for imei, status in tracker.status.items():
+                positions.set_status(imei, status)
+            tracker.listeners.append(lambda event: positions.set_status(event['imei'], event['status']))
+        sink = liveness
+    gateway = GPSGateway(sink, args.host, args.port, args.queue_size, workers, args.batch_size, positions,
+                         args.fleet_token)
+    await gateway.start()
+    print(f"GPS Gateway listening on {args.host}:{gateway.port} (sink: {args.sink})")
+    if liveness is not None:
+        gateway._tasks.append(asyncio.create_task(gateway.run_liveness(liveness)))
+    if positions is not None and args.sink != 'memory':
+        gateway._tasks.append(asyncio.create_task(
+            gateway.run_registrations(positions, lambda: sqlite3.connect(args.db), args.positions_refresh)))
+    if args.metrics_port is not None:
+        UniversalGPSParser.enable_metrics(ParserMetrics(sample_every=args.sample_every))
+        await gateway.start_metrics(args.metrics_host, args.metrics_port)
+        print(f"Metrics on http://{args.metrics_host}:{args.metrics_port}/metrics")
+        if positions is not None and not args.fleet_token:
+            print("warning: no --fleet-token / POSITION_STORE_TOKEN, /fleet requests are refused")
+    try:
+        await gateway.report(args.report_interval)
+    finally:
+        await gateway.stop()
+        sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio GPS ingestion gateway (port 5001 listener)")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--sink', choices=['memory', 'sqlite', 'sqlite-batched'], default='memory')
+    parser.add_argument('--db', default='gateway.sqlite3', help="SQLite file for --sink sqlite")
+    parser.add_argument('--queue-size', type=int, default=1000, help="Max pending read batches")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent sink writers")
+    parser.add_argument('--batch-size', type=int, default=500, help="Max fixes per sink write")
+    parser.add_argument('--dedupe-window', type=float,
+                        help="Drop duplicate / invalid fixes and reorder late ones within this many seconds")
+    parser.add_argument('--positions-snapshot',
+                        help="Keep the latest position per device in memory (served on --metrics-port as "
+                             "/fleet?tenant=ID), restored from / saved to this file")
+    parser.add_argument('--positions-refresh', type=float, default=60.0,
+                        help="Seconds between device registration refreshes (with --positions-snapshot)")
+    parser.add_argument('--offline-after', type=float,
+                        help="Track liveness in memory: mark devices offline after this many silent seconds "
+                             f"and write last_seen in bulk instead of per packet (the /fleet status uses "
+                             f"{OFFLINE_AFTER:.0f}s when omitted)")
+    parser.add_argument('--liveness-flush', type=float, default=30.0,
+                        help="Seconds between bulk last_seen / status writes (with --offline-after)")
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    parser.add_argument('--metrics-port', type=int,
+                        help="Enable parser metrics and serve them (Prometheus text) on this port")
+    parser.add_argument('--metrics-host', default=METRICS_HOST,
+                        help="Address of the metrics / /fleet endpoint (loopback by default)")
+    parser.add_argument('--fleet-token', default=os.environ.get('POSITION_STORE_TOKEN'),
+                        help="Shared token /fleet requests must send as 'Authorization: Bearer <token>' "
+                             "(default: $POSITION_STORE_TOKEN)")
+    parser.add_argument('--sample-every', type=int, default=100,
+                        help="Keep one rejected payload in this many per reason (with --metrics-port)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import re
+
+
+# Frame start -> terminator byte (terminator is part of the frame)
+# *HQ,...#   imei:...;   ##,imei:...;   (...BP05)   123456789012345;
+_FRAME_STARTS = (
+    (b'*HQ,', ord('#')),
+    (b'imei:', ord(';')),
+    (b'##,', ord(';')),
+    (b'(', ord(')')),
+)
+_DIGITS = b'0123456789'
+_SKIP = b' \t\r\n;\x00'
+
+# Where a frame may begin (used to resync after garbage)
+_START_RE = re.compile(rb'\*HQ,|imei:|##,|\(|\d{15}')
+# Start of another frame inside an unterminated one (devices that omit ';')
+_BOUNDARY_RE = re.compile(rb'\*HQ,|imei:|##,|\(|[\r\n]')
+
+_PENDING = -1
+_MAX_START_LEN = 14
+
+
+def peek_imei(payload):
+    """
+    IMEI of a raw payload without parsing it (the replay shard key, and
+    raw_logs.device_id when it is all digits). Unknown payloads return
+    whatever leads the message, which is still a stable key.
+    """
+    payload = payload.strip()
+    if payload.startswith('##,imei:'):
+        start = 8
+    elif payload.startswith('imei:'):
+        start = 5
+    elif payload.startswith('*HQ,'):
+        start = 4
+    elif payload.startswith('('):
+        start = 1
+    else:
+        return payload.rstrip(';')[:15]
+    end = payload.find(',', start)
+    return payload[start:end] if end != -1 else payload[start:]
+
+
+class GPSStreamFramer:
+    """
+    Incremental framer for one TCP connection.
+    TCP can merge several tracker frames into one chunk or split one frame
+    across chunks; feed() accepts arbitrary chunks and returns the complete
+    frames found so far (as bytes, ready for UniversalGPSParser.parse_many).
+
+    Example:
+        framer = GPSStreamFramer()
+        results, summary = UniversalGPSParser.parse_many(framer.feed(chunk))
+
+    The pending buffer never holds more than max_frame_size bytes: an
+    unterminated frame that grows past it is discarded (garbage stream) and
+    the framer resyncs on the next frame start.
+    """
+
+    def __init__(self, max_frame_size=2048):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self.frames = 0
+        self.discarded_bytes = 0
+
+    def feed(self, data):
+        """
+        Appends a chunk and returns the list of complete frames it completed.
+        """
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = 0
+        size = len(buf)
+
+        while pos < size:
+            if buf[pos] in _SKIP:
+                pos += 1
+                continue
+
+            terminator, prefix_len = self._frame_kind(buf, pos)
+            if terminator is None:
+                # Garbage: skip to the next possible frame start
+                match = _START_RE.search(buf, pos + 1)
+                # Without a match, keep a tail that may be a split frame start
+                resume = match.start() if match else max(pos + 1, size - _MAX_START_LEN)
+                self.discarded_bytes += resume - pos
+                pos = resume
+                if not match:
+                    break
+                continue
+            if terminator == _PENDING:
+                break
+
+            end = self._frame_end(buf, pos, prefix_len, terminator, size)
+            if end is None:
+                if size - pos > self.max_frame_size:
+                    match = _START_RE.search(buf, pos + 1)
+                    resume = match.start() if match else size
+                    self.discarded_bytes += resume - pos
+                    pos = resume
+                    continue
+                break
+
+            frame = bytes(buf[pos:end]).rstrip()
+            if frame:
+                frames.append(frame)
+            pos = end
+
+        del buf[:pos]
+        self.frames += len(frames)
+        return frames
+
+    def flush(self):
+        """
+        Returns whatever is left in the buffer as a final frame (connection
+        closed). Devices that omit the terminator still get parsed this way.
+        """
+        frame = bytes(self.buffer).strip(_SKIP)
+        self.buffer.clear()
+        if not frame:
+            return []
+        self.frames += 1
+        return [frame]
+
+    def reset(self):
+        self.buffer.clear()
+
+    @staticmethod
+    def _frame_kind(buf, pos):
+        """
+        (terminator, prefix_len) for a frame starting at pos,
+        (None, 0) if no frame starts there, (_PENDING, 0) if more bytes are needed.
+        """
+        first = buf[pos]
+        if first in _DIGITS:
+            # Simple heartbeat: 15 digits
+            head = bytes(buf[pos:pos + 15])
+            if not head.isdigit():
+                return None, 0
+            if len(head) < 15:
+                return _PENDING, 0
+            return ord(';'), 15
+
+        for prefix, terminator in _FRAME_STARTS:
+            if first != prefix[0]:
+                continue
+            head = bytes(buf[pos:pos + len(prefix)])
+            if head == prefix:
+                return terminator, len(prefix) if prefix != b'##,' else len(b'##,imei:')
+            if prefix.startswith(head):
+                return _PENDING, 0
+        return None, 0
+
+    @staticmethod
+    def _frame_end(buf, pos, prefix_len, terminator, size):
+        """
+        Offset just past the frame starting at pos, or None if it is incomplete.
+        A frame ends at its terminator, at a line break, or where the next
+        frame starts (for devices that omit the terminator).
+        """
+        end = buf.find(terminator, pos + 1)
+        end = end + 1 if end >= 0 else None
+
+        search_from = min(pos + prefix_len, size)
+        boundary = _BOUNDARY_RE.search(buf, search_from, end if end is not None else size)
+        if boundary:
+            return boundary.start()
+        return end
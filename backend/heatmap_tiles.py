@@ -0,0 +1,321 @@
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy only speeds up rebuild()
+    np = None
+
+from universal_gps_parser import GPSFix, epoch_to_timestamp
+
+# Web Mercator latitude limit of slippy-map tiles
+MAX_LATITUDE = 85.0511287798
+
+
+def _mercator(lat, lng):
+    """
+    (lat, lng) -> position in the world square, both in [0, 1).
+    """
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    fx = (lng + 180.0) / 360.0
+    s = math.sin(math.radians(lat))
+    fy = 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return min(max(fx, 0.0), 1.0 - 1e-12), min(max(fy, 0.0), 1.0 - 1e-12)
+
+
+def tile_of(lat, lng, zoom):
+    """
+    Slippy-map tile (x, y) containing the point at `zoom`.
+    """
+    fx, fy = _mercator(lat, lng)
+    n = 1 << zoom
+    return int(fx * n), int(fy * n)
+
+
+def tile_bounds(zoom, x, y):
+    """
+    (south, west, north, east) of tile z/x/y in degrees.
+    """
+    n = 1 << zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def day_of(epoch):
+    return epoch_to_timestamp(epoch)[:10]
+
+
+class HeatmapTiles:
+    """
+    Per-tenant, per-day fix counts and dwell time over slippy-map tiles.
+    - every stored zoom z keeps a grid of 2**cell_bits x 2**cell_bits cells
+      per tile (cells are tiles of zoom z + cell_bits), keyed
+      (tenant_id, day, z) -> {(tile_x, tile_y): {(cell_x, cell_y): [count, dwell]}},
+      so a heatmap tile is one dict lookup
+    - count is the number of valid fixes in the cell; dwell is the time (s)
+      between a device's consecutive fixes, attributed to the earlier fix's
+      cell when the gap is at most `max_gap`
+    - add() updates incrementally on ingest; a fix older than the device's
+      last one is counted but adds no dwell. Of two fixes with the same
+      timestamp the one with the larger (lat, lng) continues the dwell, so
+      the result does not depend on their arrival order. rebuild()
+      recomputes days from stored history in one vectorized pass (NumPy,
+      when available), ordering fixes the same way
+    - a device's tenant comes from `device_tenants` (IMEI -> tenant_id),
+      as in GeofenceEngine
+    """
+
+    def __init__(self, zooms=(6, 9, 12, 15), cell_bits=5, max_gap=300.0, device_tenants=None):
+        if max(zooms) + cell_bits > 24:
+            raise ValueError(f"Cell zoom {max(zooms) + cell_bits} too deep (max zoom + cell_bits <= 24)")
+        self.zooms = tuple(sorted(zooms))
+        self.cell_bits = cell_bits
+        self.max_gap = max_gap
+        self.device_tenants = device_tenants if device_tenants is not None else {}
+        self.tiles = {}
+        self.last = {}  # imei -> (epoch, lat, lng, mercator x, mercator y)
+        self._day_names = {}
+        self.stats = {'fixes': 0, 'skipped': 0, 'late': 0}
+
+    def load_devices(self, conn):
+        """
+        IMEI -> tenant mapping from the devices table.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT device_id, tenant_id FROM devices')
+        for imei, tenant_id in cursor.fetchall():
+            self.device_tenants[str(imei)] = tenant_id
+        return len(self.device_tenants)
+
+    def _day(self, epoch):
+        key = int(epoch // 86400)
+        name = self._day_names.get(key)
+        if name is None:
+            name = self._day_names[key] = day_of(key * 86400)
+        return name
+
+    def _add(self, tenant_id, day, fx, fy, count, dwell):
+        bits = self.cell_bits
+        tiles = self.tiles
+        for zoom in self.zooms:
+            n = 1 << (zoom + bits)
+            cx, cy = int(fx * n), int(fy * n)
+            key = (tenant_id, day, zoom)
+            grid = tiles.get(key)
+            if grid is None:
+                grid = tiles[key] = {}
+            tile = grid.get((cx >> bits, cy >> bits))
+            if tile is None:
+                tile = grid[(cx >> bits, cy >> bits)] = {}
+            cell = tile.get((cx, cy))
+            if cell is None:
+                tile[(cx, cy)] = [count, dwell]
+            else:
+                cell[0] += count
+                cell[1] += dwell
+
+    @staticmethod
+    def _usable(fix):
+        return (fix is not None and fix.type == 'location_update' and fix.gps_valid
+                and fix.latitude is not None and fix.longitude is not None
+                and not (fix.latitude == 0 and fix.longitude == 0))
+
+    def add(self, fix, now=None):
+        """
+        Adds one fix (GPSFix or parse_message() dict). Returns True if it was
+        counted.
+        """
+        fix = GPSFix.from_result(fix)
+        if not self._usable(fix):
+            self.stats['skipped'] += 1
+            return False
+        self.stats['fixes'] += 1
+
+        imei = fix.imei
+        tenant_id = self.device_tenants.get(imei)
+        epoch = fix.timestamp if fix.timestamp is not None else (time.time() if now is None else now)
+        fx, fy = _mercator(fix.latitude, fix.longitude)
+        previous = self.last.get(imei)
+        if previous is not None and epoch < previous[0]:
+            self.stats['late'] += 1
+            self._add(tenant_id, self._day(epoch), fx, fy, 1, 0.0)
+            return True
+        if previous is not None and epoch == previous[0] and (fix.latitude, fix.longitude) < previous[1:3]:
+            self._add(tenant_id, self._day(epoch), fx, fy, 1, 0.0)
+            return True
+
+        if previous is not None:
+            gap = epoch - previous[0]
+            if 0 < gap <= self.max_gap:
+                self._add(tenant_id, self._day(previous[0]), previous[3], previous[4], 0, gap)
+        self._add(tenant_id, self._day(epoch), fx, fy, 1, 0.0)
+        self.last[imei] = (epoch, fix.latitude, fix.longitude, fx, fy)
+        return True
+
+    def add_many(self, fixes, now=None):
+        add = self.add
+        return sum(1 for fix in fixes if add(fix, now))
+
+    def _clear(self, keys):
+        for key in keys:
+            for zoom in self.zooms:
+                self.tiles.pop(key + (zoom,), None)
+
+    def rebuild(self, fixes):
+        """
+        Recomputes every (tenant, day) the history `fixes` touch, replacing
+        what was there, and leaves each device's last fix as the starting
+        point for add(). Returns the number of fixes counted.
+        """
+        imeis, epochs, lats, lngs = [], [], [], []
+        for fix in fixes:
+            fix = GPSFix.from_result(fix)
+            if self._usable(fix) and fix.timestamp is not None:
+                imeis.append(fix.imei)
+                epochs.append(fix.timestamp)
+                lats.append(fix.latitude)
+                lngs.append(fix.longitude)
+            else:
+                self.stats['skipped'] += 1
+        if not imeis:
+            return 0
+        tenants = self.device_tenants
+        for imei in set(imeis):
+            self.last.pop(imei, None)
+
+        if np is None:
+            order = sorted(range(len(imeis)), key=lambda i: (imeis[i], epochs[i], lats[i], lngs[i], i))
+            self._clear({(tenants.get(imeis[i]), self._day(epochs[i])) for i in order})
+            for i in order:
+                self.add(GPSFix('location_update', None, imeis[i], epochs[i], lats[i], lngs[i],
+                                flags=GPSFix.FLAG_GPS_VALID))
+            return len(order)
+
+        imei_codes = {}
+        tenant_codes = {}
+        devices = np.array([imei_codes.setdefault(imei, len(imei_codes)) for imei in imeis], dtype=np.int64)
+        codes = np.array([tenant_codes.setdefault(tenants.get(imei), len(tenant_codes)) for imei in imeis],
+                         dtype=np.int64)
+        tenant_ids = list(tenant_codes)
+        epoch_values = np.array(epochs, dtype=np.float64)
+        lat_values = np.array(lats, dtype=np.float64)
+        lng_values = np.array(lngs, dtype=np.float64)
+        # Same-second fixes in add()'s order: (lat, lng), then input position
+        order = np.lexsort((np.arange(len(imeis)), lng_values, lat_values, epoch_values, devices))
+        devices, codes, epoch_values = devices[order], codes[order], epoch_values[order]
+        lat_values = np.clip(lat_values[order], -MAX_LATITUDE, MAX_LATITUDE)
+        lng_values = lng_values[order]
+
+        # Dwell: gap to the device's next fix (rows are sorted by device, time)
+        gaps = np.zeros(len(order))
+        gaps[:-1] = np.diff(epoch_values)
+        same_device = np.zeros(len(order), dtype=bool)
+        same_device[:-1] = np.diff(devices) == 0
+        dwell = np.where(same_device & (gaps > 0) & (gaps <= self.max_gap), gaps, 0.0)
+
+        days = (epoch_values // 86400).astype(np.int64)
+        day_list, days = np.unique(days, return_inverse=True)
+        days = days.reshape(-1)
+        day_names = [self._day(day * 86400) for day in day_list.tolist()]
+        # (tenant, day) packed into one int64 so grouping is a 1-D unique
+        slices = codes * len(day_names) + days
+        self._clear({(tenant_ids[key // len(day_names)], day_names[key % len(day_names)])
+                     for key in np.unique(slices).tolist()})
+
+        fx = np.clip((lng_values + 180.0) / 360.0, 0.0, 1.0 - 1e-12)
+        s = np.sin(np.radians(lat_values))
+        fy = np.clip(0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi), 0.0, 1.0 - 1e-12)
+
+        bits = self.cell_bits
+        for zoom in self.zooms:
+            n = 1 << (zoom + bits)
+            # (slice, cell_x, cell_y) packed into one int64 (zoom + cell_bits <= 24)
+            keys = (slices * n + (fx * n).astype(np.int64)) * n + (fy * n).astype(np.int64)
+            unique, inverse = np.unique(keys, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            counts = np.bincount(inverse, minlength=len(unique))
+            dwells = np.bincount(inverse, weights=dwell, minlength=len(unique))
+            grid = tile = None
+            grid_key = tile_key = None
+            for key, count, spent in zip(unique.tolist(), counts.tolist(), dwells.tolist()):
+                key, cy = divmod(key, n)
+                key, cx = divmod(key, n)
+                # keys are sorted, so consecutive cells share grid / tile
+                if key != grid_key:
+                    grid_key = key
+                    code, day = divmod(key, len(day_names))
+                    grid = self.tiles.setdefault((tenant_ids[code], day_names[day], zoom), {})
+                    tile_key = None
+                if (cx >> bits, cy >> bits) != tile_key:
+                    tile_key = (cx >> bits, cy >> bits)
+                    tile = grid.setdefault(tile_key, {})
+                tile[(cx, cy)] = [count, spent]
+
+        # Last fix per device (last row of each device run) continues in add()
+        ends = np.flatnonzero(~same_device).tolist()
+        for i in order[ends].tolist():
+            self.last[imeis[i]] = (epochs[i], lats[i], lngs[i]) + _mercator(lats[i], lngs[i])
+        self.stats['fixes'] += len(order)
+        return len(order)
+
+    def tile(self, tenant_id, days, zoom, x, y):
+        """
+        Heatmap tile z/x/y of a tenant over one day ('YYYY-MM-DD') or a list
+        of days: {'zoom': cell zoom, 'cells': [[cell_x, cell_y, count, dwell], ...]}.
+        Zooms that are not stored are cut from the nearest stored zoom below
+        (coarser cells); below the smallest stored zoom there is no data.
+        """
+        stored = [z for z in self.zooms if z <= zoom]
+        if not stored:
+            return {'zoom': None, 'cells': []}
+        base = stored[-1]
+        cell_zoom = base + self.cell_bits
+        shift = zoom - base
+        parent = (x >> shift, y >> shift)
+        if isinstance(days, str):
+            days = [days]
+
+        if len(days) == 1 and shift == 0:
+            grid = self.tiles.get((tenant_id, days[0], base))
+            cells = grid.get(parent) if grid else None
+            return {'zoom': cell_zoom,
+                    'cells': [[cx, cy, count, spent] for (cx, cy), (count, spent) in cells.items()] if cells else []}
+
+        merged = {}
+        for day in days:
+            grid = self.tiles.get((tenant_id, day, base))
+            cells = grid.get(parent) if grid else None
+            if not cells:
+                continue
+            for (cx, cy), (count, spent) in cells.items():
+                if cell_zoom >= zoom:
+                    depth = cell_zoom - zoom
+                    if (cx >> depth, cy >> depth) != (x, y):
+                        continue
+                elif (x >> (zoom - cell_zoom), y >> (zoom - cell_zoom)) != (cx, cy):
+                    continue
+                cell = merged.get((cx, cy))
+                if cell is None:
+                    merged[(cx, cy)] = [count, spent]
+                else:
+                    cell[0] += count
+                    cell[1] += spent
+        return {'zoom': cell_zoom, 'cells': [[cx, cy, count, spent] for (cx, cy), (count, spent) in merged.items()]}
+
+    def days(self, tenant_id):
+        return sorted({day for tenant, day, _ in self.tiles if tenant == tenant_id})
+
+    def expire(self, before):
+        """
+        Drops every day older than `before` ('YYYY-MM-DD' or epoch). Returns
+        the number of (tenant, day, zoom) grids removed.
+        """
+        if not isinstance(before, str):
+            before = day_of(before)
+        old = [key for key in self.tiles if key[1] < before]
+        for key in old:
+            del self.tiles[key]
+        return len(old)
@@ -0,0 +1,312 @@
+import os
+import sys
+import time
+import pickle
+import threading
+
+from device_state_engine import classify, PARKED
+from universal_gps_parser import GPSFix, epoch_to_timestamp, _timestamp_to_epoch
+
+SNAPSHOT_VERSION = 1
+
+
+def _iso(epoch):
+    """
+    Epoch seconds -> ISO-8601 UTC ('YYYY-MM-DDTHH:MM:SSZ'), as the SQL path
+    of GET /devices returns and new Date() reads unambiguously.
+    """
+    timestamp = epoch_to_timestamp(epoch)
+    return f"{timestamp[:10]}T{timestamp[11:]}Z" if timestamp else None
+
+
+class LatestPosition:
+    """
+    Most recent fix and state of one device (one row of GET /devices).
+    Timestamps are epoch seconds.
+    """
+
+    __slots__ = ('imei', 'tenant_id', 'name', 'timestamp', 'lat', 'lng', 'speed', 'course', 'flags', 'alarm',
+                 'state', 'state_start', 'last_seen', 'id', 'status')
+
+    def __init__(self, imei, tenant_id=None, name=None, timestamp=None, lat=None, lng=None, speed=0.0,
+                 course=0.0, flags=0, alarm=None, state=None, state_start=None, last_seen=None, id=None,
+                 status='offline'):
+        self.imei = imei
+        self.tenant_id = tenant_id
+        self.name = name
+        self.timestamp = timestamp
+        self.lat = lat
+        self.lng = lng
+        self.speed = speed
+        self.course = course
+        self.flags = flags
+        self.alarm = alarm
+        self.state = state
+        self.state_start = state_start
+        self.last_seen = last_seen
+        self.id = id  # devices.id
+        self.status = status
+
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in LatestPosition.__slots__)
+
+    def to_dict(self):
+        """
+        Same keys (and ISO-8601 UTC timestamps) as the GET /devices rows.
+        """
+        return {
+            'id': self.id,
+            'device_id': self.imei,
+            'name': self.name,
+            'tenant_id': self.tenant_id,
+            'lat': self.lat,
+            'lng': self.lng,
+            'speed': self.speed,
+            'course': self.course,
+            'last_update': _iso(self.timestamp),
+            'current_state': self.state,
+            'state_start_time': _iso(self.state_start),
+            'last_seen': _iso(self.last_seen),
+            'status': self.status,
+            'internet_status': self.status == 'online',
+            'last_alarm': self.alarm,
+            'gps_status': bool(self.flags & GPSFix.FLAG_GPS_VALID),
+            'acc_status': bool(self.flags & GPSFix.FLAG_ACC),
+        }
+
+    def __repr__(self):
+        return f"LatestPosition(imei={self.imei!r}, tenant={self.tenant_id!r}, lat={self.lat}, lng={self.lng})"
+
+
+class LatestPositionStore:
+    """
+    Latest position per IMEI, written by the ingest path, read by the fleet
+    list instead of one ORDER BY timestamp DESC LIMIT 1 subquery per device.
+    - update() keeps the newest fix per device; older (late) fixes and
+      heartbeats only refresh last_seen
+    - rows are indexed by tenant, so fleet(tenant_id) is one dict lookup
+    - snapshot() / restore() pickle the rows (atomic replace) for warm
+      restarts; load(conn) seeds the store from the database instead, and
+      load(conn, positions=False) only refreshes registrations (tenant,
+      name, id), so devices added after startup show up in their fleet;
+      both drop registered devices that were deleted from the table
+    - update() marks a device online; only set_status() (a LivenessTracker
+      listener) marks it offline again
+
+    Writes and fleet reads take one lock, so a reader never sees a row
+    half updated.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.tenants = {}  # tenant_id -> {imei: LatestPosition}
+        self._lock = threading.Lock()
+        self.stats = {'fixes': 0, 'heartbeats': 0, 'stale': 0, 'unknown_devices': 0}
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, imei):
+        return self.devices.get(imei)
+
+    def _row(self, imei):
+        row = self.devices.get(imei)
+        if row is None:
+            self.stats['unknown_devices'] += 1
+            row = self.devices[imei] = LatestPosition(imei)
+            self.tenants.setdefault(None, {})[imei] = row
+        return row
+
+    def register(self, imei, tenant_id, name=None):
+        """
+        Adds a device or moves it to another tenant.
+        """
+        imei = sys.intern(str(imei))
+        with self._lock:
+            row = self.devices.get(imei)
+            if row is None:
+                row = self.devices[imei] = LatestPosition(imei, tenant_id, name)
+            else:
+                fleet = self.tenants.get(row.tenant_id)
+                if fleet is not None:
+                    fleet.pop(imei, None)
+                    if not fleet:
+                        del self.tenants[row.tenant_id]
+                row.tenant_id = tenant_id
+                if name is not None:
+                    row.name = name
+            self.tenants.setdefault(tenant_id, {})[imei] = row
+        return row
+
+    def remove(self, imei):
+        with self._lock:
+            row = self.devices.pop(imei, None)
+            if row is not None:
+                fleet = self.tenants.get(row.tenant_id)
+                if fleet is not None:
+                    fleet.pop(imei, None)
+                    if not fleet:
+                        del self.tenants[row.tenant_id]
+        return row
+
+    def set_status(self, imei, status):
+        """
+        Online / offline from the liveness tracker (its listener). A device
+        heard from for the first time gets its row here.
+        """
+        with self._lock:
+            self._row(imei).status = status
+
+    def update(self, fix, now=None):
+        """
+        Applies one fix (GPSFix or parse_message() dict). Returns True if the
+        device's position changed.
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None:
+            return False
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._update(fix, now)
+
+    def update_many(self, fixes, now=None):
+        """
+        Applies a batch under one lock; returns the number of positions
+        changed.
+        """
+        now = time.time() if now is None else now
+        from_result = GPSFix.from_result
+        changed = 0
+        with self._lock:
+            for fix in fixes:
+                fix = from_result(fix)
+                if fix is not None and self._update(fix, now):
+                    changed += 1
+        return changed
+
+    def _update(self, fix, now):
+        row = self._row(fix.imei)
+        seen = fix.timestamp if fix.timestamp is not None else now
+        row.status = 'online'
+        if row.last_seen is None or seen > row.last_seen:
+            row.last_seen = seen
+
+        if fix.type != 'location_update' or fix.latitude is None or fix.longitude is None:
+            self.stats['heartbeats'] += 1
+            return False
+        if row.timestamp is not None and seen < row.timestamp:
+            self.stats['stale'] += 1
+            return False
+
+        self.stats['fixes'] += 1
+        state = classify(fix)
+        if state != row.state:
+            row.state = state
+            row.state_start = seen
+        row.timestamp = seen
+        row.lat = fix.latitude
+        row.lng = fix.longitude
+        row.speed = fix.speed or 0.0
+        row.course = fix.course or 0.0
+        row.flags = fix.flags
+        if fix.alarm:
+            row.alarm = fix.alarm
+        return True
+
+    def fleet(self, tenant_id, as_dicts=True):
+        """
+        Every device of a tenant, most recently seen first (the GET /devices
+        order).
+        """
+        with self._lock:
+            rows = list(self.tenants.get(tenant_id, {}).values())
+            rows.sort(key=lambda row: row.last_seen or 0, reverse=True)
+            if as_dicts:
+                return [row.to_dict() for row in rows]
+        return rows
+
+    def load(self, conn, positions=True):
+        """
+        Seeds devices (tenant, name, state) and their latest stored position
+        from the database: one grouped query instead of one per device.
+        With positions=False, devices already in the store only get their
+        registration (tenant, name, id) refreshed, e.g. after restore() or
+        periodically, so newer in-memory positions are kept. Devices with a
+        tenant that are no longer in the table are removed; devices that
+        reported without being registered (tenant None) are kept.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, device_id, tenant_id, name, status, current_state, state_start_time, last_alarm, '
+                       'last_seen FROM devices')
+        devices = cursor.fetchall()
+        latest = {}
+        if positions:
+            cursor.execute('SELECT p.device_id, p.lat, p.lng, p.speed, p.course, p.gps_status, p.acc_status, '
+                           'p.timestamp FROM positions p JOIN (SELECT device_id, MAX(timestamp) AS latest '
+                           'FROM positions GROUP BY device_id) l '
+                           'ON p.device_id = l.device_id AND p.timestamp = l.latest')
+            latest = {str(row[0]): row[1:] for row in cursor.fetchall()}
+
+        for row_id, imei, tenant_id, name, status, state, state_start, alarm, last_seen in devices:
+            known = str(imei) in self.devices
+            row = self.register(imei, tenant_id, name)
+            with self._lock:
+                row.id = row_id
+                if known and not positions:
+                    continue
+                row.status = status or 'offline'
+                row.state = state or PARKED
+                row.state_start = _timestamp_to_epoch(str(state_start)) if state_start else None
+                row.alarm = alarm
+                row.last_seen = _timestamp_to_epoch(str(last_seen)) if last_seen else None
+                position = latest.get(row.imei)
+                if position is not None:
+                    lat, lng, speed, course, gps_status, acc_status, timestamp = position
+                    row.lat, row.lng, row.speed, row.course = lat, lng, speed or 0.0, course or 0.0
+                    row.flags = (GPSFix.FLAG_GPS_VALID if gps_status else 0) | (GPSFix.FLAG_ACC if acc_status else 0)
+                    row.timestamp = _timestamp_to_epoch(str(timestamp)) if timestamp else None
+
+        registered = {str(device[1]) for device in devices}
+        with self._lock:
+            deleted = [imei for imei, row in self.devices.items()
+                       if row.tenant_id is not None and imei not in registered]
+        for imei in deleted:
+            self.remove(imei)
+        return len(devices)
+
+    def snapshot(self, path):
+        """
+        Writes every row to `path` (pickle of plain tuples, replaced
+        atomically). Returns the number of rows.
+        """
+        with self._lock:
+            rows = [row.to_tuple() for row in self.devices.values()]
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': SNAPSHOT_VERSION, 'saved_at': time.time(), 'rows': rows}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return len(rows)
+
+    def restore(self, path):
+        """
+        Loads a snapshot() file (replacing the current rows). Returns the
+        number of rows, or 0 if the file does not exist.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {path} has version {data.get('version')}, expected {SNAPSHOT_VERSION}")
+        devices = {}
+        tenants = {}
+        for values in data['rows']:
+            row = LatestPosition(*values)
+            row.imei = sys.intern(row.imei)
+            devices[row.imei] = row
+            tenants.setdefault(row.tenant_id, {})[row.imei] = row
+        with self._lock:
+            self.devices = devices
+            self.tenants = tenants
+        return len(devices)
@@ -0,0 +1,220 @@
+import sys
+import time
+import heapq
+import itertools
+
+from universal_gps_parser import GPSFix, epoch_to_timestamp, _timestamp_to_epoch
+
+ONLINE = 'online'
+OFFLINE = 'offline'
+
+
+class LivenessTracker:
+    """
+    Online / offline tracking keyed by IMEI, in place of one
+    UPDATE devices SET last_seen per packet.
+    - apply() records the arrival time of any message (fix or heartbeat) in
+      memory; flush() writes the last_seen of every device heard from since
+      the previous flush with one executemany
+    - a device goes offline `timeout` seconds after it was last heard from.
+      Deadlines live in a heap with at most one entry per online device: a
+      packet only moves the device's last_seen, and an entry popped early is
+      pushed back with the real deadline, so expire() costs O(log n) per
+      device checked and nothing per heartbeat. Each entry carries the
+      generation it was armed with; forget() disarms the device, so an entry
+      left behind by a forgotten (and re-added) device is skipped
+    - offline -> online and online -> offline changes are returned as events
+      ({'imei', 'previous', 'status', 'since'}) and passed to `listeners`
+
+    Arrival time (`now`) is used rather than the device timestamp, so
+    devices replaying a backlog count as online. Single writer: apply(),
+    expire() and flush() are meant to be called from one thread (or under
+    one lock).
+    """
+
+    def __init__(self, timeout=300.0, flush_interval=30.0, placeholder='?'):
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.placeholder = placeholder
+        self.last_seen = {}
+        self.status = {}
+        self.listeners = []
+
+        self._deadlines = []  # heap of (deadline, generation, imei), one live entry per online device
+        self._armed = {}  # imei -> generation of its live heap entry
+        self._generation = itertools.count()
+        self._seen = set()  # last_seen to write
+        self._changed = set()  # status to write
+        self._last_flush = time.monotonic()
+
+        self.stats = {
+            'messages': 0,
+            'online': 0,
+            'offline': 0,
+            'rows_persisted': 0,
+        }
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def is_online(self, imei):
+        return self.status.get(imei) == ONLINE
+
+    def online_count(self):
+        return len(self._armed)
+
+    def load(self, conn, now=None):
+        """
+        Warm start from the devices table. Devices stored as online get a
+        deadline from their last_seen, so stale ones go offline on the next
+        expire() instead of staying online forever.
+        """
+        now = time.time() if now is None else now
+        cursor = conn.cursor()
+        cursor.execute('SELECT device_id, status, last_seen FROM devices')
+        for imei, status, last_seen in cursor.fetchall():
+            imei = sys.intern(str(imei))
+            seen = self._to_epoch(last_seen)
+            if seen is not None:
+                self.last_seen[imei] = seen
+            if status == ONLINE:
+                self.status[imei] = ONLINE
+                self._arm(imei, (seen if seen is not None else now) + self.timeout)
+            else:
+                self.status[imei] = OFFLINE
+        return len(self.status)
+
+    @staticmethod
+    def _to_epoch(value):
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        if hasattr(value, 'strftime'):
+            value = value.strftime("%Y-%m-%d %H:%M:%S")
+        return _timestamp_to_epoch(str(value)[:19])
+
+    def _arm(self, imei, deadline):
+        generation = self._armed[imei] = next(self._generation)
+        heapq.heappush(self._deadlines, (deadline, generation, imei))
+
+    def _emit(self, imei, previous, status, since):
+        self._changed.add(imei)
+        self.stats[status] += 1
+        event = {'imei': imei, 'previous': previous, 'status': status, 'since': since}
+        for listener in self.listeners:
+            listener(event)
+        return event
+
+    def touch(self, imei, now=None):
+        """
+        Records a message from `imei`. Returns an online event if the device
+        was offline (or unknown), else None.
+        """
+        now = time.time() if now is None else now
+        self.stats['messages'] += 1
+        previous_seen = self.last_seen.get(imei)
+        if previous_seen is None or now > previous_seen:
+            self.last_seen[imei] = now
+        self._seen.add(imei)
+
+        previous = self.status.get(imei)
+        if previous == ONLINE:
+            return None
+        self.status[imei] = ONLINE
+        self._arm(imei, self.last_seen[imei] + self.timeout)
+        return self._emit(imei, previous, ONLINE, now)
+
+    def apply(self, fix, now=None):
+        """
+        Applies one parsed message (GPSFix or parse_message() dict).
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None:
+            return None
+        return self.touch(fix.imei, now)
+
+    def apply_many(self, fixes, now=None):
+        """
+        Applies a batch received at `now`; returns the online events.
+        """
+        now = time.time() if now is None else now
+        events = []
+        from_result = GPSFix.from_result
+        for fix in fixes:
+            fix = from_result(fix)
+            if fix is not None:
+                event = self.touch(fix.imei, now)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def expire(self, now=None):
+        """
+        Takes devices whose deadline has passed offline; returns the offline
+        events.
+        """
+        now = time.time() if now is None else now
+        deadlines = self._deadlines
+        timeout = self.timeout
+        events = []
+        while deadlines and deadlines[0][0] <= now:
+            _, generation, imei = heapq.heappop(deadlines)
+            if self._armed.get(imei) != generation:
+                continue  # forgotten (and maybe re-armed since)
+            seen = self.last_seen.get(imei)
+            deadline = seen + timeout if seen is not None else now
+            if deadline > now:
+                # Heard from since this entry was pushed: re-arm
+                heapq.heappush(deadlines, (deadline, generation, imei))
+                continue
+            del self._armed[imei]
+            self.status[imei] = OFFLINE
+            events.append(self._emit(imei, ONLINE, OFFLINE, deadline))
+        return events
+
+    def next_deadline(self):
+        """
+        Earliest pending deadline (may be early, see expire()), or None.
+        """
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def forget(self, imei):
+        """
+        Drops a device (e.g. deleted); its heap entry is discarded lazily.
+        """
+        self._armed.pop(imei, None)
+        self.last_seen.pop(imei, None)
+        self.status.pop(imei, None)
+        self._seen.discard(imei)
+        self._changed.discard(imei)
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, conn):
+        """
+        Writes the last_seen of devices heard from since the last flush and
+        every status change to the devices table. Returns rows written.
+        """
+        p = self.placeholder
+        cursor = conn.cursor()
+        written = 0
+
+        if self._seen:
+            rows = [(epoch_to_timestamp(self.last_seen[imei]), imei) for imei in self._seen if imei in self.last_seen]
+            cursor.executemany(f"UPDATE devices SET last_seen = {p} WHERE device_id = {p}", rows)
+            written += len(rows)
+
+        if self._changed:
+            rows = [(self.status[imei], self.status[imei] == ONLINE, imei)
+                    for imei in self._changed if imei in self.status]
+            cursor.executemany(f"UPDATE devices SET status = {p}, internet_status = {p} WHERE device_id = {p}", rows)
+            written += len(rows)
+
+        conn.commit()
+        self._seen.clear()
+        self._changed.clear()
+        self._last_flush = time.monotonic()
+        self.stats['rows_persisted'] += written
+        return written
@@ -0,0 +1,142 @@
+import time
+import bisect
+from collections import deque
+
+# Parse latency histogram bounds (seconds)
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3)
+_BUCKETS_NS = tuple(int(bound * 1e9) for bound in LATENCY_BUCKETS)
+
+# Reject reasons reported by UniversalGPSParser
+REJECT_REASONS = (
+    'empty',           # nothing left after stripping whitespace
+    'unknown_prefix',  # no registered format matches
+    'too_few_fields',  # recognised prefix, truncated packet
+    'bad_imei',        # IMEI field missing or not numeric
+    'not_a_fix',       # well-formed but carries no data (simulator BP05 login)
+    'parse_error',     # exception inside a format parser
+)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_counters(name, help_text, values, label='key', metric_type='counter'):
+    """
+    Prometheus text for one metric family; `values` maps a label value to a
+    number (None as key -> no label).
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for key, value in sorted(values.items(), key=lambda item: str(item[0])):
+        if key is None:
+            lines.append(f"{name} {value}")
+        else:
+            lines.append(f'{name}{{{label}="{_label(key)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class ParserMetrics:
+    """
+    Counters, reject reasons and parse latency histograms for
+    UniversalGPSParser. Enable with UniversalGPSParser.enable_metrics();
+    while UniversalGPSParser.metrics is None the parser only pays one
+    attribute check per message.
+    - messages: parsed messages per format (GPSFix.format / result 'format',
+      falling back to the message type)
+    - rejects: None results per reason (REJECT_REASONS)
+    - warnings: accepted messages with a problem (e.g. 'bad_coordinate')
+    - latency: per-format histogram of parse_message() time
+    - samples: every `sample_every`-th payload per reason (the first one
+      always) in a ring of `max_samples`, instead of printing them
+    """
+
+    def __init__(self, sample_every=100, max_samples=50):
+        self.sample_every = sample_every
+        self.samples = deque(maxlen=max_samples)
+        self.reset()
+
+    def reset(self):
+        self.messages = {}
+        self.rejects = {}
+        self.warnings = {}
+        self.latency = {}  # format -> [bucket counts..., +Inf count, sum ns]
+        self.samples.clear()
+
+    def observe(self, result, elapsed_ns, message=None):
+        """
+        Records one parse_message() call; location fixes without a usable
+        coordinate are counted as a 'bad_coordinate' warning.
+        """
+        if result is None:
+            key = 'rejected'  # the reason was counted by reject()
+        elif isinstance(result, dict):
+            key = result.get('format') or result.get('type')
+            if result.get('type') == 'location_update' and \
+                    (result.get('latitude') is None or result.get('longitude') is None):
+                self.warn('bad_coordinate', message)
+        else:
+            key = result.format or result.type
+            if result.type == 'location_update' and (result.latitude is None or result.longitude is None):
+                self.warn('bad_coordinate', message)
+
+        self.messages[key] = self.messages.get(key, 0) + 1
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = [0] * (len(_BUCKETS_NS) + 2)
+        histogram[bisect.bisect_left(_BUCKETS_NS, elapsed_ns)] += 1
+        histogram[-1] += elapsed_ns
+
+    def reject(self, reason, payload=None, detail=None):
+        """
+        Counts a rejected message (called by the parser just before it
+        returns None) and samples its payload.
+        """
+        count = self.rejects.get(reason, 0) + 1
+        self.rejects[reason] = count
+        if payload is not None and (count - 1) % self.sample_every == 0:
+            self._sample(reason, payload, detail)
+
+    def warn(self, reason, payload=None):
+        count = self.warnings.get(reason, 0) + 1
+        self.warnings[reason] = count
+        if payload is not None and (count - 1) % self.sample_every == 0:
+            self._sample(reason, payload, None)
+
+    def _sample(self, reason, payload, detail):
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        if isinstance(payload, (bytes, bytearray)):
+            payload = bytes(payload).decode('latin-1')
+        self.samples.append({
+            'time': time.time(),
+            'reason': reason,
+            'payload': payload[:512],
+            'detail': str(detail) if detail is not None else None,
+        })
+
+    def to_prometheus(self, prefix='gps_parser'):
+        """
+        Prometheus text exposition format.
+        """
+        out = [
+            render_counters(f"{prefix}_messages_total", "Messages handled by the parser, by format.",
+                            self.messages, 'format'),
+            render_counters(f"{prefix}_rejects_total", "Messages rejected by the parser, by reason.",
+                            self.rejects, 'reason'),
+            render_counters(f"{prefix}_warnings_total", "Accepted messages with a data problem, by reason.",
+                            self.warnings, 'reason'),
+        ]
+        name = f"{prefix}_latency_seconds"
+        lines = [f"# HELP {name} parse_message() latency.", f"# TYPE {name} histogram"]
+        for key in sorted(self.latency, key=str):
+            histogram = self.latency[key]
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                cumulative += count
+                lines.append(f'{name}_bucket{{format="{_label(key)}",le="{bound:g}"}} {cumulative}')
+            cumulative += histogram[len(LATENCY_BUCKETS)]
+            lines.append(f'{name}_bucket{{format="{_label(key)}",le="+Inf"}} {cumulative}')
+            lines.append(f'{name}_sum{{format="{_label(key)}"}} {histogram[-1] / 1e9:.9f}')
+            lines.append(f'{name}_count{{format="{_label(key)}"}} {cumulative}')
+        out.append('\n'.join(lines) + '\n')
+        return ''.join(out)
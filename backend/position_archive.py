@@ -0,0 +1,407 @@
+import os
+import sys
+import mmap
+import time
+import array
+import shutil
+import bisect
+from collections import OrderedDict
+
+from universal_gps_parser import GPSFix, STANDARD_ALARMS, epoch_to_timestamp
+
+# Column name -> array typecode (one file per column per partition)
+COLUMNS = (
+    ('timestamp', 'q'),  # epoch seconds, sorted within a partition
+    ('lat', 'd'),
+    ('lng', 'd'),
+    ('speed', 'f'),
+    ('course', 'f'),
+    ('flags', 'B'),  # GPSFix.FLAG_* bits
+    ('alarm', 'B'),  # index into ALARM_NAMES, 255 = other
+)
+
+ALARM_NAMES = (None,) + tuple(sorted(set(STANDARD_ALARMS.values())))
+_ALARM_CODES = {name: code for code, name in enumerate(ALARM_NAMES)}
+OTHER_ALARM = 255
+
+UNSORTED_MARKER = 'UNSORTED'
+FORMAT = f"position-archive v1 {sys.byteorder}"
+
+
+def day_of(epoch):
+    return epoch_to_timestamp(epoch)[:10]
+
+
+class DaySlice:
+    """
+    Columns of one device-day between two timestamps: memoryviews over the
+    mapped column files (no copy). Keep the slice open while using the
+    views; close() unmaps the files.
+    """
+
+    def __init__(self, imei, day, maps, columns, start, stop):
+        self.imei = imei
+        self.day = day
+        self._maps = maps
+        self.columns = {name: column[start:stop] for name, column in columns.items()}
+        self._full = columns
+        self.count = stop - start
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def fixes(self):
+        """
+        The rows as GPSFix records (copies).
+        """
+        c = self.columns
+        imei = sys.intern(self.imei)
+        for i in range(self.count):
+            code = c['alarm'][i]
+            yield GPSFix('location_update', 'archive', imei, c['timestamp'][i], c['lat'][i], c['lng'][i],
+                         c['speed'][i], c['course'][i], c['flags'][i],
+                         alarm=ALARM_NAMES[code] if code < len(ALARM_NAMES) else 'other')
+
+    def close(self):
+        for view in self.columns.values():
+            view.release()
+        for view in self._full.values():
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PositionArchive:
+    """
+    Append-only columnar archive of parsed fixes under `root`:
+    root/<imei>/<YYYY-MM-DD>/<column>.bin, one fixed-width native-endian
+    array per column (COLUMNS). Days are UTC.
+    - append_many() groups fixes by partition and appends each column with
+      one write; recently written partitions keep their files open, at most
+      `max_open_files` files in all (len(COLUMNS) per partition), so the
+      archive stays well under the usual 1024 descriptor limit
+    - timestamps stay sorted per partition; a late fix marks the partition
+      UNSORTED until compact() rewrites it (reads then filter linearly)
+    - read() maps the column files and binary-searches the timestamp column,
+      so a time range of a device-day is a memoryview slice
+    - retention is directory removal: drop_device(), drop_day(), expire()
+    - compact() builds the sorted partition next to the old one and swaps
+      the directories, so every column always comes from the same version;
+      a swap cut short by a crash is finished or rolled back the next time
+      the device is listed or written (_recover)
+
+    Single writer per archive; readers may run concurrently and only see
+    rows that are complete in every column.
+    """
+
+    def __init__(self, root, max_open_files=448):
+        self.root = root
+        self.max_open = max(1, max_open_files // len(COLUMNS))  # partitions
+        self._open = OrderedDict()  # (imei, day) -> [files]
+        self._last = {}  # (imei, day) -> last timestamp written
+        os.makedirs(root, exist_ok=True)
+        meta = os.path.join(root, 'FORMAT')
+        if os.path.exists(meta):
+            with open(meta) as f:
+                found = f.read().strip()
+            if found != FORMAT:
+                raise ValueError(f"Archive {root} has format '{found}', expected '{FORMAT}'")
+        else:
+            with open(meta, 'w') as f:
+                f.write(FORMAT + '\n')
+
+    def _path(self, imei, day=None):
+        if day is None:
+            return os.path.join(self.root, imei)
+        return os.path.join(self.root, imei, day)
+
+    def _files(self, imei, day):
+        key = (imei, day)
+        files = self._open.get(key)
+        if files is not None:
+            self._open.move_to_end(key)
+            return files
+        # Evict first, so the budget also holds while this partition opens
+        while len(self._open) >= self.max_open:
+            _, evicted = self._open.popitem(last=False)
+            for f in evicted:
+                f.close()
+        path = self._path(imei, day)
+        if not os.path.isdir(path):
+            self._recover(imei)
+        os.makedirs(path, exist_ok=True)
+        files = []
+        try:
+            for name, _ in COLUMNS:
+                files.append(open(os.path.join(path, f"{name}.bin"), 'ab'))
+        except OSError:
+            for f in files:
+                f.close()
+            raise
+        self._open[key] = files
+        return files
+
+    def _last_timestamp(self, imei, day):
+        key = (imei, day)
+        if key not in self._last:
+            path = os.path.join(self._path(imei, day), 'timestamp.bin')
+            last = None
+            if os.path.exists(path):
+                size = os.path.getsize(path) // 8 * 8
+                if size:
+                    with open(path, 'rb') as f:
+                        f.seek(size - 8)
+                        last = array.array('q', f.read(8))[0]
+            self._last[key] = last
+        return self._last[key]
+
+    def append(self, fix):
+        return self.append_many([fix])
+
+    def append_many(self, fixes):
+        """
+        Appends location fixes (GPSFix or parse_message() dicts); other
+        messages are ignored. Returns the number of rows written.
+        """
+        partitions = {}
+        for fix in fixes:
+            fix = GPSFix.from_result(fix)
+            if fix is None or fix.type != 'location_update' or fix.latitude is None or fix.longitude is None:
+                continue
+            timestamp = fix.timestamp if fix.timestamp is not None else int(time.time())
+            key = (fix.imei, day_of(timestamp))
+            rows = partitions.get(key)
+            if rows is None:
+                rows = partitions[key] = [array.array(code) for _, code in COLUMNS]
+            alarm = fix.alarm
+            rows[0].append(int(timestamp))
+            rows[1].append(fix.latitude)
+            rows[2].append(fix.longitude)
+            rows[3].append(fix.speed or 0.0)
+            rows[4].append(fix.course or 0.0)
+            rows[5].append(fix.flags & 0xFF)
+            rows[6].append(_ALARM_CODES.get(alarm, OTHER_ALARM) if alarm else 0)
+
+        written = 0
+        for (imei, day), rows in partitions.items():
+            timestamps = rows[0]
+            last = self._last_timestamp(imei, day)
+            in_order = all(timestamps[i] <= timestamps[i + 1] for i in range(len(timestamps) - 1))
+            files = self._files(imei, day)
+            if not in_order or (last is not None and timestamps[0] < last):
+                open(os.path.join(self._path(imei, day), UNSORTED_MARKER), 'a').close()
+            for f, column in zip(files, rows):
+                column.tofile(f)
+            self._last[(imei, day)] = max(timestamps) if last is None else max(last, max(timestamps))
+            written += len(timestamps)
+        return written
+
+    def flush(self):
+        for files in self._open.values():
+            for f in files:
+                f.flush()
+
+    def close(self):
+        for files in self._open.values():
+            for f in files:
+                f.close()
+        self._open.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def devices(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def days(self, imei):
+        path = self._path(imei)
+        if not os.path.isdir(path):
+            return []
+        self._recover(imei)
+        return sorted(name for name in os.listdir(path) if not name.startswith('.'))
+
+    def _recover(self, imei):
+        """
+        Cleans up after a compact() that did not finish: the old partition
+        (.<day>.old) is dropped if the new one is in place, else restored;
+        a half written new partition (.<day>.compact) is dropped.
+        """
+        path = self._path(imei)
+        if not os.path.isdir(path):
+            return
+        names = os.listdir(path)
+        for name in names:
+            if name.startswith('.') and name.endswith('.old'):
+                day = os.path.join(path, name[1:-len('.old')])
+                if os.path.isdir(day):
+                    shutil.rmtree(os.path.join(path, name))
+                else:
+                    os.rename(os.path.join(path, name), day)
+        for name in names:
+            if name.startswith('.') and name.endswith('.compact'):
+                shutil.rmtree(os.path.join(path, name))
+
+    def read_day(self, imei, day, start=None, end=None):
+        """
+        DaySlice of one device-day with start <= timestamp <= end (epoch
+        seconds; None = open ended), or None if the partition is empty.
+        """
+        key = (imei, day)
+        if key in self._open:
+            for f in self._open[key]:
+                f.flush()
+        path = self._path(imei, day)
+        if not os.path.isdir(path):
+            return None
+
+        maps = []
+        columns = {}
+        sizes = []
+        try:
+            for name, code in COLUMNS:
+                with open(os.path.join(path, f"{name}.bin"), 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+                if mapped is not None:
+                    maps.append(mapped)
+                itemsize = array.array(code).itemsize
+                sizes.append(size // itemsize)
+                columns[name] = (mapped, code, itemsize)
+        except FileNotFoundError:
+            for mapped in maps:
+                mapped.close()
+            return None
+
+        count = min(sizes)
+        if not count:
+            for mapped in maps:
+                mapped.close()
+            return None
+        views = {name: memoryview(mapped)[:count * itemsize].cast(code)
+                 for name, (mapped, code, itemsize) in columns.items()}
+
+        timestamps = views['timestamp']
+        if os.path.exists(os.path.join(path, UNSORTED_MARKER)):
+            # Late fixes: materialise the matching rows in time order
+            order = sorted((i for i in range(count)
+                            if (start is None or timestamps[i] >= start) and (end is None or timestamps[i] <= end)),
+                           key=timestamps.__getitem__)
+            copied = {name: memoryview(array.array(code, (views[name][i] for i in order)))
+                      for name, code in COLUMNS}
+            for view in views.values():
+                view.release()
+            for mapped in maps:
+                mapped.close()
+            return DaySlice(imei, day, [], copied, 0, len(order))
+
+        lo = 0 if start is None else bisect.bisect_left(timestamps, start)
+        hi = count if end is None else bisect.bisect_right(timestamps, end)
+        return DaySlice(imei, day, maps, views, lo, hi)
+
+    def read(self, imei, start=None, end=None):
+        """
+        DaySlices of a device covering [start, end] (epoch seconds), in day
+        order. Close them when done.
+        """
+        first = day_of(start) if start is not None else None
+        last = day_of(end) if end is not None else None
+        slices = []
+        for day in self.days(imei):
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            day_slice = self.read_day(imei, day, start, end)
+            if day_slice is not None and len(day_slice):
+                slices.append(day_slice)
+            elif day_slice is not None:
+                day_slice.close()
+        return slices
+
+    def iter_fixes(self, imei, start=None, end=None):
+        for day_slice in self.read(imei, start, end):
+            with day_slice:
+                yield from day_slice.fixes()
+
+    def compact(self, imei, day):
+        """
+        Rewrites an UNSORTED partition in timestamp order (stable).
+        """
+        self._recover(imei)
+        path = self._path(imei, day)
+        marker = os.path.join(path, UNSORTED_MARKER)
+        if not os.path.exists(marker):
+            return False
+        self._close_partition(imei, day)
+        day_slice = self.read_day(imei, day)
+        if day_slice is None:
+            data = [array.array(code) for _, code in COLUMNS]
+        else:
+            with day_slice:
+                data = [array.array(code, day_slice[name]) for name, code in COLUMNS]
+
+        tmp = os.path.join(self._path(imei), f".{day}.compact")
+        old = os.path.join(self._path(imei), f".{day}.old")
+        os.makedirs(tmp)
+        for (name, _), column in zip(COLUMNS, data):
+            with open(os.path.join(tmp, f"{name}.bin"), 'wb') as f:
+                column.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old)
+        self._last[(imei, day)] = data[0][-1] if data[0] else None
+        return True
+
+    def _close_partition(self, imei, day):
+        files = self._open.pop((imei, day), None)
+        if files:
+            for f in files:
+                f.close()
+        self._last.pop((imei, day), None)
+
+    def drop_day(self, imei, day):
+        self._close_partition(imei, day)
+        path = self._path(imei, day)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            return True
+        return False
+
+    def drop_device(self, imei):
+        for day in self.days(imei):
+            self._close_partition(imei, day)
+        path = self._path(imei)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            return True
+        return False
+
+    def expire(self, before):
+        """
+        Drops every partition older than `before` ('YYYY-MM-DD' or epoch).
+        Returns the number of partitions removed.
+        """
+        if not isinstance(before, str):
+            before = day_of(before)
+        removed = 0
+        for imei in self.devices():
+            for day in self.days(imei):
+                if day < before:
+                    self.drop_day(imei, day)
+                    removed += 1
+            if not self.days(imei):
+                os.rmdir(self._path(imei))
+        return removed
@@ -0,0 +1,226 @@
+import time
+import queue
+import threading
+
+from universal_gps_parser import GPSFix, epoch_to_timestamp
+
+POSITION_COLUMNS = ('device_id', 'lat', 'lng', 'speed', 'course', 'alarm', 'acc_status',
+                    'internet_status', 'gps_status', 'door_status', 'timestamp')
+
+_STOP = object()
+
+
+class PositionWriter:
+    """
+    Write-behind batched writer for parsed fixes.
+    Replaces the per-fix INSERT positions + UPDATE devices round trips of
+    tcpServer.ts / trackingService.ts:
+    - fixes are queued by submit()/submit_many() and written by one background
+      thread, so per-device order is the arrival order
+    - a flush happens when max_rows fixes are pending or max_delay seconds after
+      the first pending fix, whichever comes first
+    - positions go out as multi-row INSERTs (rows_per_statement rows each)
+    - devices get one UPDATE per IMEI per flush: last_seen is the newest
+      timestamp of the window and gps_status comes from the newest fix, and
+      both are only written when not older than the stored last_seen (as in
+      SQLiteSink), so late or resent fixes never move them backwards, within
+      a window or across flushes; heartbeat-only devices get the
+      last_seen/status/internet_status UPDATE of tcpServer.ts and keep their
+      gps_status
+    - submit() blocks once max_pending fixes are queued (backpressure)
+    - if connect() fails, submit() and flush() raise instead of waiting on a
+      dead writer thread
+
+    `connect` is a zero-argument callable returning a DB-API connection; it is
+    called from the writer thread. `placeholder` is the driver's parameter
+    marker ('?' for sqlite3, '%s' for MySQL drivers).
+    """
+
+    def __init__(self, connect, max_rows=1000, max_delay=1.0, max_pending=10000,
+                 rows_per_statement=200, placeholder='?', retries=3):
+        self.connect = connect
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.rows_per_statement = rows_per_statement
+        self.placeholder = placeholder
+        self.retries = retries
+
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='position-writer', daemon=True)
+
+        self.stats = {
+            'submitted': 0,
+            'positions_written': 0,
+            'devices_updated': 0,
+            'flushes': 0,
+            'errors': 0,
+            'dropped': 0,
+        }
+        self._thread.start()
+
+    def submit(self, fix, timeout=None):
+        """
+        Queues one fix (GPSFix or parse_message() result dict).
+        Blocks while the writer is max_pending fixes behind.
+        """
+        if self._closed:
+            raise RuntimeError("PositionWriter is closed")
+        self._check()
+        fix = GPSFix.from_result(fix)
+        if fix is None:
+            return
+        self._pending.put(fix, timeout=timeout)
+        self.stats['submitted'] += 1
+
+    def submit_many(self, fixes, timeout=None):
+        for fix in fixes:
+            self.submit(fix, timeout)
+
+    def flush(self):
+        """
+        Blocks until everything submitted so far has been written.
+        """
+        self._pending.join()
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"PositionWriter could not connect: {self._error}") from self._error
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        get = self._pending.get
+        try:
+            conn = self.connect()
+        except Exception as e:
+            self._error = e
+            self.stats['errors'] += 1
+            print(f"PositionWriter could not connect: {e}")
+            # Keep draining so flush()/close() return and report the error
+            while True:
+                item = get()
+                self._pending.task_done()
+                if item is _STOP:
+                    return
+                self.stats['dropped'] += 1
+        try:
+            while True:
+                item = get()
+                if item is _STOP:
+                    self._pending.task_done()
+                    return
+
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                self._write(conn, batch)
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._pending.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        positions = []
+        seen = {}   # imei -> newest epoch of the window (fixes and heartbeats)
+        latest = {}  # imei -> [epoch, gps_valid, alarm] of the newest fix
+        now = time.time()
+        for fix in batch:
+            epoch = fix.timestamp if fix.timestamp is not None else now
+            imei = fix.imei
+            if epoch > seen.get(imei, float('-inf')):
+                seen[imei] = epoch
+            if fix.type == 'location_update' and fix.latitude is not None and fix.longitude is not None:
+                positions.append((
+                    imei, fix.latitude, fix.longitude, fix.speed or 0, fix.course or 0,
+                    fix.alarm, fix.acc_status, True, fix.gps_valid, fix.door_status, epoch_to_timestamp(epoch)
+                ))
+                current = latest.get(imei)
+                if current is None:
+                    latest[imei] = [epoch, fix.gps_valid, fix.alarm]
+                else:
+                    if epoch >= current[0]:
+                        current[0], current[1] = epoch, fix.gps_valid
+                    if fix.alarm:
+                        current[2] = fix.alarm
+
+        # Dicts keep first-insertion order, so statements stay in arrival order
+        fixes = []
+        for imei, (epoch, gps_valid, alarm) in latest.items():
+            fixed_at, last_seen = epoch_to_timestamp(epoch), epoch_to_timestamp(seen[imei])
+            fixes.append((fixed_at, gps_valid, last_seen, last_seen, alarm, imei))
+        heartbeats = [(epoch_to_timestamp(epoch),) * 2 + (imei,) for imei, epoch in seen.items() if imei not in latest]
+        p = self.placeholder
+        # gps_status is assigned before last_seen: MySQL evaluates SET left to right
+        newer = f"last_seen IS NULL OR last_seen <= {p}"
+
+        for attempt in range(self.retries + 1):
+            try:
+                cursor = conn.cursor()
+                self._insert_positions(cursor, positions)
+                if fixes:
+                    cursor.executemany(
+                        f"UPDATE devices SET gps_status = CASE WHEN {newer} THEN {p} ELSE gps_status END, "
+                        f"last_seen = CASE WHEN {newer} THEN {p} ELSE last_seen END, "
+                        f"status = 'online', internet_status = TRUE, "
+                        f"last_alarm = COALESCE({p}, last_alarm) WHERE device_id = {p}",
+                        fixes
+                    )
+                if heartbeats:
+                    cursor.executemany(
+                        f"UPDATE devices SET last_seen = CASE WHEN {newer} THEN {p} ELSE last_seen END, "
+                        f"status = 'online', internet_status = TRUE WHERE device_id = {p}",
+                        heartbeats
+                    )
+                conn.commit()
+                self.stats['positions_written'] += len(positions)
+                self.stats['devices_updated'] += len(seen)
+                self.stats['flushes'] += 1
+                return
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Error writing position batch (attempt {attempt + 1}): {e}")
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                time.sleep(min(0.1 * (2 ** attempt), 2.0))
+
+        self.stats['dropped'] += len(batch)
+
+    def _insert_positions(self, cursor, positions):
+        row = '(' + ', '.join([self.placeholder] * len(POSITION_COLUMNS)) + ')'
+        prefix = f"INSERT INTO positions ({', '.join(POSITION_COLUMNS)}) VALUES "
+        step = self.rows_per_statement
+        for i in range(0, len(positions), step):
+            chunk = positions[i:i + step]
+            params = [value for position in chunk for value in position]
+            cursor.execute(prefix + ', '.join([row] * len(chunk)), params)
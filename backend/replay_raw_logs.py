@@ -0,0 +1,331 @@
+import os
+import json
+import gzip
+import time
+import zlib
+import sqlite3
+import argparse
+import multiprocessing
+
+from gps_gateway import SQLiteSink
+from gps_stream_framer import GPSStreamFramer, peek_imei
+from position_writer import POSITION_COLUMNS
+from universal_gps_parser import UniversalGPSParser, epoch_to_timestamp
+
+_STOP = None
+
+
+def iter_export(path, after_id=0):
+    """
+    Rows of a raw_logs export: either `id<TAB>received_at<TAB>payload` lines
+    (SELECT ... INTO OUTFILE) or bare payload lines (e.g. generate_corpus.py),
+    where the line number stands in for the id. Yields (id, payload, received_at).
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='latin-1') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            parts = line.split('\t', 2)
+            if len(parts) == 3 and parts[0].isdigit():
+                row_id, received_at, payload = int(parts[0]), parts[1], parts[2]
+            else:
+                row_id, received_at, payload = line_no, None, line
+            if row_id > after_id:
+                yield row_id, payload, received_at
+
+
+def iter_sqlite(path, after_id=0, chunk_size=10000):
+    """
+    Rows of the raw_logs table, read in id order with keyset pagination.
+    Yields (id, payload, received_at).
+    """
+    conn = sqlite3.connect(path)
+    try:
+        while True:
+            rows = conn.execute(
+                'SELECT id, payload, received_at FROM raw_logs WHERE id > ? ORDER BY id LIMIT ?',
+                (after_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            after_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+class SQLitePositionOutput:
+    """
+    Appends re-parsed positions to a SQLite database (schema of SQLiteSink).
+    The replay progress of each source is stored in the same database and
+    committed with the positions it covers, so a resume never re-inserts
+    rows that were already written.
+    """
+
+    def __init__(self, path, source=None):
+        self.source = source or ''
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SQLiteSink.SCHEMA)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS replay_progress (source TEXT PRIMARY KEY, last_id INTEGER)')
+        self.sql = (f"INSERT INTO positions ({', '.join(POSITION_COLUMNS)}) "
+                    f"VALUES ({', '.join(['?'] * len(POSITION_COLUMNS))})")
+
+    def write(self, positions, last_id=None):
+        """
+        Inserts `positions` and, in the same transaction, records that every
+        raw_logs row up to `last_id` has been replayed.
+        """
+        with self.conn:
+            self.conn.executemany(self.sql, positions)
+            if last_id is not None:
+                self.conn.execute('INSERT OR REPLACE INTO replay_progress (source, last_id) VALUES (?, ?)',
+                                  (self.source, last_id))
+
+    def last_id(self):
+        row = self.conn.execute('SELECT last_id FROM replay_progress WHERE source = ?', (self.source,)).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        self.conn.close()
+
+
+def _replay_worker(inbox, outbox, keep_positions):
+    """
+    Shard process: parses chunks in the order they arrive (so per-device
+    order is kept) and sends back counts and, if wanted, position rows.
+    - a raw_logs payload is a whole TCP read (tcpServer.ts logs each `data`
+      chunk), so it is split with GPSStreamFramer before parsing
+    - fixes without a device time (simulator, standard packets without a
+      date) are dated with the row's received_at, not the replay time
+    """
+    parse_many = UniversalGPSParser.parse_many
+    framer = GPSStreamFramer()
+    while True:
+        item = inbox.get()
+        if item is _STOP:
+            return
+        seq, rows = item
+        frames = fixes = 0
+        positions = []
+        for row_id, payload, received_at in rows:
+            if isinstance(payload, str):
+                payload = payload.encode('latin-1')
+            found = framer.feed(payload) + framer.flush()
+            frames += len(found)
+            results, _ = parse_many(found, record=True)
+            for fix in results:
+                if fix is None:
+                    continue
+                fixes += 1
+                if keep_positions and fix.type == 'location_update' and fix.latitude is not None and fix.longitude is not None:
+                    positions.append((
+                        fix.imei, fix.latitude, fix.longitude, fix.speed or 0, fix.course or 0,
+                        fix.alarm, fix.acc_status, True, fix.gps_valid, fix.door_status,
+                        epoch_to_timestamp(fix.timestamp) or received_at
+                    ))
+        outbox.put((seq, len(rows), frames, fixes, positions))
+
+
+class RawLogReplayer:
+    """
+    Re-parses raw_logs history on all cores.
+    - rows are read in chunks of `chunk_size` and split by IMEI (crc32 % workers)
+      into one FIFO queue per shard process, so every device is handled by a
+      single process in id order
+    - at most `max_in_flight` chunks are outstanding, which bounds memory
+    - positions are handed to `output` (anything with write(rows, last_id))
+      one chunk at a time in chunk order, once every shard of the chunk and of
+      all earlier chunks has finished; results that come back early wait in
+      memory (at most max_in_flight chunks)
+    - last_id is the last id of the newest chunk written that way, so nothing
+      after it has reached the output; the output commits it together with
+      the positions, and the checkpoint file records it for dry runs
+    """
+
+    def __init__(self, workers=None, chunk_size=5000, output=None, checkpoint=None,
+                 max_in_flight=None, source=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.output = output
+        self.checkpoint = checkpoint
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self.source = source
+
+        self.last_id = 0
+        self._pending = {}  # seq -> [shards still working, last id of the chunk, positions]
+        self._done_upto = 0  # chunks below this seq have been written
+        self.stats = {
+            'rows': 0,
+            'frames': 0,
+            'fixes': 0,
+            'invalid': 0,
+            'positions': 0,
+            'chunks': 0,
+        }
+
+    def load_checkpoint(self):
+        """
+        Last fully replayed id: the one committed with the output's positions
+        when the output records it, else the checkpoint file's (0 when absent
+        or written for another source).
+        """
+        if self.output is not None and hasattr(self.output, 'last_id'):
+            self.last_id = self.output.last_id()
+            return self.last_id
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if self.source and state.get('source') != self.source:
+            print(f"Checkpoint {self.checkpoint} is for {state.get('source')}, starting from scratch")
+            return 0
+        self.last_id = state.get('last_id', 0)
+        return self.last_id
+
+    def save_checkpoint(self):
+        if not self.checkpoint:
+            return
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'source': self.source,
+                'last_id': self.last_id,
+                'rows': self.stats['rows'],
+                'updated_at': epoch_to_timestamp(time.time()),
+            }, f)
+        os.replace(tmp, self.checkpoint)
+
+    def run(self, rows, report_interval=5.0, checkpoint_interval=5.0):
+        """
+        Replays an iterable of (id, payload, received_at) rows. Returns stats.
+        """
+        ctx = multiprocessing.get_context()
+        outbox = ctx.Queue()
+        inboxes = [ctx.Queue() for _ in range(self.workers)]
+        processes = [ctx.Process(target=_replay_worker, args=(inbox, outbox, self.output is not None), daemon=True)
+                     for inbox in inboxes]
+        for process in processes:
+            process.start()
+
+        pending = self._pending = {}
+        self._done_upto = 0
+        started = last_report = last_checkpoint = time.perf_counter()
+        reported_rows = 0
+
+        def collect():
+            self._collected(*outbox.get())
+
+        try:
+            seq = 0
+            chunk = []
+            rows = iter(rows)
+            while True:
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_size:
+                        break
+                if not chunk:
+                    break
+
+                shards = [[] for _ in range(self.workers)]
+                for row in chunk:
+                    shards[zlib.crc32(peek_imei(row[1]).encode('latin-1')) % self.workers].append(row)
+                sent = 0
+                for inbox, shard in zip(inboxes, shards):
+                    if shard:
+                        inbox.put((seq, shard))
+                        sent += 1
+                pending[seq] = [sent, chunk[-1][0], []]
+                self.stats['chunks'] += 1
+                seq += 1
+                chunk = []
+
+                while len(pending) >= self.max_in_flight:
+                    collect()
+
+                now = time.perf_counter()
+                if now - last_checkpoint >= checkpoint_interval:
+                    self.save_checkpoint()
+                    last_checkpoint = now
+                if report_interval and now - last_report >= report_interval:
+                    rate = (self.stats['rows'] - reported_rows) / (now - last_report)
+                    print(f"[REPLAY] rows={self.stats['rows']:,} rows/s={rate:,.0f} "
+                          f"fixes={self.stats['fixes']:,} invalid={self.stats['invalid']:,} last_id={self.last_id}")
+                    reported_rows, last_report = self.stats['rows'], now
+
+            while pending:
+                collect()
+        finally:
+            for inbox in inboxes:
+                inbox.put(_STOP)
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self.save_checkpoint()
+
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = elapsed
+        self.stats['rows_per_sec'] = self.stats['rows'] / elapsed if elapsed else 0.0
+        return self.stats
+
+    def _collected(self, seq, count, frames, fixes, positions):
+        """
+        One shard's result for chunk `seq`. Writes every chunk that is now
+        complete, in chunk order.
+        """
+        pending = self._pending
+        self.stats['rows'] += count
+        self.stats['frames'] += frames
+        self.stats['fixes'] += fixes
+        self.stats['invalid'] += frames - fixes
+        entry = pending[seq]
+        entry[0] -= 1
+        entry[2].extend(positions)
+        while self._done_upto in pending and pending[self._done_upto][0] == 0:
+            _, last_id, positions = pending.pop(self._done_upto)
+            if self.output is not None:
+                self.output.write(positions, last_id)
+            self.stats['positions'] += len(positions)
+            self.last_id = last_id
+            self._done_upto += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-core raw_logs replay / backfill")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--db', help="SQLite database with a raw_logs table")
+    source.add_argument('--export', help="raw_logs export (id<TAB>received_at<TAB>payload or one payload per line, .gz ok)")
+    parser.add_argument('--output', help="SQLite database to append re-parsed positions to (dry run when omitted)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Shard processes")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--checkpoint', help="JSON file to resume from / record progress in")
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    source_name = os.path.abspath(args.db or args.export)
+    output = SQLitePositionOutput(args.output, source_name) if args.output else None
+    replayer = RawLogReplayer(args.workers, args.chunk_size, output, args.checkpoint, source=source_name)
+    after_id = replayer.load_checkpoint()
+    if after_id:
+        print(f"Resuming after id {after_id}")
+
+    rows = iter_sqlite(args.db, after_id, args.chunk_size) if args.db else iter_export(args.export, after_id)
+    try:
+        stats = replayer.run(rows, args.report_interval)
+    except KeyboardInterrupt:
+        print(f"Interrupted, checkpoint at id {replayer.last_id}")
+        return
+    finally:
+        if output:
+            output.close()
+
+    print(f"[REPLAY] done: {stats['rows']:,} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/s, {replayer.workers} workers) "
+          f"frames={stats['frames']:,} fixes={stats['fixes']:,} invalid={stats['invalid']:,} positions={stats['positions']:,}")
+
+
+if __name__ == '__main__':
+    main()
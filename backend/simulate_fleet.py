@@ -0,0 +1,234 @@
+import time
+import random
+import asyncio
+import argparse
+
+from simulate_movement_hq import (
+    WAYPOINTS, SPEED_FACTOR, interpolate, get_bearing, scenario_state,
+    build_login, build_heartbeat, build_packet, build_standard_packet,
+)
+
+HOST = '127.0.0.1'
+PORT = 5001
+IMEI_BASE = 359586000000000
+LOGIN_REPLY = b'(AP05)'
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    """
+    'hq=0.7,standard=0.2,heartbeat=0.1' -> [('hq', 0.7), ...]
+    """
+    mix = []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ('hq', 'standard', 'heartbeat'):
+            raise ValueError(f"Unknown protocol in mix: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def make_route(rng, points=6, spread=0.01):
+    """
+    Random route starting near one of the reference waypoints (Casablanca).
+    """
+    lat, lng = rng.choice(WAYPOINTS)
+    route = [(lat, lng)]
+    for _ in range(points - 1):
+        lat += rng.uniform(-spread, spread)
+        lng += rng.uniform(-spread, spread)
+        route.append((lat, lng))
+    return route
+
+
+class SimulatedDevice:
+    """
+    One tracker: its own route, phase offset in the route and in the
+    100-step scenario cycle (driving / idling / parked / SOS).
+    """
+
+    def __init__(self, imei, rng, mix):
+        self.imei = imei
+        self.rng = rng
+        self.route = make_route(rng)
+        self.point_idx = rng.randrange(len(self.route) - 1)
+        self.progress = rng.random()
+        self.cycle = rng.randrange(100)
+        self.protocols = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+
+    def next_packet(self, now=None):
+        self.cycle = (self.cycle + 1) % 100
+        speed, acc_on, alarm, advancing = scenario_state(self.cycle)
+
+        p1 = self.route[self.point_idx]
+        p2 = self.route[self.point_idx + 1]
+        lat, lng = interpolate(p1, p2, self.progress)
+        course = get_bearing(p1[0], p1[1], p2[0], p2[1])
+
+        if advancing:
+            self.progress += SPEED_FACTOR
+            if self.progress >= 1.0:
+                self.progress = 0.0
+                self.point_idx = (self.point_idx + 1) % (len(self.route) - 1)
+
+        if alarm:
+            return build_packet(lat, lng, speed, course, acc_on, False, alarm, self.imei, now)
+        protocol = self.rng.choices(self.protocols, self.weights)[0]
+        if protocol == 'heartbeat':
+            return build_heartbeat(self.imei, command=self.rng.random() < 0.5)
+        if protocol == 'standard':
+            return build_standard_packet(lat, lng, speed, course, acc_on, self.imei, now)
+        return build_packet(lat, lng, speed, course, acc_on, False, None, self.imei, now)
+
+
+class FleetLoadGenerator:
+    """
+    Simulates N devices concurrently over asyncio against the ingest server.
+    Each device logs in (BP05), waits for (AP05) and then sends one packet
+    every `interval` seconds; devices are brought online over `ramp` seconds.
+    """
+
+    def __init__(self, devices, host=HOST, port=PORT, interval=2.0, ramp=10.0,
+                 ramp_profile='linear', mix='hq=0.8,standard=0.1,heartbeat=0.1',
+                 seed=1, login_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.ramp = ramp
+        self.ramp_profile = ramp_profile
+        self.login_timeout = login_timeout
+        rng = random.Random(seed)
+        mix = parse_mix(mix)
+        self.devices = [SimulatedDevice(str(IMEI_BASE + i), random.Random(rng.random()), mix)
+                        for i in range(devices)]
+
+        self.stats = {
+            'connected': 0,
+            'packets': 0,
+            'connect_errors': 0,
+            'login_timeouts': 0,
+            'disconnects': 0,
+        }
+        self.login_latencies = []
+
+    def start_delay(self, index):
+        count = len(self.devices)
+        if self.ramp <= 0 or self.ramp_profile == 'instant' or count == 1:
+            return 0.0
+        fraction = index / (count - 1)
+        if self.ramp_profile == 'step':
+            # 4 equal waves
+            return self.ramp * min(3, int(fraction * 4)) / 3
+        if self.ramp_profile == 'exponential':
+            return self.ramp * (fraction ** 2)
+        return self.ramp * fraction
+
+    async def run_device(self, index, device, stop_at):
+        await asyncio.sleep(self.start_delay(index))
+        loop = asyncio.get_running_loop()
+        # Phase offset inside the send interval so devices don't send in lockstep
+        phase = device.rng.random() * self.interval
+
+        while loop.time() < stop_at:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                self.stats['connect_errors'] += 1
+                await asyncio.sleep(1.0)
+                continue
+
+            self.stats['connected'] += 1
+            try:
+                sent_at = time.perf_counter()
+                writer.write(build_login(device.imei).encode())
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(reader.readexactly(len(LOGIN_REPLY)), self.login_timeout)
+                    self.login_latencies.append(time.perf_counter() - sent_at)
+                except asyncio.TimeoutError:
+                    self.stats['login_timeouts'] += 1
+
+                await asyncio.sleep(phase)
+                next_send = loop.time()
+                while loop.time() < stop_at:
+                    writer.write(device.next_packet().encode())
+                    await writer.drain()
+                    self.stats['packets'] += 1
+                    next_send += self.interval
+                    await asyncio.sleep(max(0.0, next_send - loop.time()))
+            except (OSError, asyncio.IncompleteReadError):
+                self.stats['disconnects'] += 1
+                await asyncio.sleep(1.0)
+            finally:
+                self.stats['connected'] -= 1
+                writer.close()
+
+    async def report(self, interval):
+        last_packets = 0
+        last_time = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            rate = (self.stats['packets'] - last_packets) / (now - last_time)
+            last_packets, last_time = self.stats['packets'], now
+            print(f"[FLEET] connected={self.stats['connected']}/{len(self.devices)} "
+                  f"pkts/s={rate:,.0f} total={self.stats['packets']} "
+                  f"errors={self.stats['connect_errors']} login_timeouts={self.stats['login_timeouts']} "
+                  f"{self.latency_summary()}")
+
+    def latency_summary(self):
+        latencies = sorted(self.login_latencies)
+        return (f"AP05 p50={percentile(latencies, 50) * 1000:.1f}ms "
+                f"p90={percentile(latencies, 90) * 1000:.1f}ms "
+                f"p99={percentile(latencies, 99) * 1000:.1f}ms (n={len(latencies)})")
+
+    async def run(self, duration, report_interval=5.0):
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + duration
+        reporter = asyncio.create_task(self.report(report_interval))
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self.run_device(i, device, stop_at)
+                                   for i, device in enumerate(self.devices)))
+        finally:
+            reporter.cancel()
+        elapsed = time.perf_counter() - started
+        print(f"[FLEET] done: {self.stats['packets']} packets in {elapsed:.1f}s "
+              f"({self.stats['packets'] / elapsed:,.0f} pkts/s) {self.latency_summary()}")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio fleet load generator for the ingest server")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--interval', type=float, default=2.0, help="Seconds between packets per device")
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--ramp', type=float, default=10.0, help="Seconds to bring all devices online")
+    parser.add_argument('--ramp-profile', choices=['linear', 'step', 'exponential', 'instant'], default='linear')
+    parser.add_argument('--mix', default='hq=0.8,standard=0.1,heartbeat=0.1')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    generator = FleetLoadGenerator(args.devices, args.host, args.port, args.interval, args.ramp,
+                                   args.ramp_profile, args.mix, args.seed)
+    print(f"Simulating {args.devices} devices against {args.host}:{args.port} "
+          f"({args.devices / args.interval:,.0f} pkts/s target)")
+    try:
+        asyncio.run(generator.run(args.duration, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -50,8 +50,17 @@ def format_coord(coord, is_lat):
         direction = 'E' if coord >= 0 else 'W'
     return formatted, direction
 
-def send_update(sock, lat, lng, speed, course, acc_on, door_open, alarm_type=None):
-    now = datetime.now()  # Changed from utcnow() to now() for local time
+def build_login(imei=IMEI):
+    # BP05 login frame, answered by the server with (AP05)
+    return f"(0{imei}BP05)"
+
+def build_heartbeat(imei=IMEI, command=False):
+    if command:
+        return f"##,imei:{imei},A;"
+    return f"{imei};"
+
+def build_packet(lat, lng, speed, course, acc_on, door_open, alarm_type=None, imei=IMEI, now=None):
+    now = now or datetime.now()  # Local time (simulated time when given)
     date_str = now.strftime("%d%m%y")
     time_str = now.strftime("%H%M%S")
     
@@ -77,75 +86,90 @@ def send_update(sock, lat, lng, speed, course, acc_on, door_open, alarm_type=Non
     if alarm_type == 'sos':
          # Send Standard SOS Packet instead of HQ to test variation
          # imei:...,help me, ...
-         packet = f"imei:{IMEI},help me,{date_str}{time_str},,F,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},{speed},;"
-    else:
-        # Standard HQ Packet
-        status_hex = f"{status_int:08X}"
-        packet = f"*HQ,{IMEI},V1,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},{speed:.2f},{course:.2f},{date_str},{status_hex}#"
-    
+         return f"imei:{imei},help me,{now.strftime('%y%m%d')}{time_str},,F,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},{speed},;"
+
+    # Standard HQ Packet
+    status_hex = f"{status_int:08X}"
+    return f"*HQ,{imei},V1,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},{speed:.2f},{course:.2f},{date_str},{status_hex}#"
+
+def build_standard_packet(lat, lng, speed, course, acc_on, imei=IMEI, now=None):
+    # Standard imei: location packet (trigger "tracker"), ACC as 'acc on' suffix
+    now = now or datetime.now()
+    date_str = now.strftime("%y%m%d%H%M%S")
+    time_str = now.strftime("%H%M%S")
+    lat_str, lat_dir = format_coord(lat, True)
+    lon_str, lon_dir = format_coord(lng, False)
+    acc = 'acc on' if acc_on else 'acc off'
+    return f"imei:{imei},tracker,{date_str},,F,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},{speed:.2f},{course:.2f},0.0,{acc};"
+
+def scenario_state(cycle):
+    """
+    Scenario for a position in the 100-step cycle:
+    (speed, acc_on, alarm, advancing)
+    0-39: Driving, 40-44: Idling, 45-49: Parked, 50-51: SOS, 52-99: Driving
+    """
+    if 40 <= cycle < 45:
+        # Idling (Traffic / Stop light) - Reduced to 5 cycles (10s)
+        # Verify "Ralenti (Conso)"
+        return 0.0, True, None, False
+    if 45 <= cycle < 50:
+        # Parked - Reduced to 5 cycles (10s)
+        # Dont advance progress
+        return 0.0, False, None, False
+    if 50 <= cycle < 52:
+        # SOS Event! - Reduced to 2 cycles
+        return 0.0, True, 'sos', False
+    # Driving
+    return 40.0, True, None, True
+
+def send_update(sock, lat, lng, speed, course, acc_on, door_open, alarm_type=None):
+    packet = build_packet(lat, lng, speed, course, acc_on, door_open, alarm_type)
     print(f"Sending: {packet} (Lat: {lat:.5f}, ACC: {acc_on}, Alarm: {alarm_type})")
     sock.sendall(packet.encode('utf-8'))
 
 def main():
     global current_point_idx, progress, SCENARIO_step, SCENARIO_cycle
     
-    print(f"Connecting to {HOST}:{PORT}...")
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((HOST, PORT))
-        # Login
-        s.sendall(f"(0{IMEI}BP05)".encode('utf-8'))
-        time.sleep(1)
-
-        while True:
-            # Determine logic based on scenario cycle
-            # 0-50: Normal Driving
-            # 51-60: Stop & Engine Off
-            # 61-65: SOS Alarm
-            # 66-something: Resume
-            
-            SCENARIO_cycle = (SCENARIO_cycle + 1) % 100
-            
-            acc_on = True
-            door_open = False
-            alarm = None
-            speed = 40.0
-            
-            p1 = WAYPOINTS[current_point_idx]
-            p2 = WAYPOINTS[current_point_idx + 1]
-            lat, lng = interpolate(p1, p2, progress)
-            course = get_bearing(p1[0], p1[1], p2[0], p2[1])
-
-            if 40 <= SCENARIO_cycle < 45:
-                # Idling (Traffic / Stop light) - Reduced to 5 cycles (10s)
-                # Verify "Ralenti (Conso)"
-                speed = 0.0
-                acc_on = True 
-            elif 45 <= SCENARIO_cycle < 50:
-                # Parked - Reduced to 5 cycles (10s)
-                speed = 0.0
-                acc_on = False # Engine Off
-                # Dont advance progress
-            elif 50 <= SCENARIO_cycle < 52:
-                # SOS Event! - Reduced to 2 cycles
-                speed = 0.0
-                acc_on = True
-                alarm = 'sos'
-            else:
-                # Driving
-                progress += SPEED_FACTOR
-                if progress >= 1.0:
-                    progress = 0.0
-                    current_point_idx = (current_point_idx + 1) % (len(WAYPOINTS) - 1)
-
-            send_update(s, lat, lng, speed, course, acc_on, door_open, alarm)
-            
-            time.sleep(2) 
-
-    except Exception as e:
-        print(f"Connection error: {e}")
-        time.sleep(5)
-        main()
+    while True:
+        print(f"Connecting to {HOST}:{PORT}...")
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.connect((HOST, PORT))
+            # Login
+            s.sendall(build_login().encode('utf-8'))
+            time.sleep(1)
+
+            while True:
+                # Determine logic based on scenario cycle
+                # 0-50: Normal Driving
+                # 51-60: Stop & Engine Off
+                # 61-65: SOS Alarm
+                # 66-something: Resume
+                
+                SCENARIO_cycle = (SCENARIO_cycle + 1) % 100
+                
+                door_open = False
+                speed, acc_on, alarm, advancing = scenario_state(SCENARIO_cycle)
+                
+                p1 = WAYPOINTS[current_point_idx]
+                p2 = WAYPOINTS[current_point_idx + 1]
+                lat, lng = interpolate(p1, p2, progress)
+                course = get_bearing(p1[0], p1[1], p2[0], p2[1])
+
+                if advancing:
+                    progress += SPEED_FACTOR
+                    if progress >= 1.0:
+                        progress = 0.0
+                        current_point_idx = (current_point_idx + 1) % (len(WAYPOINTS) - 1)
+
+                send_update(s, lat, lng, speed, course, acc_on, door_open, alarm)
+                
+                time.sleep(2) 
+
+        except Exception as e:
+            # Reconnect in the loop (no recursion, so long runs can't hit the recursion limit)
+            print(f"Connection error: {e}")
+            time.sleep(5)
 
 if __name__ == '__main__':
     main()
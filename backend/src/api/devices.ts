@@ -5,11 +5,31 @@ import { parseTK103 } from '../parser/tk103';
 
 const router = Router();
 
+// Latest-position store of the Python gateway (gps_gateway.py --positions-snapshot).
+// When set, the fleet list comes from its in-memory index instead of the positions table.
+// The gateway re-reads device registrations every --positions-refresh seconds (default 60),
+// so a device added below shows up there within that interval.
+const POSITION_STORE_URL = process.env.POSITION_STORE_URL;
+// Shared secret the gateway requires on /fleet (its --fleet-token / POSITION_STORE_TOKEN).
+const POSITION_STORE_TOKEN = process.env.POSITION_STORE_TOKEN;
+
 // GET all devices for the tenant
 // GET all devices for the tenant with latest position
 router.get('/', authenticateToken, async (req: AuthRequest, res) => {
     try {
         const tenantId = req.user.tenantId;
+        if (POSITION_STORE_URL && POSITION_STORE_TOKEN) {
+            try {
+                const response = await fetch(`${POSITION_STORE_URL}/fleet?tenant=${encodeURIComponent(tenantId)}`, {
+                    headers: { Authorization: `Bearer ${POSITION_STORE_TOKEN}` },
+                });
+                if (response.ok) {
+                    return res.json(await response.json());
+                }
+            } catch (err) {
+                console.error('Position store unavailable, falling back to SQL:', err);
+            }
+        }
         // Get devices and their latest position (efficiently handling the join)
         // We use a correlated subquery in the join condition or just a simple join if we assume the latest position is what we want.
         // A robust way for MySQL:
@@ -1,4 +1,5 @@
 import { Router } from 'express';
+import { once } from 'events';
 import { authenticateToken, AuthRequest } from '../middleware/auth';
 import { query } from '../db';
 
@@ -31,6 +32,79 @@ router.get('/:deviceId/history', authenticateToken, async (req: AuthRequest, res
     }
 });
 
+const EXPORT_PAGE_SIZE = 5000;
+const EXPORT_MAX_PAGE_SIZE = 50000;
+
+// STREAM History for a device as NDJSON (one position per line), any window length.
+// Pages are read with a keyset cursor on (timestamp, id), so each page is an index range
+// scan (idx_positions_device_time) and memory stays at one page on both ends.
+// Resume an interrupted export with ?after=<timestamp>,<id> of the last row received.
+router.get('/:deviceId/history/export', authenticateToken, async (req: AuthRequest, res) => {
+    const { deviceId } = req.params;
+    const { start, end, after } = req.query;
+    const pageSize = Math.min(parseInt(req.query.page_size as string) || EXPORT_PAGE_SIZE, EXPORT_MAX_PAGE_SIZE);
+
+    let afterTime: Date | null = null;
+    let afterId = 0;
+    if (after) {
+        const comma = (after as string).lastIndexOf(',');
+        afterTime = new Date((after as string).slice(0, comma));
+        afterId = parseInt((after as string).slice(comma + 1)) || 0;
+        if (comma === -1 || isNaN(afterTime.getTime())) {
+            return res.status(400).json({ error: 'after must be <timestamp>,<id>' });
+        }
+    }
+
+    let closed = false;
+    req.on('close', () => { closed = true; });
+
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    let rows = 0;
+    try {
+        while (!closed) {
+            let sql = 'SELECT * FROM positions WHERE device_id = ? AND (lat != 0 AND lng != 0)';
+            const params: any[] = [deviceId];
+            if (start && end) {
+                sql += ' AND timestamp BETWEEN ? AND ?';
+                params.push(new Date(start as string), new Date(end as string));
+            }
+            if (afterTime) {
+                sql += ' AND (timestamp > ? OR (timestamp = ? AND id > ?))';
+                params.push(afterTime, afterTime, afterId);
+            }
+            sql += ' ORDER BY timestamp ASC, id ASC LIMIT ?';
+            params.push(pageSize);
+
+            const page = (await query(sql, params)).rows as any[];
+            if (page.length === 0) break;
+
+            let chunk = '';
+            for (const row of page) {
+                chunk += JSON.stringify(row) + '\n';
+            }
+            rows += page.length;
+            // Respect client backpressure: do not read the next page until this one is flushed
+            if (!res.write(chunk)) {
+                await Promise.race([once(res, 'drain'), once(res, 'close')]);
+            }
+
+            if (page.length < pageSize) break;
+            const last = page[page.length - 1];
+            afterTime = last.timestamp;
+            afterId = last.id;
+        }
+        res.end();
+    } catch (err) {
+        console.error(`Error exporting history for ${deviceId} after ${rows} rows:`, err);
+        if (!res.headersSent) {
+            res.status(500).json({ error: 'Failed to export history' });
+        } else {
+            // Truncated stream: the client sees no terminating newline / a reset connection
+            res.destroy(err as Error);
+        }
+    }
+});
+
 // DELETE History for a device
 router.delete('/:deviceId/history', authenticateToken, async (req: AuthRequest, res) => {
     const { deviceId } = req.params;
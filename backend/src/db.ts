@@ -164,6 +164,8 @@ const initTables = async () => {
         try { await query("ALTER TABLE devices ADD COLUMN state_start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP"); } catch { }
         try { await query("ALTER TABLE devices ADD COLUMN tenant_id INT"); } catch { }
         try { await query("ALTER TABLE users ADD COLUMN phone VARCHAR(20)"); } catch { }
+        // Keyset pagination of history exports (device_id, timestamp, id)
+        try { await query("CREATE INDEX idx_positions_device_time ON positions (device_id, timestamp, id)"); } catch { }
 
         console.log('[DB] Tables initialized (MySQL)');
     } catch (err) {
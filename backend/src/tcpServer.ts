@@ -3,6 +3,8 @@ import { pool } from './db';
 import { parseTK103 } from './parser/tk103';
 
 const PORT = 5001;
+// Per-packet logging is synchronous stdout I/O on every message: opt in with DEBUG_PACKETS=1
+const DEBUG_PACKETS = process.env.DEBUG_PACKETS === '1';
 let ioInstance: any = null;
 
 const server = net.createServer((socket) => {
@@ -12,7 +14,7 @@ const server = net.createServer((socket) => {
         const rawString = data.toString();
         const timestamp = new Date();
 
-        console.log(`[${timestamp.toISOString()}] Received: ${rawString}`);
+        if (DEBUG_PACKETS) console.log(`[${timestamp.toISOString()}] Received: ${rawString}`);
 
         // 1. Raw Logging (Vacuum Mode)
         try {
@@ -28,7 +30,7 @@ const server = net.createServer((socket) => {
         const parsed = parseTK103(rawString);
 
         if (parsed) {
-            console.log(`   [PARSED] ${parsed.deviceId} | Type: ${parsed.type} | Lat: ${parsed.lat?.toFixed(6)} | Lng: ${parsed.lng?.toFixed(6)}`);
+            if (DEBUG_PACKETS) console.log(`   [PARSED] ${parsed.deviceId} | Type: ${parsed.type} | Lat: ${parsed.lat?.toFixed(6)} | Lng: ${parsed.lng?.toFixed(6)}`);
 
             if (parsed.type === 'location_update' && parsed.lat !== undefined && parsed.lng !== undefined) {
                 try {
@@ -90,7 +92,7 @@ const server = net.createServer((socket) => {
 
                     await pool.execute(updateDeviceQuery, updateParams);
 
-                    console.log(`   [DB] Updated position for ${parsed.deviceId}`);
+                    if (DEBUG_PACKETS) console.log(`   [DB] Updated position for ${parsed.deviceId}`);
 
                     // 3. Fetch the actual state_start_time from DB (in case state didn't change)
                     const [deviceRows]: any = await pool.query(
@@ -101,7 +103,7 @@ const server = net.createServer((socket) => {
                     const actualStateStartTime = deviceRows[0]?.state_start_time || parsed.timestamp;
                     // Always convert to ISO string - MySQL returns Date-like objects
                     const stateStartTimeISO = new Date(actualStateStartTime).toISOString();
-                    console.log(`   [DEBUG] State: ${newState}, DB state_start_time: ${deviceRows[0]?.state_start_time}, ISO: ${stateStartTimeISO}`);
+                    if (DEBUG_PACKETS) console.log(`   [DEBUG] State: ${newState}, DB state_start_time: ${deviceRows[0]?.state_start_time}, ISO: ${stateStartTimeISO}`);
 
                     // 4. Emit Real-Time Event
                     if (ioInstance) {
@@ -120,7 +122,7 @@ const server = net.createServer((socket) => {
                             tripDistance: parsed.tripDistance || 0,
                             lastUpdate: parsed.timestamp
                         });
-                        console.log(`   [SOCKET] Emitted position for ${parsed.deviceId}`);
+                        if (DEBUG_PACKETS) console.log(`   [SOCKET] Emitted position for ${parsed.deviceId}`);
                     }
 
                 } catch (err) {
@@ -133,13 +135,13 @@ const server = net.createServer((socket) => {
                         'UPDATE devices SET last_seen = ?, status = ?, internet_status = ? WHERE device_id = ?',
                         [parsed.timestamp, 'online', true, parsed.deviceId]
                     );
-                    console.log(`   [DB] Updated heartbeat for ${parsed.deviceId}`);
+                    if (DEBUG_PACKETS) console.log(`   [DB] Updated heartbeat for ${parsed.deviceId}`);
                 } catch (err) {
                     console.error('Error saving heartbeat:', err);
                 }
             }
         } else {
-            console.log('   [WARN] Could not parse message.');
+            if (DEBUG_PACKETS) console.log('   [WARN] Could not parse message.');
         }
 
         // 4. Specific Protocol Responses (Legacy/BP05)
@@ -0,0 +1,34 @@
+import unittest
+
+from bench_universal_parser import allowed_slowdown, compare, noise_of
+
+
+def result(cost, noise=0.0, samples=7, allocs=5.0):
+    return {'relative_cost': cost, 'noise': noise, 'samples': samples, 'allocs_per_msg': allocs, 'ns_per_msg': 1000.0}
+
+
+class TestRegressionGate(unittest.TestCase):
+    def test_noise_of(self):
+        self.assertEqual(noise_of([10.0]), 0.0)
+        self.assertEqual(noise_of([10.0, 10.0, 10.0]), 0.0)
+        self.assertAlmostEqual(noise_of([9.0, 10.0, 11.0]), 0.14826)
+
+    def test_threshold_and_noise_allowance(self):
+        baseline = {'results': {'hq': result(10.0), 'standard': result(10.0, noise=0.2, samples=2)}}
+        # Within the threshold
+        self.assertEqual(compare({'hq': result(12.0)}, baseline, 0.25), [])
+        self.assertEqual([family for family, _ in compare({'hq': result(13.0)}, baseline, 0.25)], ['hq'])
+        # A noisy two-sample baseline widens the allowance past the threshold
+        allowed = allowed_slowdown(result(13.0, noise=0.2, samples=2), baseline['results']['standard'], 0.25)
+        self.assertGreater(allowed, 0.5)
+        self.assertEqual(compare({'standard': result(13.0, noise=0.2, samples=2)}, baseline, 0.25), [])
+
+    def test_allocations(self):
+        baseline = {'results': {'hq': result(10.0, allocs=4.0)}}
+        self.assertEqual(compare({'hq': result(10.0, allocs=5.4)}, baseline, 0.25), [])
+        self.assertEqual(len(compare({'hq': result(10.0, allocs=6.0)}, baseline, 0.25)), 1)
+        self.assertEqual(compare({'corpus': result(99.0)}, baseline, 0.25), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import sqlite3
+import unittest
+
+from device_state_engine import DeviceStateEngine, MOVING, IDLING, PARKED
+from gps_gateway import SQLiteSink
+from universal_gps_parser import UniversalGPSParser
+
+IMEI = "359586018966098"
+
+
+def hq(second, speed, state):
+    return UniversalGPSParser.parse_message(
+        f"*HQ,{IMEI},V1,1235{second:02d},A,3123.1234,N,00433.9876,E,{speed},90.00,231023,{state}#", record=True
+    )
+
+
+class TestDeviceStateEngine(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.executescript(SQLiteSink.SCHEMA)
+        self.conn.execute("INSERT INTO devices (device_id) VALUES (?)", (IMEI,))
+        self.engine = DeviceStateEngine()
+
+    def test_transitions(self):
+        events = self.engine.apply_many([
+            hq(0, '40.00', '00000001'),
+            hq(1, '50.00', '00000001'),
+            hq(2, '0.00', '00000001'),
+            hq(3, '0.00', '00000000'),
+        ])
+        self.assertEqual([(e['previous'], e['state']) for e in events],
+                         [(None, MOVING), (MOVING, IDLING), (IDLING, PARKED)])
+        device = self.engine.get(IMEI)
+        self.assertEqual(device.state, PARKED)
+        self.assertEqual(device.state_start, 1698064503)
+        self.assertEqual(self.engine.state_of(IMEI, now=1698064513)['state_duration'], 10)
+
+    def test_stale_fix_and_heartbeat(self):
+        self.engine.apply(hq(5, '40.00', '00000001'))
+        self.assertIsNone(self.engine.apply(hq(4, '0.00', '00000000')))
+        self.assertEqual(self.engine.get(IMEI).state, MOVING)
+        self.assertIsNone(self.engine.apply(UniversalGPSParser.parse_message(f"{IMEI};")))
+        self.assertEqual(self.engine.stats['stale'], 1)
+        self.assertEqual(self.engine.stats['heartbeats'], 1)
+
+    def test_heartbeat_then_fix_with_device_clock_behind(self):
+        # Heartbeats carry server time, here an hour ahead of the device clock
+        now = 1698064500 + 3600
+        self.engine.apply(hq(0, '40.00', '00000001'), now=now)
+        self.engine.apply(UniversalGPSParser.parse_message(f"{IMEI};"), now=now)
+        event = self.engine.apply(hq(1, '0.00', '00000000'), now=now + 1)
+        self.assertEqual((event['previous'], event['state']), (MOVING, PARKED))
+        device = self.engine.get(IMEI)
+        self.assertEqual((device.last_fix_at, device.last_seen), (1698064501, now))
+        self.assertEqual(self.engine.stats['stale'], 0)
+
+    def test_flush_and_load(self):
+        self.engine.apply(hq(0, '40.00', '00000001'))
+        self.assertEqual(self.engine.flush(self.conn), 1)
+        # No transition and no snapshot due: nothing to write
+        self.engine.apply(hq(1, '45.00', '00000001'))
+        self.assertEqual(self.engine.flush(self.conn), 0)
+        self.assertEqual(self.engine.flush(self.conn, snapshot=True), 1)
+
+        row = self.conn.execute(
+            "SELECT current_state, state_start_time, last_seen FROM devices WHERE device_id = ?", (IMEI,)
+        ).fetchone()
+        self.assertEqual(row, (MOVING, '2023-10-23 12:35:00', '2023-10-23 12:35:01'))
+
+        restarted = DeviceStateEngine()
+        self.assertEqual(restarted.load(self.conn), 1)
+        self.assertIsNone(restarted.apply(hq(2, '60.00', '00000001')))
+        self.assertEqual(restarted.get(IMEI).state_start, 1698064500)
+
+    def test_load_unreported_device_accepts_earlier_fixes(self):
+        # Registered after the fixes it buffered were taken
+        self.conn.execute("UPDATE devices SET state_start_time = '2023-10-24 08:00:00' WHERE device_id = ?", (IMEI,))
+        engine = DeviceStateEngine()
+        engine.load(self.conn)
+        self.assertIsNone(engine.get(IMEI).last_fix_at)
+        event = engine.apply(hq(0, '40.00', '00000001'))
+        self.assertEqual((event['previous'], event['state']), (PARKED, MOVING))
+        self.assertEqual(engine.stats['stale'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from fix_deduplicator import FixDeduplicator
+from gps_gateway import DedupSink, MemorySink
+from universal_gps_parser import GPSFix, UniversalGPSParser
+
+IMEI = "359586018966098"
+START = 1698064500
+
+
+def fix(second, lat=33.57, lng=-7.59, valid=True, imei=IMEI):
+    flags = GPSFix.FLAG_GPS_VALID if valid else 0
+    return GPSFix('location_update', 'hq', imei, START + second, lat, lng, 40.0, 0.0, flags)
+
+
+def seconds(fixes):
+    return [f.timestamp - START for f in fixes]
+
+
+class TestFixDeduplicator(unittest.TestCase):
+    def test_drops_duplicates_and_invalid(self):
+        dedupe = FixDeduplicator(window=0)
+        released = dedupe.push_many([
+            fix(0), fix(0), fix(1, lat=0, lng=0), fix(2, valid=False), fix(3, lat=95), fix(4),
+        ])
+        self.assertEqual(seconds(released), [0, 4])
+        self.assertEqual(dedupe.stats['duplicates'], 1)
+        self.assertEqual(dedupe.stats['invalid'], 3)
+
+    def test_reorders_within_window(self):
+        dedupe = FixDeduplicator(window=10)
+        released = dedupe.push_many([fix(0), fix(5), fix(2), fix(8), fix(5), fix(12)])
+        self.assertEqual(seconds(released), [0, 2])
+        released += dedupe.push(fix(30))
+        self.assertEqual(seconds(released), [0, 2, 5, 8, 12])
+        self.assertEqual(dedupe.stats['reordered'], 1)
+        self.assertEqual(dedupe.stats['duplicates'], 1)
+
+        # Older than what was already released: passed through as late
+        self.assertEqual(seconds(dedupe.push(fix(1))), [1])
+        self.assertEqual(dedupe.stats['late'], 1)
+        self.assertEqual(seconds(dedupe.flush()), [30])
+
+    def test_heartbeats_pass_and_quiet_devices_expire(self):
+        dedupe = FixDeduplicator(window=10)
+        heartbeat = UniversalGPSParser.parse_message(f"{IMEI};", record=True)
+        self.assertEqual(dedupe.push(heartbeat), [heartbeat])
+        self.assertEqual(dedupe.push(fix(0), now=100.0), [])
+        self.assertEqual(dedupe.release_expired(now=105.0), [])
+        self.assertEqual(seconds(dedupe.release_expired(now=110.0)), [0])
+
+    def test_expiry_only_visits_due_devices(self):
+        dedupe = FixDeduplicator(window=10)
+        for i in range(100):
+            dedupe.push(fix(0, imei=f"35958600000{i:04d}"), now=100.0 + i)
+        self.assertEqual(len(dedupe._deadlines), 100)
+        self.assertEqual(dedupe.release_expired(now=109.0), [])
+        self.assertEqual([f.imei for f in dedupe.release_expired(now=111.0)],
+                         ["359586000000000", "359586000000001"])
+        self.assertEqual(len(dedupe._deadlines), 98)
+
+        # A device heard from again gets its deadline moved, not a second entry
+        dedupe.push(fix(1, imei="359586000000002"), now=111.0)
+        self.assertEqual(len(dedupe._deadlines), 98)
+        self.assertNotIn("359586000000002", [f.imei for f in dedupe.release_expired(now=112.5)])
+        self.assertEqual(seconds(f for f in dedupe.release_expired(now=121.0) if f.imei == "359586000000002"), [0, 1])
+
+        # Forgotten devices leave a dead entry that is skipped
+        dedupe.forget("359586000000050")
+        dedupe.push(fix(5, imei="359586000000050"), now=200.0)
+        released = dedupe.release_expired(now=209.5)
+        self.assertNotIn("359586000000050", [f.imei for f in released])
+        self.assertEqual(len(released), 87)  # devices 12..99 but 50
+        self.assertEqual(seconds(dedupe.release_expired(now=210.0)), [5])
+        self.assertEqual(dedupe._deadlines, [])
+
+    def test_bounded_memory(self):
+        dedupe = FixDeduplicator(window=1000, history=8, max_pending=4)
+        released = dedupe.push_many([fix(i) for i in range(20)])
+        self.assertEqual(seconds(released), list(range(16)))
+        device = dedupe.devices[IMEI]
+        self.assertEqual(len(device.ring), 8)
+        self.assertEqual(len(device.seen), 8)
+        self.assertEqual(dedupe.pending(), 4)
+
+    def test_dedup_sink(self):
+        memory = MemorySink(keep=True)
+        sink = DedupSink(memory, FixDeduplicator(window=5))
+        sink.write([], [fix(0), fix(0), fix(3)])
+        sink.write([], [fix(2), fix(10)])
+        self.assertEqual(seconds(memory.stored), [0, 2, 3])
+        sink.close()
+        self.assertEqual(seconds(memory.stored), [0, 2, 3, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
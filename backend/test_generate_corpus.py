@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from generate_corpus import generate
+except ImportError:  # numpy is optional
+    np = None
+from universal_gps_parser import UniversalGPSParser
+
+
+@unittest.skipIf(np is None, "generate_corpus needs NumPy")
+class TestGenerateCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def corpus(self, name, **kwargs):
+        path = os.path.join(self.tmp.name, name)
+        written = generate(path, devices=20, steps=150, compression='none', block_steps=64, **kwargs)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(written, len(lines))
+        return lines
+
+    def test_same_seed_same_corpus(self):
+        first = self.corpus('a.txt', seed=5, malformed=0.05)
+        self.assertEqual(len(first), 20 * 150)
+        self.assertEqual(self.corpus('b.txt', seed=5, malformed=0.05), first)
+        self.assertNotEqual(self.corpus('c.txt', seed=6, malformed=0.05), first)
+
+    def test_every_packet_parses_in_time_order(self):
+        results = [UniversalGPSParser.parse_message(line, record=True) for line in self.corpus('a.txt')]
+        self.assertNotIn(None, results)
+        times = [fix.timestamp for fix in results if fix.timestamp is not None]
+        self.assertGreater(len(times), len(results) // 2)
+        self.assertEqual(times, sorted(times))
+
+    def test_malformed_share(self):
+        lines = self.corpus('a.txt', malformed=0.2)
+        parsed = sum(1 for line in lines if UniversalGPSParser.parse_message(line) is not None)
+        # Some corruptions still parse (e.g. a changed digit), so the rate is at least 1 - malformed
+        self.assertGreaterEqual(parsed / len(lines), 0.8)
+        self.assertLess(parsed, len(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
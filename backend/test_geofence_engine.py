@@ -0,0 +1,68 @@
+import random
+import unittest
+
+from geofence_engine import CircleFence, GeofenceEngine, GeofenceIndex, PolygonFence
+from universal_gps_parser import GPSFix
+
+IMEI = "359586018966098"
+DEPOT = [(33.570, -7.600), (33.570, -7.580), (33.590, -7.580), (33.590, -7.600), (33.570, -7.600)]
+
+
+def fix(second, lat, lng, valid=True, imei=IMEI):
+    flags = GPSFix.FLAG_GPS_VALID | GPSFix.FLAG_ACC if valid else GPSFix.FLAG_ACC
+    return GPSFix('location_update', 'hq', imei, 1698064500 + second, lat, lng, 40.0, 0.0, flags)
+
+
+class TestGeofenceEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = GeofenceEngine(device_tenants={IMEI: 1})
+        self.engine.add_fence(PolygonFence('depot', 1, DEPOT))
+        self.engine.add_fence(CircleFence('client', 1, 33.60, -7.59, 500))
+        self.engine.add_fence(PolygonFence('other-tenant', 2, DEPOT))
+
+    def test_contains(self):
+        depot = PolygonFence('depot', 1, DEPOT)
+        self.assertTrue(depot.contains(33.58, -7.59))
+        self.assertFalse(depot.contains(33.60, -7.59))
+        circle = CircleFence('client', 1, 33.60, -7.59, 500)
+        self.assertTrue(circle.contains(33.604, -7.59))
+        self.assertFalse(circle.contains(33.605, -7.59))
+
+    def test_enter_exit(self):
+        events = self.engine.apply_many([
+            fix(0, 33.56, -7.59),
+            fix(10, 33.58, -7.59),
+            fix(20, 33.585, -7.59),
+            fix(30, 33.70, -7.59, valid=False),  # jitter: ignored
+            fix(40, 33.601, -7.59),
+        ])
+        self.assertEqual([(e['event'], e['fence_id']) for e in events],
+                         [('enter', 'depot'), ('exit', 'depot'), ('enter', 'client')])
+        self.assertEqual(events[0]['alarm'], 'geofence')
+        self.assertEqual(events[0]['at'], 1698064510)
+        self.assertEqual([fence.fence_id for fence in self.engine.fences_of(IMEI)], ['client'])
+
+    def test_tenant_isolation_and_removal(self):
+        events = self.engine.apply(fix(0, 33.58, -7.59, imei="359586000000001"))
+        self.assertEqual(events, [])
+        self.engine.apply(fix(0, 33.58, -7.59))
+        self.engine.remove_fence('depot')
+        self.assertEqual(self.engine.fences_of(IMEI), [])
+        self.assertEqual(self.engine.apply(fix(10, 33.56, -7.59)), [])
+
+    def test_many_fences(self):
+        rng = random.Random(1)
+        index = GeofenceIndex()
+        for i in range(2000):
+            lat, lng = 33.5 + rng.random(), -8.0 + rng.random()
+            index.add(CircleFence(i, 1, lat, lng, rng.uniform(100, 1000)))
+        engine = GeofenceEngine(index, {f"3595860000{i:05d}": 1 for i in range(1000)})
+        fixes = [fix(i, 33.5 + rng.random(), -8.0 + rng.random(), imei=f"3595860000{i % 1000:05d}")
+                 for i in range(20000)]
+        engine.apply_many(fixes)
+        expected = sum(1 for f in fixes[-1000:] for fence in index.fences.values() if fence.contains(f.latitude, f.longitude))
+        self.assertEqual(sum(len(engine.inside[imei]) for imei in engine.inside), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
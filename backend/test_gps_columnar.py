@@ -0,0 +1,56 @@
+import unittest
+
+try:
+    import numpy as np
+    from gps_columnar import decode_ddmm, decode_hq_time, decode_messages, decode_standard_time, to_epoch
+except ImportError:  # numpy is optional
+    np = None
+from universal_gps_parser import UniversalGPSParser
+
+HQ = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000003#"
+STANDARD = "imei:359586018966098,help me,231023123519,,F,123519,A,3123.1234,S,00433.9876,W,12.5,180.0,0.0,acc on;"
+
+
+@unittest.skipIf(np is None, "gps_columnar needs NumPy")
+class TestGPSColumnar(unittest.TestCase):
+    def test_decode_ddmm(self):
+        values = decode_ddmm(['3123.1234', '00433.9876', '', '3123.1234'], ['N', 'W', 'N', ''])
+        self.assertAlmostEqual(values[0], UniversalGPSParser._convert_ddmm_to_decimal('3123.1234', 'N'))
+        self.assertAlmostEqual(values[1], UniversalGPSParser._convert_ddmm_to_decimal('00433.9876', 'W'))
+        self.assertTrue(np.isnan(values[2]))
+        self.assertTrue(np.isnan(values[3]))
+
+    def test_decode_times(self):
+        hq = decode_hq_time(['231023', '311399', '', '231023', '2310', '231023'],
+                            ['123519', '000000', '123519', '1235', '123519', '0123519'])
+        self.assertEqual(hq[0], np.datetime64('2023-10-23T12:35:19'))
+        self.assertTrue(np.isnat(hq[1:]).all())
+
+        standard = decode_standard_time(['231023123519', '2310231235', '23102312'])
+        self.assertEqual(standard[0], np.datetime64('2023-10-23T12:35:19'))
+        self.assertEqual(standard[1], np.datetime64('2023-10-23T12:35:00'))
+        self.assertTrue(np.isnat(standard[2]))
+        self.assertEqual(to_epoch(standard).tolist(), [1698064519, 1698064500, -1])
+
+    def test_decode_messages_matches_parser(self):
+        messages = [HQ, "359586018966098;", STANDARD.encode(), HQ.replace(',A,', ',V,'), "GET / HTTP/1.1",
+                    HQ.replace(',A,', ',F,'), HQ.replace(',123519,', ',1235,').encode()]
+        fixes = decode_messages(messages)
+        self.assertEqual(fixes.index.tolist(), [0, 2, 3, 5, 6])
+
+        for row in fixes:
+            expected = UniversalGPSParser.parse_message(messages[row.index], record=True)
+            self.assertEqual(row.imei, expected.imei)
+            self.assertEqual(to_epoch(row.timestamp), -1 if expected.timestamp is None else expected.timestamp)
+            self.assertAlmostEqual(row.latitude, expected.latitude)
+            self.assertAlmostEqual(row.longitude, expected.longitude)
+            self.assertAlmostEqual(row.speed, expected.speed)
+            self.assertAlmostEqual(row.course, expected.course)
+            self.assertEqual(row.gps_valid, expected.gps_valid)
+            self.assertEqual(row.acc_status, expected.acc_status)
+            self.assertEqual(row.door_status, expected.door_status)
+            self.assertEqual(row.alarm, expected.alarm or '')
+
+
+if __name__ == '__main__':
+    unittest.main()
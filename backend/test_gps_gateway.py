@@ -0,0 +1,102 @@
+import json
+import asyncio
+import unittest
+
+from gps_gateway import GPSGateway, MemorySink, SQLiteSink
+from latest_position_store import LatestPositionStore
+from universal_gps_parser import UniversalGPSParser
+
+HQ = b"*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000001#"
+LOGIN = b"(0359586018966098BP05)"
+
+
+class TestGPSGateway(unittest.IsolatedAsyncioTestCase):
+
+    async def _run_client(self, gateway, chunks, expect_reply=True):
+        reader, writer = await asyncio.open_connection('127.0.0.1', gateway.port)
+        reply = None
+        for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+            if expect_reply and reply is None:
+                reply = await asyncio.wait_for(reader.readexactly(len(b"(AP05)")), 2)
+        writer.close()
+        await writer.wait_closed()
+        return reply
+
+    async def test_login_reply_and_coalesced_frames(self):
+        sink = MemorySink(keep=True)
+        gateway = await GPSGateway(sink, '127.0.0.1', 0, workers=2).start()
+        reply = await self._run_client(gateway, [LOGIN, HQ * 3 + HQ[:30], HQ[30:] + b"359586018966098;"])
+        await asyncio.sleep(0.1)
+        await gateway.stop()
+
+        self.assertEqual(reply, b"(AP05)")
+        self.assertEqual(gateway.stats['logins'], 1)
+        self.assertEqual(sink.fixes, 5)
+        self.assertEqual(sum(1 for fix in sink.stored if fix.type == 'location_update'), 4)
+        self.assertEqual(gateway.stats['invalid'], 1)
+
+    async def _get(self, port, target, headers=b''):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET %s HTTP/1.1\r\nHost: localhost\r\n%s\r\n' % (target, headers))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        status, _, body = response.partition(b'\r\n\r\n')
+        return int(status.split(b' ')[1]), body
+
+    async def test_fleet_requires_token(self):
+        positions = LatestPositionStore()
+        positions.register('359586018966098', 1)
+        gateway = GPSGateway(MemorySink(), '127.0.0.1', 0, positions=positions, fleet_token='s3cret')
+        server = await gateway.start_metrics(port=0)
+        self.assertEqual(server.sockets[0].getsockname()[0], '127.0.0.1')
+        port = server.sockets[0].getsockname()[1]
+        try:
+            self.assertEqual((await self._get(port, b'/fleet?tenant=1'))[0], 401)
+            self.assertEqual((await self._get(port, b'/fleet?tenant=1', b'Authorization: Bearer wrong\r\n'))[0], 401)
+            status, body = await self._get(port, b'/fleet?tenant=1', b'authorization: Bearer s3cret\r\n')
+            self.assertEqual(status, 200)
+            self.assertEqual([row['device_id'] for row in json.loads(body)], ['359586018966098'])
+
+            gateway.fleet_token = None  # no token configured: /fleet stays closed
+            self.assertEqual((await self._get(port, b'/fleet?tenant=1', b'Authorization: Bearer s3cret\r\n'))[0], 401)
+            self.assertEqual((await self._get(port, b'/metrics'))[0], 200)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    async def test_sqlite_sink(self):
+        sink = SQLiteSink(':memory:')
+        sink.conn.execute("INSERT INTO devices (device_id, name) VALUES ('359586018966098', 'HQ Tracker')")
+        gateway = await GPSGateway(sink, '127.0.0.1', 0).start()
+        await self._run_client(gateway, [HQ + HQ], expect_reply=False)
+        await asyncio.sleep(0.1)
+        await gateway.stop()
+
+        positions = sink.conn.execute("SELECT COUNT(*), MAX(timestamp) FROM positions").fetchone()
+        self.assertEqual(positions, (2, '2023-10-23 12:35:19'))
+        self.assertEqual(sink.conn.execute("SELECT COUNT(*) FROM raw_logs").fetchone()[0], 2)
+        device = sink.conn.execute("SELECT status, last_seen FROM devices").fetchone()
+        self.assertEqual(device, ('online', '2023-10-23 12:35:19'))
+        sink.close()
+
+    def test_sqlite_sink_out_of_order_batches(self):
+        sink = SQLiteSink(':memory:')
+        sink.conn.execute("INSERT INTO devices (device_id) VALUES ('359586018966098')")
+        older = HQ.replace(b'123519', b'120000')
+        # Two workers: the newer batch lands first
+        for frame in (HQ, older):
+            results, _ = UniversalGPSParser.parse_many([frame], record=True)
+            sink.write([frame], results)
+        sink.write([b"GET / HTTP/1.1"], [])
+
+        self.assertEqual(sink.conn.execute("SELECT last_seen FROM devices").fetchone()[0], '2023-10-23 12:35:19')
+        self.assertEqual(sink.conn.execute("SELECT device_id FROM raw_logs ORDER BY id").fetchall(),
+                         [('359586018966098',), ('359586018966098',), (None,)])
+        sink.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from gps_stream_framer import GPSStreamFramer
+from universal_gps_parser import UniversalGPSParser
+
+HQ = b"*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,00000001#"
+STD = b"imei:359586018966098,tracker,231023123519,,F,123519,A,3123.1234,N,00433.9876,E,12.5,;"
+LOGIN = b"(0359586018966098BP05)"
+HEARTBEAT = b"359586018966098;"
+COMMAND = b"##,imei:359586018966098,A;"
+
+
+class TestGPSStreamFramer(unittest.TestCase):
+
+    def setUp(self):
+        self.framer = GPSStreamFramer()
+
+    def test_coalesced_frames(self):
+        chunk = LOGIN + HQ + STD + HEARTBEAT + COMMAND + HQ
+        frames = self.framer.feed(chunk)
+        self.assertEqual(frames, [LOGIN, HQ, STD, HEARTBEAT, COMMAND, HQ])
+        self.assertEqual(self.framer.buffer, bytearray())
+
+    def test_split_frames_byte_by_byte(self):
+        stream = HQ + STD + LOGIN + HEARTBEAT
+        frames = []
+        for i in range(len(stream)):
+            frames.extend(self.framer.feed(stream[i:i + 1]))
+        self.assertEqual(frames, [HQ, STD, LOGIN, HEARTBEAT])
+
+    def test_missing_terminator_cut_at_next_frame(self):
+        frames = self.framer.feed(b"##,imei:359586018966098,A" + HQ)
+        self.assertEqual(frames, [b"##,imei:359586018966098,A", HQ])
+
+    def test_newline_delimited(self):
+        frames = self.framer.feed(b"123456789012345\r\n" + HQ + b"\n")
+        self.assertEqual(frames, [b"123456789012345", HQ])
+
+    def test_flush_returns_unterminated_frame(self):
+        self.assertEqual(self.framer.feed(b"123456789012345"), [])
+        self.assertEqual(self.framer.flush(), [b"123456789012345"])
+        self.assertEqual(self.framer.flush(), [])
+
+    def test_garbage_is_skipped(self):
+        frames = self.framer.feed(b"\x00\xffGET / HTTP/1.1\r\n" + HQ)
+        self.assertEqual(frames, [HQ])
+        self.assertGreater(self.framer.discarded_bytes, 0)
+
+    def test_buffer_is_bounded(self):
+        framer = GPSStreamFramer(max_frame_size=128)
+        framer.feed(b"*HQ," + b"A" * 1000)
+        self.assertLessEqual(len(framer.buffer), 128)
+        self.assertEqual(framer.feed(HQ), [HQ])
+        for _ in range(100):
+            framer.feed(b"\xfe" * 1000)
+        self.assertLessEqual(len(framer.buffer), 128)
+
+    def test_frames_parse_in_one_batch(self):
+        frames = self.framer.feed(HQ + STD + HQ[:20])
+        frames += self.framer.feed(HQ[20:])
+        results, summary = UniversalGPSParser.parse_many(frames)
+        self.assertEqual(summary, {'hq': 2, 'standard': 1})
+        self.assertTrue(all(r['imei'] == '359586018966098' for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
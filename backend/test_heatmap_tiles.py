@@ -0,0 +1,125 @@
+import random
+import unittest
+
+from heatmap_tiles import HeatmapTiles, tile_bounds, tile_of
+from universal_gps_parser import GPSFix
+
+START = 1698019200  # 2023-10-23 00:00:00 UTC
+
+
+def fix(imei, second, lat, lng, valid=True):
+    return GPSFix('location_update', 'hq', imei, START + second, lat, lng, 30.0, 0.0,
+                  GPSFix.FLAG_GPS_VALID if valid else 0)
+
+
+def totals(heatmap, tenant_id, day, zoom):
+    count = dwell = 0
+    for tile in heatmap.tiles.get((tenant_id, day, zoom), {}).values():
+        for c, d in tile.values():
+            count += c
+            dwell += d
+    return count, dwell
+
+
+class TestTileMath(unittest.TestCase):
+    def test_tile_of_and_bounds(self):
+        self.assertEqual(tile_of(0.0, 0.0, 1), (1, 1))
+        self.assertEqual(tile_of(51.5074, -0.1278, 10), (511, 340))
+        south, west, north, east = tile_bounds(10, 511, 340)
+        self.assertTrue(south <= 51.5074 <= north and west <= -0.1278 <= east)
+        self.assertEqual(tile_of(89.9, 179.99, 3), (7, 0))
+
+
+class TestHeatmapTiles(unittest.TestCase):
+    def setUp(self):
+        self.heatmap = HeatmapTiles(zooms=(6, 12), cell_bits=4, max_gap=300,
+                                    device_tenants={'111': 1, '222': 1, '333': 2})
+
+    def test_counts_and_dwell(self):
+        heatmap = self.heatmap
+        heatmap.add_many([
+            fix('111', 0, 33.5731, -7.5898),
+            fix('111', 60, 33.5731, -7.5898),
+            fix('111', 100, 33.5900, -7.6100),
+            fix('111', 1000, 33.5900, -7.6100),  # gap > max_gap: no dwell
+            fix('111', 1000, 0.0, 0.0),
+            fix('111', 1010, 33.5, -7.5, valid=False),
+            fix('111', 50, 33.5731, -7.5898),  # late: counted, no dwell
+            fix('333', 0, 33.5731, -7.5898),
+        ])
+        self.assertEqual(totals(heatmap, 1, '2023-10-23', 12), (5, 100))
+        self.assertEqual(totals(heatmap, 2, '2023-10-23', 6), (1, 0))
+        self.assertEqual(heatmap.stats, {'fixes': 6, 'skipped': 2, 'late': 1})
+
+        x, y = tile_of(33.5731, -7.5898, 12)
+        tile = heatmap.tile(1, '2023-10-23', 12, x, y)
+        self.assertEqual(tile['zoom'], 16)
+        self.assertEqual(sorted(cell[2:] for cell in tile['cells']), [[3, 100]])
+
+    def test_tiles_at_other_zooms(self):
+        heatmap = self.heatmap
+        heatmap.add_many([fix('111', 0, 33.5731, -7.5898), fix('222', 0, 33.60, -7.65)])
+        x, y = tile_of(33.5731, -7.5898, 8)
+        tile = heatmap.tile(1, ['2023-10-23', '2023-10-24'], 8, x, y)
+        self.assertEqual(tile['zoom'], 10)  # cut from zoom 6
+        self.assertEqual(sum(cell[2] for cell in tile['cells']), 2)
+
+        x, y = tile_of(33.5731, -7.5898, 18)
+        tile = heatmap.tile(1, '2023-10-23', 18, x, y)
+        self.assertEqual(tile['zoom'], 16)  # coarser than the request
+        self.assertEqual([cell[2] for cell in tile['cells']], [1])
+        self.assertEqual(heatmap.tile(1, '2023-10-23', 4, 0, 0), {'zoom': None, 'cells': []})
+
+    def test_rebuild_matches_incremental(self):
+        rng = random.Random(7)
+        fixes = []
+        for imei in ('111', '222', '333'):
+            second = 86400 - 3600  # crosses midnight
+            for _ in range(400):
+                second += rng.choice((5, 30, 60, 400))
+                fixes.append(fix(imei, second, 33.5 + rng.random() * 0.2, -7.7 + rng.random() * 0.2))
+
+        incremental = HeatmapTiles(zooms=(6, 12), cell_bits=4, device_tenants=self.heatmap.device_tenants)
+        incremental.add_many(fixes)
+        shuffled = list(fixes)
+        rng.shuffle(shuffled)
+        self.assertEqual(self.heatmap.rebuild(shuffled), len(fixes))
+        self.assertEqual(self.heatmap.tiles, incremental.tiles)
+        self.assertEqual(self.heatmap.days(1), ['2023-10-23', '2023-10-24'])
+
+        # Rebuild replaces instead of adding; add() continues from the history
+        self.heatmap.rebuild(fixes)
+        self.assertEqual(self.heatmap.tiles, incremental.tiles)
+        self.assertEqual(self.heatmap.last, incremental.last)
+
+        self.assertEqual(self.heatmap.expire('2023-10-24'), 4)
+        self.assertEqual(self.heatmap.days(1), ['2023-10-24'])
+
+    def test_same_second_fixes_do_not_depend_on_order(self):
+        fixes = [
+            fix('111', 0, 33.5731, -7.5898),
+            fix('111', 60, 33.6000, -7.6000),
+            fix('111', 60, 33.5000, -7.5000),  # same second, different cell
+            fix('111', 120, 33.5731, -7.5898),
+            fix('222', 60, 33.5000, -7.5000),
+            fix('222', 60, 33.5000, -7.5000),
+            fix('222', 90, 33.6000, -7.6000),
+        ]
+        incremental = HeatmapTiles(zooms=(6, 12), cell_bits=4, device_tenants=self.heatmap.device_tenants)
+        incremental.add_many(fixes)
+        swapped = HeatmapTiles(zooms=(6, 12), cell_bits=4, device_tenants=self.heatmap.device_tenants)
+        swapped.add_many([fixes[0], fixes[2], fixes[1]] + fixes[3:])
+        self.assertEqual(swapped.tiles, incremental.tiles)
+
+        rng = random.Random(3)
+        for _ in range(10):
+            shuffled = list(fixes)
+            rng.shuffle(shuffled)
+            rebuilt = HeatmapTiles(zooms=(6, 12), cell_bits=4, device_tenants=self.heatmap.device_tenants)
+            rebuilt.rebuild(shuffled)
+            self.assertEqual(rebuilt.tiles, incremental.tiles)
+            self.assertEqual(rebuilt.last, incremental.last)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,23 @@
-import requests
+import os
+import sys
 import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
+import requests
+from requests.adapters import HTTPAdapter
+
 BASE_URL = 'http://localhost:4000/api'
 EMAIL = 'verify_user@example.com'
 PASSWORD = 'SecurePassword123!'
 DEVICE_ID = '359586018966098'
 
-def get_token():
+def get_token(session=None):
     try:
-        res = requests.post(f"{BASE_URL}/auth/login", json={'email': EMAIL, 'password': PASSWORD})
+        res = (session or requests).post(f"{BASE_URL}/auth/login", json={'email': EMAIL, 'password': PASSWORD})
         if res.status_code == 200:
             return res.json()['token']
         print(f"Login failed: {res.text}")
@@ -18,36 +26,174 @@ def get_token():
         print(f"Connection failed: {e}")
         return None
 
+def make_session(pool_size):
+    """
+    One keep-alive connection pool shared by all export threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def export_device(session, token, device_id, start, end, output_dir=None, page_size=None, retries=2):
+    """
+    Streams one device's history (NDJSON export endpoint) line by line, so
+    memory stays constant whatever the window. An interrupted stream is
+    resumed from the last row received (keyset cursor). Returns a dict:
+    device, rows, seconds, first_row (time to first row), resumes, error.
+    """
+    headers = {'Authorization': f'Bearer {token}'}
+    params = {'start': start, 'end': end}
+    if page_size:
+        params['page_size'] = page_size
+    out = open(os.path.join(output_dir, f"{device_id}.ndjson"), 'w') if output_dir else None
+
+    rows = 0
+    resumes = 0
+    first_row = None
+    started = time.perf_counter()
+    try:
+        while True:
+            try:
+                with session.get(f"{BASE_URL}/devices/{device_id}/history/export", headers=headers,
+                                 params=params, stream=True, timeout=60) as res:
+                    if res.status_code != 200:
+                        return {'device': device_id, 'rows': rows, 'seconds': time.perf_counter() - started,
+                                'first_row': first_row, 'resumes': resumes,
+                                'error': f"{res.status_code} - {res.text[:200]}"}
+                    for line in res.iter_lines():
+                        if not line:
+                            continue
+                        if first_row is None:
+                            first_row = time.perf_counter() - started
+                        row = json.loads(line)
+                        rows += 1
+                        params['after'] = f"{row['timestamp']},{row['id']}"
+                        if out:
+                            out.write(line.decode() + '\n')
+                return {'device': device_id, 'rows': rows, 'seconds': time.perf_counter() - started,
+                        'first_row': first_row, 'resumes': resumes, 'error': None}
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if resumes >= retries:
+                    return {'device': device_id, 'rows': rows, 'seconds': time.perf_counter() - started,
+                            'first_row': first_row, 'resumes': resumes, 'error': str(e)}
+                resumes += 1
+    finally:
+        if out:
+            out.close()
+
+def run_export(devices, start, end, workers=8, output_dir=None, page_size=None, report_interval=5.0):
+    """
+    Exports many devices in parallel over one pooled session and reports
+    rows/s plus per-device latency percentiles.
+    """
+    session = make_session(workers)
+    token = get_token(session)
+    if not token:
+        return None
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    done = threading.Event()
+    started = time.perf_counter()
+
+    def report():
+        while not done.wait(report_interval):
+            rows = sum(r['rows'] for r in results)
+            print(f"[EXPORT] devices={len(results)}/{len(devices)} rows={rows:,} "
+                  f"rows/s={rows / (time.perf_counter() - started):,.0f}")
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_device, session, token, device, start, end, output_dir, page_size)
+                   for device in devices]
+        for future in as_completed(futures):
+            results.append(future.result())
+    done.set()
+
+    elapsed = time.perf_counter() - started
+    ok = [r for r in results if r['error'] is None]
+    rows = sum(r['rows'] for r in results)
+    seconds = [r['seconds'] for r in ok]
+    first_rows = [r['first_row'] for r in ok if r['first_row'] is not None]
+    summary = {
+        'devices': len(devices),
+        'failed': len(results) - len(ok),
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else 0.0,
+        'resumes': sum(r['resumes'] for r in results),
+        'latency_p50': percentile(seconds, 50),
+        'latency_p95': percentile(seconds, 95),
+        'latency_p99': percentile(seconds, 99),
+        'first_row_p50': percentile(first_rows, 50),
+        'first_row_p95': percentile(first_rows, 95),
+    }
+    for r in results:
+        if r['error']:
+            print(f"❌ {r['device']}: {r['error']}")
+    return summary
+
+def print_summary(summary):
+    def ms(value):
+        return f"{value * 1000:,.0f} ms" if value is not None else '-'
+    print(f"Devices: {summary['devices']} ({summary['failed']} failed), rows: {summary['rows']:,}, "
+          f"{summary['rows_per_sec']:,.0f} rows/s over {summary['seconds']:.1f}s, resumes: {summary['resumes']}")
+    print(f"Per-device export: p50 {ms(summary['latency_p50'])}, p95 {ms(summary['latency_p95'])}, "
+          f"p99 {ms(summary['latency_p99'])}")
+    print(f"Time to first row: p50 {ms(summary['first_row_p50'])}, p95 {ms(summary['first_row_p95'])}")
+
 def test_history():
     token = get_token()
     if not token:
         return
 
-    headers = {'Authorization': f'Bearer {token}'}
-    
     # Get history for the last 24 hours + 2 hours ahead (future proofing timezone)
     end_date = datetime.now() + timedelta(hours=2)
     start_date = end_date - timedelta(hours=26)
-    
-    params = {
-        'start': start_date.strftime('%Y-%m-%d %H:%M:%S'),
-        'end': end_date.strftime('%Y-%m-%d %H:%M:%S')
-    }
-    
-    print(f"Fetching history for {DEVICE_ID} from {params['start']} to {params['end']}...")
-    
-    try:
-        res = requests.get(f"{BASE_URL}/devices/{DEVICE_ID}/history", headers=headers, params=params)
-        if res.status_code == 200:
-            data = res.json()
-            print(f"✅ Success! Retrieved {len(data)} history points.")
-            if len(data) > 0:
-                print(f"Sample point: {data[0]}")
-        else:
-            print(f"❌ Failed: {res.status_code} - {res.text}")
-            
-    except Exception as e:
-        print(f"Error: {e}")
+    start = start_date.strftime('%Y-%m-%d %H:%M:%S')
+    end = end_date.strftime('%Y-%m-%d %H:%M:%S')
+
+    print(f"Fetching history for {DEVICE_ID} from {start} to {end}...")
+    result = export_device(make_session(1), token, DEVICE_ID, start, end)
+    if result['error'] is None:
+        print(f"✅ Success! Retrieved {result['rows']} history points in {result['seconds']:.2f}s.")
+    else:
+        print(f"❌ Failed: {result['error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent history exporter / load tester (NDJSON export endpoint)")
+    parser.add_argument('devices', nargs='*', help="Device IMEIs (default: the test device)")
+    parser.add_argument('--devices-file', help="File with one IMEI per line")
+    parser.add_argument('--days', type=float, default=1.0, help="Window length ending now")
+    parser.add_argument('--workers', type=int, default=8, help="Parallel exports (pooled connections)")
+    parser.add_argument('--page-size', type=int, help="Server page size (rows per keyset query)")
+    parser.add_argument('--output', help="Write <imei>.ndjson files to this directory")
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    devices = list(args.devices)
+    if args.devices_file:
+        with open(args.devices_file) as f:
+            devices.extend(line.strip() for line in f if line.strip())
+    devices = devices or [DEVICE_ID]
+
+    end_date = datetime.now() + timedelta(hours=2)
+    start_date = end_date - timedelta(days=args.days)
+    summary = run_export(devices, start_date.strftime('%Y-%m-%d %H:%M:%S'), end_date.strftime('%Y-%m-%d %H:%M:%S'),
+                         args.workers, args.output, args.page_size, args.report_interval)
+    if summary is None:
+        sys.exit(1)
+    print_summary(summary)
 
 if __name__ == '__main__':
-    test_history()
+    main()
@@ -0,0 +1,145 @@
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+
+from gps_gateway import GPSGateway, LatestPositionSink, LivenessSink, MemorySink, SQLiteSink
+from liveness_tracker import LivenessTracker
+from latest_position_store import LatestPositionStore
+from universal_gps_parser import GPSFix, UniversalGPSParser
+
+START = 1698064500
+
+
+def fix(imei, second, lat=33.57, lng=-7.59, speed=40.0, acc=True):
+    flags = GPSFix.FLAG_GPS_VALID | (GPSFix.FLAG_ACC if acc else 0)
+    return GPSFix('location_update', 'hq', imei, START + second, lat, lng, speed, 90.0, flags)
+
+
+class TestLatestPositionStore(unittest.TestCase):
+    def setUp(self):
+        self.store = LatestPositionStore()
+        self.store.register('111', 1, 'Truck 1')
+        self.store.register('222', 1, 'Truck 2')
+        self.store.register('333', 2, 'Van')
+
+    def test_keeps_newest_fix_and_state(self):
+        store = self.store
+        self.assertEqual(store.update_many([fix('111', 0), fix('111', 20, lat=33.6, speed=0.0),
+                                            fix('111', 10, lat=99.0)]), 2)
+        row = store.get('111')
+        self.assertEqual((row.lat, row.timestamp, row.state, row.state_start), (33.6, START + 20, 'idling', START + 20))
+        self.assertEqual(store.stats['stale'], 1)
+
+        heartbeat = UniversalGPSParser.parse_message("111111111111111;", record=True)
+        store.register('111111111111111', 1)
+        self.assertFalse(store.update(heartbeat, now=START + 30))
+        self.assertEqual(store.get('111111111111111').last_seen, START + 30)
+        self.assertIsNone(store.get('111111111111111').lat)
+
+    def test_fleet_is_per_tenant_most_recent_first(self):
+        store = self.store
+        store.update_many([fix('111', 0), fix('222', 50), fix('333', 100)])
+        fleet = store.fleet(1)
+        self.assertEqual([row['device_id'] for row in fleet], ['222', '111'])
+        self.assertEqual(fleet[0]['last_update'], '2023-10-23T12:35:50Z')
+        self.assertEqual(fleet[0]['current_state'], 'moving')
+        self.assertEqual(fleet[0]['status'], 'online')
+
+        store.register('333', 1)
+        self.assertEqual([row['device_id'] for row in store.fleet(1)], ['333', '222', '111'])
+        self.assertEqual(store.fleet(2), [])
+        store.remove('222')
+        self.assertEqual([row['device_id'] for row in store.fleet(1)], ['333', '111'])
+
+        store.update(fix('999', 5))
+        self.assertEqual([row['device_id'] for row in store.fleet(None)], ['999'])
+
+    def test_snapshot_restore(self):
+        self.store.update_many([fix('111', 0), fix('333', 10, acc=False)])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'positions.pickle')
+            self.assertEqual(self.store.snapshot(path), 3)
+            restored = LatestPositionStore()
+            self.assertEqual(restored.restore(path), 3)
+            self.assertEqual(restored.fleet(1), self.store.fleet(1))
+            self.assertEqual(restored.get('333').state, 'parked')
+            self.assertEqual(LatestPositionStore().restore(os.path.join(tmp, 'missing')), 0)
+
+    def test_load_from_database(self):
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(SQLiteSink.SCHEMA)
+        conn.execute("INSERT INTO devices (device_id, name, tenant_id, current_state, last_seen) "
+                     "VALUES ('111', 'Truck 1', 7, 'moving', '2023-10-23 12:40:00'), ('222', 'Truck 2', 7, NULL, NULL)")
+        conn.execute("INSERT INTO positions (device_id, lat, lng, speed, gps_status, timestamp) VALUES "
+                     "('111', 1.0, 2.0, 30, 1, '2023-10-23 12:00:00'), ('111', 3.0, 4.0, 50, 1, '2023-10-23 12:30:00')")
+        store = LatestPositionStore()
+        self.assertEqual(store.load(conn), 2)
+        fleet = store.fleet(7)
+        self.assertEqual([row['device_id'] for row in fleet], ['111', '222'])
+        self.assertEqual((fleet[0]['lat'], fleet[0]['lng'], fleet[0]['last_update']), (3.0, 4.0, '2023-10-23T12:30:00Z'))
+        self.assertTrue(fleet[0]['gps_status'])
+        self.assertEqual(fleet[1]['current_state'], 'parked')
+
+    def test_registrations_refresh_after_restore(self):
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(SQLiteSink.SCHEMA)
+        conn.execute("INSERT INTO devices (device_id, name, tenant_id) VALUES ('111', 'Truck 1', 1)")
+        self.store.update(fix('111', 30, lat=35.0))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'positions.pickle')
+            self.store.snapshot(path)
+            restored = LatestPositionStore()
+            restored.restore(path)
+
+        # Added through POST /devices after the snapshot; 999 reported before it was registered
+        conn.execute("INSERT INTO devices (device_id, name, tenant_id) VALUES ('444', 'New', 1), ('999', 'Late', 1)")
+        restored.update(fix('999', 40))
+        self.assertEqual(restored.load(conn, positions=False), 3)
+        # 222 and 333 were never in the table (or were deleted from it)
+        self.assertEqual([row['device_id'] for row in restored.fleet(1)], ['999', '111', '444'])
+        self.assertIsNone(restored.get('222'))
+        self.assertEqual(restored.fleet(2), [])
+        self.assertEqual(restored.get('111').lat, 35.0)
+        self.assertEqual(restored.get('444').name, 'New')
+        self.assertEqual(restored.fleet(None), [])
+
+    def test_refresh_drops_deleted_devices(self):
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(SQLiteSink.SCHEMA)
+        conn.execute("INSERT INTO devices (device_id, name, tenant_id) VALUES ('111', 'Truck 1', 1), ('222', 'Truck 2', 1)")
+        self.store.load(conn)
+        self.store.update(fix('555', 0))  # reporting, not registered yet
+        conn.execute("DELETE FROM devices WHERE device_id = '222'")
+        self.store.load(conn, positions=False)
+        self.assertEqual([row['device_id'] for row in self.store.fleet(1)], ['111'])
+        self.assertIsNone(self.store.get('222'))
+        self.assertIsNotNone(self.store.get('555'))
+
+    def test_status_follows_liveness(self):
+        tracker = LivenessTracker(timeout=60)
+        tracker.listeners.append(lambda event: self.store.set_status(event['imei'], event['status']))
+        sink = LivenessSink(LatestPositionSink(MemorySink(), self.store), tracker)
+        sink.write([], [fix('111', 0), fix('555', 0)])
+        self.assertEqual(self.store.get('555').status, 'online')
+        self.assertEqual(self.store.fleet(1)[0]['status'], 'online')
+        sink.tick(now=tracker.next_deadline())
+        self.assertEqual(self.store.fleet(1)[0]['status'], 'offline')
+
+    def test_fleet_json_decodes_tenant(self):
+        self.store.register('444', 'acme co')
+        gateway = GPSGateway(MemorySink(), port=0, positions=self.store)
+        self.assertEqual([row['device_id'] for row in json.loads(gateway.fleet_json('tenant=acme%20co'))], ['444'])
+        self.assertEqual(len(json.loads(gateway.fleet_json('tenant=1'))), 2)
+
+    def test_sink(self):
+        memory = MemorySink(keep=True)
+        sink = LatestPositionSink(memory, self.store)
+        sink.write([], [fix('111', 0), fix('222', 5)])
+        self.assertEqual(len(memory.stored), 2)
+        self.assertEqual(len(self.store.fleet(1)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import sqlite3
+import unittest
+
+from gps_gateway import LivenessSink, MemorySink, SQLiteSink
+from liveness_tracker import LivenessTracker
+from universal_gps_parser import GPSFix, UniversalGPSParser
+
+T0 = 1698064500.0
+
+
+def heartbeat(imei):
+    return UniversalGPSParser.parse_message(f"{imei};", record=True)
+
+
+class TestLivenessTracker(unittest.TestCase):
+    def test_online_offline_transitions(self):
+        tracker = LivenessTracker(timeout=60)
+        seen = []
+        tracker.listeners.append(seen.append)
+
+        events = tracker.apply_many([heartbeat('111111111111111'), heartbeat('222222222222222')], now=T0)
+        self.assertEqual([(e['imei'], e['previous'], e['status']) for e in events],
+                         [('111111111111111', None, 'online'), ('222222222222222', None, 'online')])
+        self.assertIsNone(tracker.apply(heartbeat('111111111111111'), now=T0 + 50))
+
+        self.assertEqual(tracker.expire(now=T0 + 59), [])
+        events = tracker.expire(now=T0 + 60)
+        self.assertEqual([(e['imei'], e['status'], e['since']) for e in events],
+                         [('222222222222222', 'offline', T0 + 60)])
+        # The early heap entry of 111 was re-armed with its real deadline
+        self.assertEqual(tracker.next_deadline(), T0 + 110)
+        self.assertEqual(tracker.online_count(), 1)
+        self.assertEqual([e['imei'] for e in tracker.expire(now=T0 + 110)], ['111111111111111'])
+
+        event = tracker.apply(GPSFix('location_update', 'hq', '222222222222222', T0, 1.0, 2.0), now=T0 + 200)
+        self.assertEqual((event['previous'], event['status']), ('offline', 'online'))
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(tracker.stats['offline'], 2)
+
+    def test_heap_stays_bounded_for_chatty_devices(self):
+        tracker = LivenessTracker(timeout=60)
+        for second in range(1000):
+            tracker.apply_many([heartbeat(f"{i:015d}") for i in range(10)], now=T0 + second)
+        self.assertEqual(len(tracker._deadlines), 10)
+        tracker.forget('000000000000003')
+        self.assertEqual(len(tracker.expire(now=T0 + 2000)), 9)
+
+    def test_forget_then_touch_leaves_one_deadline(self):
+        tracker = LivenessTracker(timeout=60)
+        tracker.apply(heartbeat('111111111111111'), now=T0)
+        tracker.forget('111111111111111')
+        tracker.apply(heartbeat('111111111111111'), now=T0 + 30)
+        self.assertEqual(tracker.online_count(), 1)
+        # The entry armed before forget() is dropped, not re-armed next to the new one
+        self.assertEqual(tracker.expire(now=T0 + 60), [])
+        self.assertEqual(len(tracker._deadlines), 1)
+        events = tracker.expire(now=T0 + 90)
+        self.assertEqual([(e['imei'], e['since']) for e in events], [('111111111111111', T0 + 90)])
+        self.assertEqual((tracker.online_count(), tracker._deadlines), (0, []))
+
+    def test_bulk_flush_and_load(self):
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(SQLiteSink.SCHEMA)
+        conn.execute("INSERT INTO devices (device_id, status, last_seen) VALUES "
+                     "('111111111111111', 'online', '2023-10-23 12:00:00'), "
+                     "('222222222222222', 'online', '2023-10-23 12:34:00'), "
+                     "('333333333333333', 'offline', NULL)")
+        tracker = LivenessTracker(timeout=300)
+        self.assertEqual(tracker.load(conn), 3)
+
+        # Stale online row from before the restart goes offline at once
+        self.assertEqual([e['imei'] for e in tracker.expire(now=T0)], ['111111111111111'])
+        for _ in range(50):
+            tracker.apply(heartbeat('333333333333333'), now=T0 + 10)
+        self.assertEqual(tracker.flush(conn), 3)
+
+        rows = dict((imei, (status, last_seen, internet)) for imei, status, last_seen, internet in conn.execute(
+            'SELECT device_id, status, last_seen, internet_status FROM devices'))
+        self.assertEqual(rows['111111111111111'], ('offline', '2023-10-23 12:00:00', 0))
+        self.assertEqual(rows['222222222222222'], ('online', '2023-10-23 12:34:00', 0))
+        self.assertEqual(rows['333333333333333'], ('online', '2023-10-23 12:35:10', 1))
+        self.assertEqual(tracker.flush(conn), 0)
+
+    def test_liveness_sink(self):
+        memory = MemorySink(keep=True)
+        tracker = LivenessTracker(timeout=0)
+        sink = LivenessSink(memory, tracker)
+        sink.write([], [heartbeat('111111111111111')])
+        self.assertTrue(tracker.is_online('111111111111111'))
+        self.assertEqual(len(memory.stored), 1)
+        self.assertEqual([e['status'] for e in sink.tick()], ['offline'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from gps_gateway import GPSGateway, MemorySink
+from parser_metrics import ParserMetrics
+from universal_gps_parser import UniversalGPSParser
+
+HQ = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,FFFFFBFF#"
+STANDARD = "imei:359586018966098,tracker,231023123519,,F,123519.000,A,3123.1234,N,00433.9876,E,0.00,0;"
+
+
+class TestParserMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = UniversalGPSParser.enable_metrics(ParserMetrics(sample_every=2, max_samples=10))
+
+    def tearDown(self):
+        UniversalGPSParser.disable_metrics()
+
+    def test_counts_formats_and_reject_reasons(self):
+        parse = UniversalGPSParser.parse_message
+        self.assertIsNotNone(parse(HQ))
+        self.assertIsNotNone(parse(STANDARD.encode(), record=True))
+        self.assertIsNone(parse("   "))
+        self.assertIsNone(parse("GET / HTTP/1.1"))
+        self.assertIsNone(parse(b"imei:abc,tracker"))
+        self.assertIsNone(parse("imei:359586018966098,tracker,2310"))
+        self.assertIsNone(parse("*HQ,359586018966098,V1#"))
+        self.assertIsNone(parse("(0359586018966098BP05)"))
+        self.assertIsNotNone(parse("*HQ,359586018966098,V1,123519,A,,N,,E,0.08,0,231023,FFFFFBFF#"))
+
+        m = self.metrics
+        self.assertEqual(m.messages, {'hq': 2, 'standard': 1, 'rejected': 6})
+        self.assertEqual(m.rejects, {'empty': 1, 'unknown_prefix': 1, 'bad_imei': 1,
+                                     'too_few_fields': 2, 'not_a_fix': 1})
+        self.assertEqual(m.warnings, {'bad_coordinate': 1})
+        self.assertEqual(sum(m.latency['hq'][:-1]), 2)
+
+    def test_samples_instead_of_printing(self):
+        for i in range(5):
+            UniversalGPSParser.parse_message(f"GET /{i}")
+        samples = [s['payload'] for s in self.metrics.samples if s['reason'] == 'unknown_prefix']
+        self.assertEqual(samples, ["GET /0", "GET /2", "GET /4"])
+
+        UniversalGPSParser.parse_message("*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,fast,0,231023#")
+        error = self.metrics.samples[-1]
+        self.assertEqual(error['reason'], 'parse_error')
+        self.assertIn('hq:', error['detail'])
+
+    def test_prometheus_text(self):
+        UniversalGPSParser.parse_message(HQ)
+        UniversalGPSParser.parse_message("GET /")
+        text = self.metrics.to_prometheus()
+        self.assertIn('gps_parser_messages_total{format="hq"} 1', text)
+        self.assertIn('gps_parser_rejects_total{reason="unknown_prefix"} 1', text)
+        self.assertIn('# TYPE gps_parser_latency_seconds histogram', text)
+        self.assertIn('gps_parser_latency_seconds_bucket{format="hq",le="+Inf"} 1', text)
+        self.assertIn('gps_parser_latency_seconds_count{format="rejected"} 1', text)
+
+        gateway = GPSGateway(MemorySink())
+        text = gateway.metrics_text()
+        self.assertIn('gps_gateway_frames_total 0', text)
+        self.assertIn('# TYPE gps_gateway_active_connections gauge', text)
+        self.assertIn('gps_parser_messages_total{format="hq"} 1', text)
+
+    def test_disabled_records_nothing(self):
+        UniversalGPSParser.disable_metrics()
+        self.assertIsNone(UniversalGPSParser.parse_message("GET /"))
+        self.assertEqual(self.metrics.rejects, {})
+        self.assertEqual(self.metrics.messages, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import position_archive
+from position_archive import COLUMNS, PositionArchive, UNSORTED_MARKER
+from universal_gps_parser import GPSFix
+
+IMEI = "359586018966098"
+DAY_START = 1698019200  # 2023-10-23 00:00:00 UTC
+
+
+def fix(offset, alarm=None, imei=IMEI):
+    flags = GPSFix.FLAG_GPS_VALID | GPSFix.FLAG_ACC
+    return GPSFix('location_update', 'hq', imei, DAY_START + offset, 33.57 + offset * 1e-6, -7.59,
+                  40.0, 90.0, flags, alarm=alarm)
+
+
+class TestPositionArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = PositionArchive(self.tmp.name)
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_append_and_range_read(self):
+        # Two days, the second one straddling midnight
+        written = self.archive.append_many([fix(i * 60) for i in range(1440 + 60)])
+        self.assertEqual(written, 1500)
+        self.assertEqual(self.archive.days(IMEI), ['2023-10-23', '2023-10-24'])
+
+        with self.archive.read_day(IMEI, '2023-10-23', DAY_START + 3600, DAY_START + 7200) as day:
+            self.assertEqual(len(day), 61)
+            self.assertEqual(day['timestamp'][0], DAY_START + 3600)
+            self.assertEqual(day['timestamp'][-1], DAY_START + 7200)
+            self.assertAlmostEqual(day['lat'][0], 33.57 + 3600e-6)
+
+        slices = self.archive.read(IMEI, DAY_START + 86400 - 120, DAY_START + 86400 + 120)
+        self.assertEqual([len(day) for day in slices], [2, 3])
+        for day in slices:
+            day.close()
+
+    def test_fixes_roundtrip(self):
+        self.archive.append_many([fix(0), fix(10, alarm='sos'), fix(20, alarm='custom')])
+        fixes = list(self.archive.iter_fixes(IMEI))
+        self.assertEqual([f.timestamp for f in fixes], [DAY_START, DAY_START + 10, DAY_START + 20])
+        self.assertEqual([f.alarm for f in fixes], [None, 'sos', 'other'])
+        self.assertTrue(fixes[0].acc_status and fixes[0].gps_valid)
+        self.assertAlmostEqual(fixes[0].speed, 40.0)
+
+    def test_late_fix_and_compact(self):
+        self.archive.append_many([fix(0), fix(100)])
+        self.archive.append(fix(50))
+        path = os.path.join(self.tmp.name, IMEI, '2023-10-23')
+        self.assertTrue(os.path.exists(os.path.join(path, UNSORTED_MARKER)))
+        with self.archive.read_day(IMEI, '2023-10-23', DAY_START + 10) as day:
+            self.assertEqual(list(day['timestamp']), [DAY_START + 50, DAY_START + 100])
+
+        self.assertTrue(self.archive.compact(IMEI, '2023-10-23'))
+        self.assertFalse(os.path.exists(os.path.join(path, UNSORTED_MARKER)))
+        with self.archive.read_day(IMEI, '2023-10-23') as day:
+            self.assertEqual(list(day['timestamp']), [DAY_START, DAY_START + 50, DAY_START + 100])
+
+    def test_interrupted_compact_is_recovered(self):
+        self.archive.append_many([fix(0), fix(100)])
+        self.archive.append(fix(50))
+        self.archive.close()
+        device = os.path.join(self.tmp.name, IMEI)
+        path = os.path.join(device, '2023-10-23')
+
+        # Crash after the old partition was moved aside: it is restored
+        shutil.copytree(path, os.path.join(device, '.2023-10-23.compact'))
+        os.rename(path, os.path.join(device, '.2023-10-23.old'))
+        archive = PositionArchive(self.tmp.name)
+        self.assertEqual(archive.days(IMEI), ['2023-10-23'])
+        self.assertEqual(sorted(os.listdir(device)), ['2023-10-23'])
+        self.assertEqual([f.timestamp - DAY_START for f in archive.iter_fixes(IMEI)], [0, 50, 100])
+
+        # Crash after the swap, before the old partition was removed
+        self.assertTrue(archive.compact(IMEI, '2023-10-23'))
+        shutil.copytree(path, os.path.join(device, '.2023-10-23.old'))
+        archive.append(fix(200))
+        self.assertEqual([f.timestamp - DAY_START for f in archive.iter_fixes(IMEI)], [0, 50, 100, 200])
+        self.assertEqual(sorted(os.listdir(device)), ['2023-10-23'])
+        self.assertFalse(os.path.exists(os.path.join(path, UNSORTED_MARKER)))
+        archive.close()
+
+    def test_open_files_budget(self):
+        archive = PositionArchive(self.tmp.name, max_open_files=3 * len(COLUMNS))
+        opened = []
+        real_open = open
+
+        def tracking_open(*args, **kwargs):
+            f = real_open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        position_archive.open = tracking_open
+        try:
+            archive.append_many([fix(0, imei=f"3595860000{i:05d}") for i in range(20)])
+        finally:
+            del position_archive.open
+        self.assertEqual(len(archive._open), 3)
+        self.assertEqual(sum(1 for f in opened if not f.closed), 3 * len(COLUMNS))
+        archive.close()
+        self.assertEqual(len(archive.devices()), 20)
+
+    def test_failed_partition_open_closes_its_files(self):
+        opened = []
+        real_open = open
+
+        def failing_open(*args, **kwargs):
+            if len(opened) == 3:
+                raise OSError(24, "Too many open files")
+            f = real_open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        position_archive.open = failing_open
+        try:
+            with self.assertRaises(OSError):
+                self.archive.append(fix(0))
+        finally:
+            del position_archive.open
+        self.assertTrue(all(f.closed for f in opened))
+        self.assertEqual(self.archive._open, {})
+
+    def test_retention(self):
+        self.archive.append_many([fix(0), fix(86400), fix(0, imei="359586000000001")])
+        self.assertEqual(self.archive.expire('2023-10-24'), 2)
+        self.assertEqual(self.archive.devices(), [IMEI])
+        self.assertTrue(self.archive.drop_device(IMEI))
+        self.assertEqual(self.archive.devices(), [])
+        self.assertEqual(self.archive.read(IMEI), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import unittest
+
+from gps_gateway import SQLiteSink
+from position_writer import PositionWriter
+from universal_gps_parser import UniversalGPSParser
+
+
+def hq(imei, second, speed='40.00', state='00000001'):
+    return f"*HQ,{imei},V1,1235{second:02d},A,3123.1234,N,00433.9876,E,{speed},90.00,231023,{state}#"
+
+
+class RecordingConnection:
+    """
+    Wraps a sqlite3 connection and records the statements sent to it.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def cursor(self):
+        outer = self
+
+        class Cursor:
+            def __init__(self):
+                self.cursor = outer.conn.cursor()
+
+            def execute(self, sql, params=()):
+                outer.statements.append(sql)
+                return self.cursor.execute(sql, params)
+
+            def executemany(self, sql, params):
+                outer.statements.append(sql)
+                return self.cursor.executemany(sql, params)
+
+        return Cursor()
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        pass
+
+
+class TestPositionWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.executescript(SQLiteSink.SCHEMA)
+        self.conn.executemany("INSERT INTO devices (device_id) VALUES (?)", [('111111111111111',), ('222222222222222',)])
+        self.conn.commit()
+        self.recording = RecordingConnection(self.conn)
+
+    def test_coalesced_insert_and_latest_device_update(self):
+        writer = PositionWriter(lambda: self.recording, max_rows=100, max_delay=0.05, rows_per_statement=4)
+        messages = [hq('111111111111111', s) for s in range(6)] + [hq('222222222222222', s, state='00000000') for s in range(3)]
+        writer.submit_many(UniversalGPSParser.iter_parse(messages, record=True))
+        writer.close()
+
+        rows = self.conn.execute("SELECT device_id, timestamp FROM positions ORDER BY id").fetchall()
+        self.assertEqual(len(rows), 9)
+        # Per-device order preserved
+        first = [ts for device, ts in rows if device == '111111111111111']
+        self.assertEqual(first, sorted(first))
+        # 9 rows at 4 per statement -> 3 multi-row INSERTs, 1 batched UPDATE
+        inserts = [sql for sql in self.recording.statements if sql.startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(writer.stats['flushes'], 1)
+        self.assertEqual(writer.stats['devices_updated'], 2)
+
+        devices = dict(self.conn.execute("SELECT device_id, last_seen FROM devices").fetchall())
+        self.assertEqual(devices['111111111111111'], '2023-10-23 12:35:05')
+        self.assertEqual(devices['222222222222222'], '2023-10-23 12:35:02')
+
+    def test_flush_on_row_count(self):
+        writer = PositionWriter(lambda: self.recording, max_rows=2, max_delay=10)
+        writer.submit_many(UniversalGPSParser.parse_message(hq('111111111111111', s)) for s in range(4))
+        writer.flush()
+        self.assertEqual(writer.stats['flushes'], 2)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0], 4)
+        writer.close()
+
+    def test_flush_on_deadline(self):
+        writer = PositionWriter(lambda: self.recording, max_rows=1000, max_delay=0.05)
+        writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 1)))
+        writer.flush()
+        self.assertEqual(writer.stats['positions_written'], 1)
+        writer.close()
+
+    def test_heartbeat_only_updates_device(self):
+        writer = PositionWriter(lambda: self.recording, max_delay=0.01)
+        writer.submit(UniversalGPSParser.parse_message("222222222222222;"))
+        writer.close()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0], 0)
+        status = self.conn.execute("SELECT status FROM devices WHERE device_id = '222222222222222'").fetchone()[0]
+        self.assertEqual(status, 'online')
+
+    def test_heartbeat_keeps_gps_status(self):
+        writer = PositionWriter(lambda: self.recording, max_delay=0.01)
+        writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 1)))
+        writer.flush()
+        writer.submit(UniversalGPSParser.parse_message("111111111111111;"))
+        writer.close()
+        gps_status, last_seen = self.conn.execute(
+            "SELECT gps_status, last_seen FROM devices WHERE device_id = '111111111111111'").fetchone()
+        self.assertEqual(gps_status, 1)
+        self.assertNotEqual(last_seen, '2023-10-23 12:35:01')
+
+    def test_late_fix_does_not_move_last_seen_back(self):
+        writer = PositionWriter(lambda: self.recording, max_delay=0.05)
+        writer.submit_many(UniversalGPSParser.parse_message(m) for m in (
+            hq('111111111111111', 9),
+            hq('111111111111111', 3).replace(',A,', ',V,'),
+        ))
+        writer.close()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0], 2)
+        last_seen, gps_status = self.conn.execute(
+            "SELECT last_seen, gps_status FROM devices WHERE device_id = '111111111111111'").fetchone()
+        self.assertEqual((last_seen, gps_status), ('2023-10-23 12:35:09', 1))
+
+    def test_late_flush_does_not_move_device_back(self):
+        writer = PositionWriter(lambda: self.recording, max_delay=0.01)
+        writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 9)))
+        writer.flush()
+        # A resent older fix (no GPS) arrives in a later flush
+        writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 3).replace(',A,', ',V,')))
+        writer.flush()
+        last_seen, gps_status = self.conn.execute(
+            "SELECT last_seen, gps_status FROM devices WHERE device_id = '111111111111111'").fetchone()
+        self.assertEqual((last_seen, gps_status), ('2023-10-23 12:35:09', 1))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0], 2)
+
+        self.conn.execute("UPDATE devices SET last_seen = '2099-01-01 00:00:00' WHERE device_id = '222222222222222'")
+        self.conn.commit()
+        writer.submit(UniversalGPSParser.parse_message("222222222222222;"))
+        writer.close()
+        last_seen = self.conn.execute("SELECT last_seen FROM devices WHERE device_id = '222222222222222'").fetchone()[0]
+        self.assertEqual(last_seen, '2099-01-01 00:00:00')
+
+    def test_connect_error_reaches_callers(self):
+        submitted = threading.Event()
+
+        def connect():
+            submitted.wait(5)
+            raise sqlite3.OperationalError('unable to open database file')
+
+        writer = PositionWriter(connect, max_delay=0.01)
+        writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 1)))
+        submitted.set()
+        with self.assertRaises(RuntimeError):
+            writer.flush()
+        with self.assertRaises(RuntimeError):
+            writer.submit(UniversalGPSParser.parse_message(hq('111111111111111', 2)))
+        writer.close()
+        self.assertEqual((writer.stats['errors'], writer.stats['dropped']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
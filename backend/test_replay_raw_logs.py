@@ -0,0 +1,161 @@
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+
+from gps_gateway import SQLiteSink
+from replay_raw_logs import RawLogReplayer, SQLitePositionOutput, iter_export, iter_sqlite, peek_imei
+
+
+def hq(imei, second):
+    return f"*HQ,{imei},V1,1235{second:02d},A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000001#"
+
+
+class TestReplayRawLogs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source.sqlite3')
+        self.target = os.path.join(self.tmp.name, 'target.sqlite3')
+        conn = sqlite3.connect(self.source)
+        conn.executescript(SQLiteSink.SCHEMA)
+        payloads = []
+        for second in range(20):
+            for device in range(5):
+                payloads.append(hq(f"35958600000000{device}", second))
+            payloads.append("GET / HTTP/1.1")
+        conn.executemany('INSERT INTO raw_logs (payload, received_at) VALUES (?, ?)',
+                         [(payload, '2023-10-23 12:00:00') for payload in payloads])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def replay(self, checkpoint=None, after_id=0, rows=None):
+        output = SQLitePositionOutput(self.target)
+        replayer = RawLogReplayer(workers=3, chunk_size=7, output=output, checkpoint=checkpoint, source=self.source)
+        try:
+            stats = replayer.run(rows if rows is not None else iter_sqlite(self.source, after_id, 10), report_interval=0)
+        finally:
+            output.close()
+        return replayer, stats
+
+    def test_peek_imei(self):
+        self.assertEqual(peek_imei(hq("359586018966098", 1)), "359586018966098")
+        self.assertEqual(peek_imei("imei:359586018966098,tracker,231023123519,"), "359586018966098")
+        self.assertEqual(peek_imei("##,imei:359586018966098,A;"), "359586018966098")
+        self.assertEqual(peek_imei("359586018966098;"), "359586018966098")
+        self.assertEqual(peek_imei("(359586018966098,LOC,33.5,-7.5,42.5,1,12.4,1)"), "359586018966098")
+
+    def test_replay_keeps_device_order(self):
+        _, stats = self.replay()
+        self.assertEqual(stats['rows'], 120)
+        self.assertEqual(stats['fixes'], 100)
+        self.assertEqual(stats['invalid'], 20)
+
+        conn = sqlite3.connect(self.target)
+        rows = conn.execute('SELECT device_id, timestamp FROM positions ORDER BY id').fetchall()
+        conn.close()
+        self.assertEqual(len(rows), 100)
+        for device in range(5):
+            times = [ts for imei, ts in rows if imei == f"35958600000000{device}"]
+            self.assertEqual(len(times), 20)
+            self.assertEqual(times, sorted(times))
+
+    def test_checkpoint_resume(self):
+        checkpoint = os.path.join(self.tmp.name, 'replay.json')
+        rows = list(iter_sqlite(self.source))
+        self.replay(checkpoint, rows=rows[:50])
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['last_id'], 50)
+
+        replayer = RawLogReplayer(workers=1, checkpoint=checkpoint, source=self.source)
+        after_id = replayer.load_checkpoint()
+        _, stats = self.replay(checkpoint, after_id)
+        self.assertEqual(stats['rows'], 70)
+
+        conn = sqlite3.connect(self.target)
+        count = conn.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+        conn.close()
+        self.assertEqual(count, 100)
+
+    def test_out_of_order_chunks_are_written_in_order(self):
+        output = SQLitePositionOutput(self.target, self.source)
+        replayer = RawLogReplayer(workers=2, output=output, source=self.source)
+        position = ('359586000000000', 31.38, 4.56, 40.0, 90.0, None, True, True, True, False, '2023-10-23 12:35:00')
+        replayer._pending = {0: [2, 7, []], 1: [1, 14, []]}
+
+        # Chunk 1 finishes before chunk 0: nothing may reach the output yet
+        replayer._collected(1, 7, 1, 1, [position])
+        replayer._collected(0, 4, 1, 1, [position])
+        self.assertEqual((replayer.last_id, output.last_id()), (0, 0))
+        self.assertEqual(output.conn.execute('SELECT COUNT(*) FROM positions').fetchone()[0], 0)
+
+        # Interrupted here: a resume starts from 0 and inserts nothing twice
+        self.assertEqual(RawLogReplayer(output=output).load_checkpoint(), 0)
+
+        replayer._collected(0, 3, 1, 1, [position])
+        self.assertEqual((replayer.last_id, output.last_id()), (14, 14))
+        self.assertEqual(output.conn.execute('SELECT COUNT(*) FROM positions').fetchone()[0], 3)
+        output.close()
+
+    def test_interrupted_replay_resumes_without_duplicates(self):
+        def interrupted(rows, after):
+            for row in rows:
+                if row[0] > after:
+                    raise KeyboardInterrupt
+                yield row
+
+        output = SQLitePositionOutput(self.target, self.source)
+        replayer = RawLogReplayer(workers=3, chunk_size=7, output=output, max_in_flight=20, source=self.source)
+        with self.assertRaises(KeyboardInterrupt):
+            replayer.run(interrupted(iter_sqlite(self.source), 60), report_interval=0)
+        output.close()
+
+        output = SQLitePositionOutput(self.target, self.source)
+        replayer = RawLogReplayer(workers=3, chunk_size=7, output=output, source=self.source)
+        after_id = replayer.load_checkpoint()
+        self.assertLessEqual(after_id, 60)
+        replayer.run(iter_sqlite(self.source, after_id), report_interval=0)
+        rows = output.conn.execute('SELECT device_id, timestamp FROM positions').fetchall()
+        output.close()
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(len(set(rows)), 100)
+
+    def test_coalesced_payloads_and_received_at(self):
+        conn = sqlite3.connect(self.source)
+        conn.execute('DELETE FROM raw_logs')
+        conn.executemany('INSERT INTO raw_logs (payload, received_at) VALUES (?, ?)', [
+            # One TCP read holding three frames, the last one without its terminator
+            (hq("359586000000000", 1) + "\r\n" + hq("359586000000000", 2) + hq("359586000000000", 3)[:-1],
+             '2023-10-23 12:40:00'),
+            ("(359586000000001,LOC,33.5731,-7.5896,42.5,1,12.4,1)", '2023-10-23 08:00:01'),
+            ("imei:359586000000002,tracker,,,F,123519,A,3123.1234,N,00433.9876,E,40.00,90.0;", '2023-10-23 08:00:02'),
+        ])
+        conn.commit()
+        conn.close()
+
+        _, stats = self.replay()
+        self.assertEqual((stats['rows'], stats['frames'], stats['fixes'], stats['invalid']), (3, 5, 5, 0))
+        conn = sqlite3.connect(self.target)
+        rows = conn.execute('SELECT device_id, timestamp FROM positions ORDER BY device_id, timestamp').fetchall()
+        conn.close()
+        self.assertEqual(rows, [
+            ('359586000000000', '2023-10-23 12:35:01'),
+            ('359586000000000', '2023-10-23 12:35:02'),
+            ('359586000000000', '2023-10-23 12:35:03'),
+            ('359586000000001', '2023-10-23 08:00:01'),  # no device time: received_at
+            ('359586000000002', '2023-10-23 08:00:02'),
+        ])
+
+    def test_iter_export(self):
+        path = os.path.join(self.tmp.name, 'export.tsv')
+        with open(path, 'w') as f:
+            f.write(f"7\t2023-10-23 12:00:00\t{hq('359586018966098', 1)}\n")
+            f.write(f"9\t2023-10-23 12:00:01\t{hq('359586018966098', 2)}\n")
+        self.assertEqual([row[0] for row in iter_export(path, after_id=7)], [9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import random
+import unittest
+from datetime import datetime
+
+from simulate_fleet import SimulatedDevice
+from simulate_movement_hq import build_heartbeat, build_packet, build_standard_packet
+from universal_gps_parser import UniversalGPSParser
+
+IMEI = '359586018966098'
+NOW = datetime(2023, 10, 23, 12, 35, 19)
+
+
+class TestPacketTemplates(unittest.TestCase):
+    def test_every_template_parses(self):
+        parse = UniversalGPSParser.parse_message
+        cases = [
+            (build_packet(33.5731, -7.5898, 40.0, 90.0, True, True, None, IMEI, NOW), 'hq', None, True),
+            (build_packet(33.5731, -7.5898, 0.0, 90.0, True, False, 'sos', IMEI, NOW), 'standard', 'sos', False),
+            (build_standard_packet(33.5731, -7.5898, 40.0, 90.0, True, IMEI, NOW), 'standard', None, True),
+            (build_standard_packet(33.5731, -7.5898, 0.0, 90.0, False, IMEI, NOW), 'standard', None, False),
+        ]
+        for packet, fmt, alarm, acc in cases:
+            with self.subTest(packet=packet):
+                result = parse(packet)
+                self.assertIsNotNone(result)
+                self.assertEqual((result['type'], result['format'], result['imei']), ('location_update', fmt, IMEI))
+                self.assertEqual(result['timestamp'], '2023-10-23 12:35:19')
+                self.assertAlmostEqual(result['latitude'], 33.5731, places=4)
+                self.assertAlmostEqual(result['longitude'], -7.5898, places=4)
+                self.assertEqual((result.get('alarm'), result['acc_status']), (alarm, acc))
+
+        self.assertEqual(parse(build_heartbeat(IMEI))['type'], 'heartbeat_simple')
+        self.assertEqual(parse(build_heartbeat(IMEI, command=True))['type'], 'heartbeat_command')
+
+    def test_simulated_devices_only_send_valid_packets(self):
+        rng = random.Random(3)
+        mix = [('hq', 1.0), ('standard', 1.0), ('heartbeat', 0.5)]
+        devices = [SimulatedDevice(f"35958600000{i:04d}", rng, mix) for i in range(5)]
+        for _ in range(200):
+            for device in devices:
+                result = UniversalGPSParser.parse_message(device.next_packet(NOW))
+                self.assertIsNotNone(result)
+                self.assertEqual(result['imei'], device.imei)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from track_simplifier import TrackSimplifier, simplify_track
+
+
+def drive(count, start=1700000000, stop=None, alarm_at=None, seed=1):
+    """
+    Straight noisy drive heading north-east at 50 km/h, 3 s apart; `stop` is a
+    (first, last) index range where the vehicle is parked with ACC off.
+    """
+    rng = random.Random(seed)
+    points = []
+    lat, lng = 33.57, -7.59
+    for i in range(count):
+        parked = stop is not None and stop[0] <= i <= stop[1]
+        if not parked:
+            lat += 30 / 111195
+            lng += 30 / 92700
+        points.append({
+            'lat': lat + rng.gauss(0, 1) / 111195,
+            'lng': lng + rng.gauss(0, 1) / 92700,
+            'speed': 0.0 if parked else 50.0,
+            'acc_status': not parked,
+            'alarm': 'sos' if i == alarm_at else None,
+            'timestamp': start + 3 * i,
+        })
+    return points
+
+
+class TestTrackSimplifier(unittest.TestCase):
+    def test_straight_drive_collapses(self):
+        points = drive(2000)
+        for method in ('dp', 'visvalingam'):
+            kept = simplify_track(points, tolerance=10.0, method=method)
+            self.assertIs(kept[0], points[0])
+            self.assertIs(kept[-1], points[-1])
+            self.assertLess(len(kept), 20, method)
+
+    def test_keeps_anchors(self):
+        points = drive(600, stop=(200, 299), alarm_at=450)
+        kept = simplify_track(points, tolerance=10.0)
+        indices = [points.index(point) for point in kept]
+        # Stop start / end, ACC changes and the alarm survive
+        for index in (200, 299, 300, 450):
+            self.assertIn(index, indices)
+        self.assertEqual(indices, sorted(indices))
+        self.assertLess(len(kept), 30)
+
+    def test_deviation_within_tolerance(self):
+        # A right-angle turn must keep the corner
+        points = [{'lat': 33.57 + i * 0.0003, 'lng': -7.59, 'speed': 40, 'acc_status': True, 'timestamp': i * 3}
+                  for i in range(50)]
+        points += [{'lat': points[-1]['lat'], 'lng': -7.59 + i * 0.0003, 'speed': 40, 'acc_status': True,
+                    'timestamp': 150 + i * 3} for i in range(1, 50)]
+        kept = simplify_track(points, tolerance=5.0)
+        self.assertEqual([points.index(point) for point in kept], [0, 49, 98])
+
+    def test_streaming_and_downsampling(self):
+        points = drive(1000)
+        simplifier = TrackSimplifier(tolerance=0.0, min_interval=30, max_buffer=100)
+        kept = []
+        for point in points:
+            kept.extend(simplifier.add(point))
+        kept.extend(simplifier.finish())
+        times = [point['timestamp'] for point in kept]
+        # One point per 30 s plus the last point
+        self.assertEqual(len(kept), 1000 // 10 + 1)
+        self.assertTrue(all(b - a >= 30 for a, b in zip(times, times[1:-1])))
+        self.assertIs(kept[-1], points[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
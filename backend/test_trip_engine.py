@@ -0,0 +1,91 @@
+import unittest
+
+from trip_engine import TripEngine, haversine_m, haversine_many
+from universal_gps_parser import GPSFix
+
+IMEI = "359586018966098"
+START = 1698064500
+
+
+def fix(second, lat, speed, acc=True, valid=True, lng=-7.59):
+    flags = (GPSFix.FLAG_GPS_VALID if valid else 0) | (GPSFix.FLAG_ACC if acc else 0)
+    return GPSFix('location_update', 'hq', IMEI, START + second, lat, lng, speed, 0.0, flags)
+
+
+def route():
+    """
+    Idle 40 s, drive north 0.01 deg (about 1112 m) in 100 s, park.
+    """
+    fixes = [fix(0, 33.57, 0), fix(30, 33.57, 0)]
+    for i in range(1, 11):
+        fixes.append(fix(30 + i * 10, 33.57 + i * 0.001, 45))
+    fixes.append(fix(140, 33.58, 0, acc=False))
+    return fixes
+
+
+class TestTripEngine(unittest.TestCase):
+    def test_haversine(self):
+        self.assertAlmostEqual(haversine_m(33.57, -7.59, 33.58, -7.59), 1111.95, places=1)
+        steps = haversine_many([33.57, 33.58, 33.58], [-7.59, -7.59, -7.58])
+        self.assertEqual(len(steps), 2)
+        self.assertAlmostEqual(steps[0], 1111.95, places=1)
+
+    def test_trip(self):
+        engine = TripEngine()
+        events = engine.apply_many(route())
+        self.assertEqual([e['event'] for e in events], ['trip_started', 'trip_ended'])
+        trip = events[-1]['trip']
+        self.assertAlmostEqual(trip.distance, 1111.95, places=0)
+        # Time between two fixes counts in the state of the first one
+        self.assertEqual(trip.idle_time, 40)
+        self.assertEqual(trip.moving_time, 100)
+        self.assertEqual(trip.max_speed, 45)
+        self.assertEqual(trip.duration, 140)
+
+        summary = engine.summary(IMEI, '2023-10-23')
+        self.assertEqual(summary['state'], 'parked')
+        self.assertEqual(summary['day']['trips'], 1)
+        self.assertAlmostEqual(summary['odometer_km'], 1.112, places=3)
+
+    def test_first_step_from_parked_position_counts(self):
+        engine = TripEngine()
+        fixes = [fix(0, 33.57, 0, acc=False)]
+        # The first fix of the trip is already 0.002 deg (about 222 m) away
+        for i in range(2, 11):
+            fixes.append(fix(i * 10, 33.57 + i * 0.001, 45))
+        fixes.append(fix(110, 33.58, 0, acc=False))
+        events = engine.apply_many(fixes)
+        self.assertEqual([e['event'] for e in events], ['trip_started', 'trip_ended'])
+        self.assertAlmostEqual(events[-1]['trip'].distance, 1111.95, places=0)
+        self.assertAlmostEqual(engine.summary(IMEI)['odometer_km'], 1.112, places=3)
+
+        batch = TripEngine()
+        batch.process_history(fixes)
+        self.assertAlmostEqual(batch.get(IMEI).odometer, engine.get(IMEI).odometer)
+
+    def test_jitter(self):
+        engine = TripEngine()
+        fixes = route()
+        # Invalid fix far away, then a spike implying ~4000 km/h
+        fixes.insert(5, fix(65, 34.0, 45, valid=False))
+        fixes.insert(7, fix(75, 33.68, 45))
+        # Idle drift after the trip started is ignored
+        fixes.insert(2, fix(31, 33.5701, 0))
+        engine.apply_many(fixes)
+        trip = engine.get(IMEI).trips[-1]
+        self.assertAlmostEqual(trip.distance, 1111.95, places=0)
+        self.assertEqual(engine.stats['jitter'], 3)
+
+    def test_batch_matches_incremental(self):
+        fixes = route()
+        fixes.insert(5, fix(65, 33.68, 45))
+        incremental = TripEngine()
+        incremental.apply_many(fixes)
+        batch = TripEngine()
+        batch.process_history(fixes)
+        self.assertAlmostEqual(batch.get(IMEI).odometer, incremental.get(IMEI).odometer)
+        self.assertEqual(batch.daily, incremental.daily)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from universal_gps_parser import UniversalGPSParser
+from universal_gps_parser import UniversalGPSParser, GPSFix, LazyMessage
 
 class TestUniversalGPSParser(unittest.TestCase):
     
@@ -63,5 +63,233 @@ class TestUniversalGPSParser(unittest.TestCase):
         msg = "imei:1234567,tracker"
         self.assertIsNone(self.parser.parse_message(msg))
 
+    def test_iter_parse_is_lazy_and_ordered(self):
+        msgs = iter([
+            "123456789012345;",
+            "garbage_data",
+            "##,imei:359586018966098,A",
+        ])
+        results = self.parser.iter_parse(msgs)
+        self.assertFalse(isinstance(results, list))
+        results = list(results)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['type'], 'heartbeat_simple')
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2]['type'], 'heartbeat_command')
+
+    def test_iter_parse_skip_invalid(self):
+        msgs = ["garbage_data", "123456789012345;", None]
+        results = list(self.parser.iter_parse(msgs, skip_invalid=True))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['imei'], '123456789012345')
+
+    def test_parse_many_summary(self):
+        msgs = [
+            "imei:1234567,tracker,230520120000,,F,120000,A,3124.5678,N,12124.5678,E,0.00,0,10.0,0,0,80%,80%,25;",
+            "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,0,0,0,0,0,0,0,0#",
+            "*HQ,359586018966098,V1,123520,A,3123.1234,N,00433.9876,E,0.08,0,231023,0,0,0,0,0,0,0,0#",
+            "123456789012345;",
+            "garbage_data",
+        ]
+        results, summary = self.parser.parse_many(msgs)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[1]['timestamp'], '2023-10-23 12:35:19')
+        self.assertEqual(summary, {
+            'standard': 1,
+            'hq': 2,
+            'heartbeat_simple': 1,
+            'invalid': 1,
+        })
+
+    def test_hq_status_flags(self):
+        msg = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,271.50,231023,00000003#"
+        result = self.parser.parse_message(msg)
+        self.assertAlmostEqual(result['direction'], 271.5)
+        self.assertTrue(result['acc_status'])
+        self.assertTrue(result['door_status'])
+
+    def test_standard_without_date_has_no_timestamp(self):
+        msg = "imei:359586018966098,tracker,,,F,123519,A,3123.1234,N,00433.9876,E,40.00,90.0;"
+        self.assertIsNone(self.parser.parse_message(msg)['timestamp'])
+        self.assertIsNone(self.parser.parse_message(msg.encode())['timestamp'])
+        self.assertIsNone(self.parser.parse_message(msg.encode(), record=True).timestamp)
+
+    def test_standard_alarm(self):
+        msg = "imei:359586018966098,help me,231023123519,,F,123519,A,3123.1234,N,00433.9876,E,0.00,;"
+        result = self.parser.parse_message(msg)
+        self.assertEqual(result['alarm'], 'sos')
+
+    def test_record_output(self):
+        msg = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000001#"
+        fix = self.parser.parse_message(msg, record=True)
+        self.assertIsInstance(fix, GPSFix)
+        self.assertEqual(fix.imei, '359586018966098')
+        self.assertEqual(fix.format, 'hq')
+        # 2023-10-23 12:35:19 UTC
+        self.assertEqual(fix.timestamp, 1698064519)
+        self.assertAlmostEqual(fix.latitude, 31.3853900, places=4)
+        self.assertAlmostEqual(fix.speed, 40.0)
+        self.assertAlmostEqual(fix.course, 90.0)
+        self.assertTrue(fix.gps_valid)
+        self.assertTrue(fix.acc_status)
+        self.assertFalse(fix.door_status)
+        self.assertIsNone(fix.raw)
+        self.assertFalse(hasattr(fix, '__dict__'))
+
+    def test_record_keep_raw_and_interned_imei(self):
+        msg = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,0#"
+        first = self.parser.parse_message(msg, record=True, keep_raw=True)
+        second = self.parser.parse_message(msg, record=True)
+        self.assertEqual(first.raw, msg)
+        self.assertIs(first.imei, second.imei)
+
+    def test_record_standard_fuel_and_alarm(self):
+        msg = "imei:1234567,help me,230520120000,,F,120000,A,3124.5678,N,12124.5678,E,0.00,0,10.0,0,0,80%,80%,25;"
+        fix = self.parser.parse_message(msg, record=True)
+        self.assertEqual(fix.fuel, 80.0)
+        self.assertEqual(fix.alarm, 'sos')
+        self.assertTrue(fix.flags & GPSFix.FLAG_ALARM)
+
+    def test_parse_many_records(self):
+        msgs = ["123456789012345;", "garbage_data",
+                "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,0#"]
+        results, summary = self.parser.parse_many(msgs, record=True)
+        self.assertEqual(results[0].type, 'heartbeat_simple')
+        self.assertIsNone(results[0].timestamp)
+        self.assertEqual(summary, {'heartbeat_simple': 1, 'invalid': 1, 'hq': 1})
+
+    def test_bytes_input_matches_str(self):
+        msgs = [
+            "imei:1234567,tracker,230520120000,,F,120000,A,3124.5678,N,12124.5678,E,0.00,0,10.0,0,0,80%,80%,25;",
+            "imei:359586018966098,help me,231023123519,,F,123519,A,3123.1234,S,00433.9876,W,12.5,;",
+            "123456789012345;",
+            "##,imei:359586018966098,A",
+            "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,271.50,231023,00000003#",
+            "imei:1234567,tracker",
+            "garbage_data",
+        ]
+        for msg in msgs:
+            raw = msg.encode() + b"\r\n"
+            expected = self.parser.parse_message(msg)
+            self.assertEqual(self.parser.parse_message(raw), expected)
+            self.assertEqual(self.parser.parse_message(bytearray(raw)), expected)
+            self.assertEqual(self.parser.parse_message(memoryview(raw)), expected)
+
+    def test_bytes_record_matches_str_record(self):
+        head = "imei:359586018966098,tracker,231023123519,,F,123519,A,3123.1234,N,00433.9876,E,40.00,"
+        msgs = [
+            head + "90.0,10.0,0,0,80%,80%,25;",
+            head + "90.0,10.0,0,Door=1,55%,;",
+            head + "90.0,10.0,0,0,80%,80%25;",
+            head + "90.0,10.0,0,0,80%,x%;",
+            head + "90.0,10.0,0,0,y%,80%;",
+            head + "1,,State:ACC=1;",
+            head + "90.0,State:ACC=1;",
+            head + "State:ACC=1;",
+            "imei:359586018966098,help me,231023123519,,F,123519,V,3123.1234,S,00433.9876,W,12.5,;",
+            "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,271.50,231023,00000003#",
+            "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,x,231023,00000003#",
+            "123456789012345;",
+        ]
+        for msg in msgs:
+            with self.subTest(msg=msg):
+                expected = self.parser.parse_message(msg, record=True, keep_raw=True)
+                got = self.parser.parse_message(msg.encode(), record=True, keep_raw=True)
+                # record mode accepts exactly what the dict path accepts, str or bytes
+                self.assertEqual(got is None, self.parser.parse_message(msg) is None)
+                self.assertEqual(got is None, self.parser.parse_message(msg.encode()) is None)
+                if expected is None:
+                    self.assertIsNone(got)
+                else:
+                    self.assertEqual(got.to_dict(), expected.to_dict())
+
+    def test_bytes_record_skips_raw(self):
+        raw = b"*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,40.00,90.00,231023,00000001#"
+        fix = self.parser.parse_message(raw, record=True)
+        self.assertEqual(fix.timestamp, 1698064519)
+        self.assertAlmostEqual(fix.longitude, 4.5664600, places=4)
+        self.assertTrue(fix.acc_status)
+        self.assertIsNone(fix.raw)
+        self.assertEqual(self.parser.parse_message(raw, record=True, keep_raw=True).raw, raw.decode())
+
+    def test_bytes_invalid(self):
+        self.assertIsNone(self.parser.parse_message(b""))
+        self.assertIsNone(self.parser.parse_message(b"  \r\n"))
+        self.assertIsNone(self.parser.parse_message(b"\xff\xfe garbage"))
+
+    def test_simulator_format(self):
+        msg = "(359586018966098,LOC,33.5731,-7.5896,42.5,1,12.4,1)"
+        result = self.parser.parse_message(msg)
+        self.assertEqual(result['format'], 'simulator')
+        self.assertEqual(result['imei'], '359586018966098')
+        self.assertAlmostEqual(result['latitude'], 33.5731)
+        self.assertAlmostEqual(result['longitude'], -7.5896)
+        self.assertTrue(result['acc_status'])
+        self.assertAlmostEqual(result['trip_distance'], 12.4)
+        # No device time: left to the consumer's arrival time, never local now()
+        self.assertIsNone(result['timestamp'])
+        self.assertIsNone(self.parser.parse_message(msg, record=True).timestamp)
+        self.assertEqual(self.parser.parse_message(msg.encode()), result)
+
+    def test_login_frame_is_not_a_fix(self):
+        self.assertIsNone(self.parser.parse_message("(0359586018966098BP05)"))
+
+    def test_heartbeat_simple_rejects_wrong_length(self):
+        self.assertIsNone(self.parser.parse_message("12345678901234;"))
+        self.assertIsNone(self.parser.parse_message("1234567890123456"))
+        self.assertIsNone(self.parser.parse_message("123456789012345;;"))
+
+    def test_register_format(self):
+        dispatch = dict(UniversalGPSParser._dispatch)
+        bytes_dispatch = dict(UniversalGPSParser._bytes_dispatch)
+        header_dispatch = dict(UniversalGPSParser._header_dispatch)
+        try:
+            UniversalGPSParser.register_format(
+                '$TEST,', lambda message: {'type': 'test', 'imei': message.split(',')[1]})
+            self.assertEqual(self.parser.parse_message("$TEST,42"), {'type': 'test', 'imei': '42'})
+            self.assertEqual(self.parser.parse_message(b"$TEST,42"), {'type': 'test', 'imei': '42'})
+            self.assertIsNone(self.parser.parse_message("$OTHER,42"))
+            self.assertEqual(self.parser.parse_header("$TEST,42").imei, '42')
+        finally:
+            UniversalGPSParser._dispatch = dispatch
+            UniversalGPSParser._bytes_dispatch = bytes_dispatch
+            UniversalGPSParser._header_dispatch = header_dispatch
+
+    def test_parse_header_is_lazy(self):
+        hq = "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,FFFFFBFF#"
+        header = self.parser.parse_header(hq.encode())
+        self.assertIsInstance(header, LazyMessage)
+        self.assertEqual((header.type, header.format, header.imei), ('location_update', 'hq', '359586018966098'))
+        self.assertFalse(header.decoded)
+
+        full = self.parser.parse_message(hq, record=True)
+        self.assertAlmostEqual(header.latitude, full.latitude)
+        self.assertTrue(header.decoded)
+        self.assertIs(header.fix(), header.fix())
+        self.assertEqual(header.timestamp, full.timestamp)
+        self.assertTrue(header.acc_status)
+        self.assertIs(GPSFix.from_result(header), header.fix())
+
+    def test_parse_header_formats(self):
+        cases = {
+            "imei:359586018966098,tracker,231023123519,,F,123519.000,A,3123.1234,N,00433.9876,E,0.00,0;":
+                ('location_update', 'standard', '359586018966098'),
+            "  123456789012345;\r\n": ('heartbeat_simple', None, '123456789012345'),
+            "##,imei:359586018966098,A": ('heartbeat_command', None, '359586018966098'),
+            "(359586018966098,LOC,33.5731,-7.5896,42.5,1,12.4,1)": ('location_update', 'simulator', '359586018966098'),
+        }
+        for message, expected in cases.items():
+            header = self.parser.parse_header(message)
+            self.assertEqual((header.type, header.format, header.imei), expected, message)
+
+        for message in ("", "GET /", "imei:abc,tracker", "*HQ", "(0359586018966098BP05)", "1234;"):
+            self.assertIsNone(self.parser.parse_header(message), message)
+
+    def test_parse_header_broken_body(self):
+        header = self.parser.parse_header("imei:359586018966098,tracker,2310")
+        self.assertEqual(header.imei, '359586018966098')
+        self.assertIsNone(header.fix())
+        self.assertIsNone(header.latitude)
+
 if __name__ == '__main__':
     unittest.main()
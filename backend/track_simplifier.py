@@ -0,0 +1,241 @@
+import math
+import heapq
+
+from universal_gps_parser import GPSFix, _timestamp_to_epoch
+
+EARTH_RADIUS_M = 6371000.0
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+def _point_fields(point):
+    """
+    (lat, lng, epoch, speed, alarm, acc) of a GPSFix or a positions row dict
+    (lat/lng or latitude/longitude keys, as served by the history API).
+    """
+    if isinstance(point, GPSFix):
+        return point.latitude, point.longitude, point.timestamp, point.speed or 0.0, point.alarm, point.acc_status
+    lat = point.get('lat', point.get('latitude'))
+    lng = point.get('lng', point.get('longitude'))
+    timestamp = point.get('timestamp')
+    if isinstance(timestamp, str):
+        timestamp = _timestamp_to_epoch(timestamp.replace('T', ' '))
+    elif hasattr(timestamp, 'timestamp'):
+        timestamp = timestamp.timestamp()
+    acc = point.get('acc_status', point.get('accStatus'))
+    return float(lat), float(lng), timestamp, float(point.get('speed') or 0), point.get('alarm'), bool(acc)
+
+
+def _douglas_peucker(xs, ys, tolerance):
+    """
+    Keep flags for Douglas-Peucker on projected points (iterative, no
+    recursion limit on long tracks).
+    """
+    n = len(xs)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    tolerance2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x1, y1 = xs[first], ys[first]
+        dx, dy = xs[last] - x1, ys[last] - y1
+        length2 = dx * dx + dy * dy
+        max_distance2 = 0.0
+        index = first
+        for i in range(first + 1, last):
+            px, py = xs[i] - x1, ys[i] - y1
+            if length2:
+                t = (px * dx + py * dy) / length2
+                if t < 0.0:
+                    t = 0.0
+                elif t > 1.0:
+                    t = 1.0
+                px -= t * dx
+                py -= t * dy
+            distance2 = px * px + py * py
+            if distance2 > max_distance2:
+                max_distance2 = distance2
+                index = i
+        if max_distance2 > tolerance2:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return keep
+
+
+def _visvalingam(xs, ys, tolerance):
+    """
+    Keep flags for Visvalingam-Whyatt: points are removed smallest effective
+    area first. A point is only removed while it lies within `tolerance`
+    metres of the line between its current neighbours (triangle height), so
+    both methods take the same tolerance.
+    """
+    n = len(xs)
+    keep = [True] * n
+    if n < 3:
+        return keep
+
+    def area(i, j, k):
+        return abs((xs[j] - xs[i]) * (ys[k] - ys[i]) - (xs[k] - xs[i]) * (ys[j] - ys[i])) * 0.5
+
+    previous = list(range(-1, n - 1))
+    following = list(range(1, n + 1))
+    areas = [0.0] * n
+    heap = []
+    for i in range(1, n - 1):
+        areas[i] = area(i - 1, i, i + 1)
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    while heap:
+        value, i = heapq.heappop(heap)
+        if not keep[i] or value != areas[i]:
+            continue
+        p, q = previous[i], following[i]
+        base = math.hypot(xs[q] - xs[p], ys[q] - ys[p])
+        if base and 2 * value / base >= tolerance:
+            continue  # significant for now; re-queued if a neighbour goes
+        keep[i] = False
+        following[p] = q
+        previous[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = area(previous[j], j, following[j])
+                heapq.heappush(heap, (areas[j], j))
+    return keep
+
+
+SIMPLIFIERS = {
+    'dp': _douglas_peucker,
+    'visvalingam': _visvalingam,
+}
+
+
+class TrackSimplifier:
+    """
+    One-pass track simplification for map display.
+    - points (GPSFix or positions row dicts, in time order) go through a
+      time / distance downsampler (at most one point per `min_interval`
+      seconds and `min_distance` metres) and are buffered between anchors
+    - anchors are always kept: first and last point, alarms, ACC changes and
+      the first and last point of every stop (speed below `stop_speed` km/h)
+    - each run between two anchors is simplified with Douglas-Peucker or
+      Visvalingam with a `tolerance` in metres (local equirectangular
+      projection) and emitted as soon as the closing anchor arrives; runs
+      longer than `max_buffer` points are closed early to bound memory
+
+    add() returns the points that became final; finish() returns the rest.
+    """
+
+    def __init__(self, tolerance=5.0, method='dp', min_interval=None, min_distance=None,
+                 stop_speed=1.0, max_buffer=5000):
+        if method not in SIMPLIFIERS:
+            raise ValueError(f"Unknown simplification method: {method}")
+        self.tolerance = tolerance
+        self.simplify = SIMPLIFIERS[method]
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.stop_speed = stop_speed
+        self.max_buffer = max_buffer
+
+        self._origin = None
+        self._scale_x = None
+        self._segment = []  # (point, x, y); first item is the opening anchor
+        self._previous = None  # last point seen, kept or not
+        self._last_kept = None  # (x, y, epoch) of the last buffered point
+        self.stats = {'points': 0, 'kept': 0}
+
+    def _project(self, lat, lng):
+        if self._origin is None:
+            self._origin = (lat, lng)
+            self._scale_x = METRES_PER_DEGREE * math.cos(math.radians(lat))
+        return (lng - self._origin[1]) * self._scale_x, (lat - self._origin[0]) * METRES_PER_DEGREE
+
+    def add(self, point):
+        lat, lng, epoch, speed, alarm, acc = _point_fields(point)
+        x, y = self._project(lat, lng)
+        self.stats['points'] += 1
+        item = (point, x, y)
+        stopped = speed < self.stop_speed
+
+        previous = self._previous
+        self._previous = (item, epoch, stopped, acc)
+        if previous is None:
+            self._buffer(item, epoch)
+            return []
+
+        previous_item, previous_epoch, previous_stopped, previous_acc = previous
+        emitted = []
+        if previous_stopped and not stopped:
+            # End of a stop: its last point is an anchor even if downsampled
+            if self._segment[-1] is not previous_item:
+                self._buffer(previous_item, previous_epoch)
+            emitted = self._close()
+        elif len(self._segment) >= self.max_buffer:
+            # Long run: the last buffered point becomes an anchor
+            emitted = self._close()
+
+        if alarm or acc != previous_acc or (stopped and not previous_stopped):
+            self._buffer(item, epoch)
+            return emitted + self._close()
+
+        if self._keep_sample(x, y, epoch):
+            self._buffer(item, epoch)
+        return emitted
+
+    def _keep_sample(self, x, y, epoch):
+        last_x, last_y, last_epoch = self._last_kept
+        if self.min_interval is not None and epoch is not None and last_epoch is not None:
+            if epoch - last_epoch < self.min_interval:
+                return False
+        if self.min_distance is not None:
+            if math.hypot(x - last_x, y - last_y) < self.min_distance:
+                return False
+        return True
+
+    def _buffer(self, item, epoch):
+        self._segment.append(item)
+        last_epoch = self._last_kept[2] if self._last_kept else None
+        self._last_kept = (item[1], item[2], epoch if epoch is not None else last_epoch)
+
+    def _close(self, final=False):
+        """
+        Simplifies the buffered run; keeps its last point as the opening
+        anchor of the next run unless `final`.
+        """
+        segment = self._segment
+        if len(segment) < 2:
+            if final:
+                self._segment = []
+                self.stats['kept'] += len(segment)
+                return [item[0] for item in segment]
+            return []
+        keep = self.simplify([item[1] for item in segment], [item[2] for item in segment], self.tolerance)
+        end = len(segment) if final else len(segment) - 1
+        kept = [segment[i][0] for i in range(end) if keep[i]]
+        self._segment = [] if final else [segment[-1]]
+        self.stats['kept'] += len(kept)
+        return kept
+
+    def finish(self):
+        """
+        Flushes the last run (its last point is always kept).
+        """
+        if self._previous is not None and self._segment and self._segment[-1] is not self._previous[0]:
+            self._segment.append(self._previous[0])
+        self._previous = None
+        return self._close(final=True)
+
+
+def simplify_track(points, tolerance=5.0, method='dp', min_interval=None, min_distance=None, stop_speed=1.0):
+    """
+    Simplified copy of a whole track (list of the kept input points).
+    """
+    simplifier = TrackSimplifier(tolerance, method, min_interval, min_distance, stop_speed)
+    kept = []
+    for point in points:
+        kept.extend(simplifier.add(point))
+    kept.extend(simplifier.finish())
+    return kept
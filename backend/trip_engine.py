@@ -0,0 +1,274 @@
+import math
+import time
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # numpy only speeds up haversine_many()
+    np = None
+
+from device_state_engine import MOVING, IDLING, PARKED, classify
+from universal_gps_parser import GPSFix, epoch_to_timestamp
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in metres.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def haversine_many(lats, lngs):
+    """
+    Distances in metres between consecutive points (len(lats) - 1 values),
+    vectorized when NumPy is available.
+    """
+    if np is None:
+        return [haversine_m(lats[i], lngs[i], lats[i + 1], lngs[i + 1]) for i in range(len(lats) - 1)]
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lngs, dtype=np.float64))
+    a = np.sin(np.diff(phi) / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.diff(lam) / 2) ** 2
+    return (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))).tolist()
+
+
+class Trip:
+    """
+    One trip: ACC on (moving or idling) until the device is parked.
+    Times are epoch seconds, distance in metres, speeds in km/h.
+    """
+
+    __slots__ = ('imei', 'start_time', 'end_time', 'start_lat', 'start_lng', 'end_lat', 'end_lng',
+                 'distance', 'max_speed', 'moving_time', 'idle_time', 'fixes')
+
+    def __init__(self, imei, fix, at):
+        self.imei = imei
+        self.start_time = at
+        self.end_time = at
+        self.start_lat = self.end_lat = fix.latitude
+        self.start_lng = self.end_lng = fix.longitude
+        self.distance = 0.0
+        self.max_speed = fix.speed or 0.0
+        self.moving_time = 0.0
+        self.idle_time = 0.0
+        self.fixes = 1
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    @property
+    def avg_speed(self):
+        """
+        Average speed while moving (km/h).
+        """
+        return self.distance / self.moving_time * 3.6 if self.moving_time else 0.0
+
+    def to_dict(self):
+        return {
+            'imei': self.imei,
+            'start_time': epoch_to_timestamp(self.start_time),
+            'end_time': epoch_to_timestamp(self.end_time),
+            'start': (self.start_lat, self.start_lng),
+            'end': (self.end_lat, self.end_lng),
+            'distance_km': round(self.distance / 1000, 3),
+            'max_speed': self.max_speed,
+            'avg_speed': round(self.avg_speed, 1),
+            'moving_time': self.moving_time,
+            'idle_time': self.idle_time,
+            'fixes': self.fixes,
+        }
+
+    def __repr__(self):
+        return (f"Trip(imei={self.imei!r}, start={epoch_to_timestamp(self.start_time)!r}, "
+                f"end={epoch_to_timestamp(self.end_time)!r}, km={self.distance / 1000:.2f})")
+
+
+class DeviceOdometer:
+    """
+    Per-device running totals (one row of the engine's table).
+    """
+
+    __slots__ = ('imei', 'odometer', 'state', 'trip', 'trips', 'last_time', 'ref_lat', 'ref_lng', 'ref_time')
+
+    def __init__(self, imei, keep_trips):
+        self.imei = imei
+        self.odometer = 0.0
+        self.state = None
+        self.trip = None
+        self.trips = deque(maxlen=keep_trips)
+        self.last_time = None
+        # Last accepted valid position: distances are measured from here
+        self.ref_lat = None
+        self.ref_lng = None
+        self.ref_time = None
+
+
+class TripEngine:
+    """
+    Incremental trip segmentation and odometer per IMEI.
+    - a trip starts on the first fix that is not parked (ACC on) and ends on
+      the first parked fix (moving / idling / parked as in trackingService.ts)
+    - distance accumulates between consecutive valid fixes (gps_status A/F)
+      inside a trip, including the step from the parked position to the
+      trip's first fix; invalid fixes, steps implying more than `max_speed`
+      km/h and idle drift under `min_move` metres are treated as jitter
+    - time between fixes counts as moving or idle time, up to `max_gap`
+      seconds (longer gaps are offline time)
+    - completed trips are kept per device (last `keep_trips`) and folded into
+      per-device daily totals, so reports are dictionary lookups
+
+    apply() takes fixes in time order per device and returns trip events;
+    process_history() runs the same code over stored rows with the
+    distances precomputed by haversine_many().
+    """
+
+    def __init__(self, max_speed=250.0, min_move=15.0, max_gap=300.0, keep_trips=50):
+        self.max_speed = max_speed
+        self.min_move = min_move
+        self.max_gap = max_gap
+        self.keep_trips = keep_trips
+        self.devices = {}
+        self.daily = {}  # (imei, 'YYYY-MM-DD') -> totals dict
+        self.stats = {'fixes': 0, 'jitter': 0, 'trips': 0}
+
+    def get(self, imei):
+        return self.devices.get(imei)
+
+    def apply(self, fix, step=None, now=None):
+        """
+        Applies one fix. `step` may carry a precomputed (from_lat, from_lng,
+        metres); it is used when it starts at the device's reference point.
+        Returns a list of events ({'event': 'trip_started' | 'trip_ended',
+        'trip': Trip}).
+        """
+        fix = GPSFix.from_result(fix)
+        if fix is None or fix.type != 'location_update' or fix.latitude is None or fix.longitude is None:
+            return []
+        self.stats['fixes'] += 1
+        at = fix.timestamp if fix.timestamp is not None else (time.time() if now is None else now)
+
+        device = self.devices.get(fix.imei)
+        if device is None:
+            device = self.devices[fix.imei] = DeviceOdometer(fix.imei, self.keep_trips)
+
+        state = classify(fix)
+        trip = device.trip
+
+        if trip is not None and device.last_time is not None:
+            elapsed = at - device.last_time
+            if 0 < elapsed <= self.max_gap:
+                if device.state == MOVING:
+                    trip.moving_time += elapsed
+                elif device.state == IDLING:
+                    trip.idle_time += elapsed
+
+        # A trip starts before its first step is measured, so the distance
+        # from the parked position to the first fix counts towards it
+        started = trip is None and state != PARKED
+        if started:
+            trip = device.trip = Trip(fix.imei, fix, at)
+            self.stats['trips'] += 1
+
+        if not fix.gps_valid:
+            self.stats['jitter'] += 1
+        elif device.ref_lat is None:
+            device.ref_lat, device.ref_lng, device.ref_time = fix.latitude, fix.longitude, at
+        else:
+            if step is not None and step[0] == device.ref_lat and step[1] == device.ref_lng:
+                distance = step[2]
+            else:
+                distance = haversine_m(device.ref_lat, device.ref_lng, fix.latitude, fix.longitude)
+            elapsed = at - device.ref_time
+            too_fast = distance > 0 and (elapsed <= 0 or distance / elapsed * 3.6 > self.max_speed)
+            if too_fast or (state != MOVING and distance < self.min_move):
+                if distance:
+                    self.stats['jitter'] += 1
+            else:
+                if trip is not None:
+                    trip.distance += distance
+                    device.odometer += distance
+                device.ref_lat, device.ref_lng, device.ref_time = fix.latitude, fix.longitude, at
+
+        events = []
+        if started:
+            events.append({'event': 'trip_started', 'trip': trip})
+        elif trip is not None:
+            trip.end_time = at
+            trip.end_lat, trip.end_lng = fix.latitude, fix.longitude
+            trip.fixes += 1
+            if fix.speed and fix.speed > trip.max_speed:
+                trip.max_speed = fix.speed
+            if state == PARKED:
+                device.trip = None
+                device.trips.append(trip)
+                self._add_daily(trip)
+                events.append({'event': 'trip_ended', 'trip': trip})
+
+        device.state = state
+        device.last_time = at
+        return events
+
+    def _add_daily(self, trip):
+        key = (trip.imei, epoch_to_timestamp(trip.start_time)[:10])
+        totals = self.daily.get(key)
+        if totals is None:
+            totals = self.daily[key] = {'trips': 0, 'distance': 0.0, 'moving_time': 0.0,
+                                        'idle_time': 0.0, 'max_speed': 0.0}
+        totals['trips'] += 1
+        totals['distance'] += trip.distance
+        totals['moving_time'] += trip.moving_time
+        totals['idle_time'] += trip.idle_time
+        totals['max_speed'] = max(totals['max_speed'], trip.max_speed)
+
+    def apply_many(self, fixes, now=None):
+        events = []
+        for fix in fixes:
+            events.extend(self.apply(fix, now=now))
+        return events
+
+    def process_history(self, fixes):
+        """
+        Batch mode over stored history (fixes of any devices, time ordered per
+        device): groups by IMEI, computes each device's steps between
+        consecutive valid fixes in one vectorized haversine_many() pass and
+        runs apply() with them. Returns the events.
+        """
+        by_device = {}
+        for fix in fixes:
+            fix = GPSFix.from_result(fix)
+            if fix is not None and fix.type == 'location_update' and fix.latitude is not None and fix.longitude is not None:
+                by_device.setdefault(fix.imei, []).append(fix)
+
+        events = []
+        for device_fixes in by_device.values():
+            valid = [fix for fix in device_fixes if fix.gps_valid]
+            lats = [fix.latitude for fix in valid]
+            lngs = [fix.longitude for fix in valid]
+            steps = {id(valid[i + 1]): (lats[i], lngs[i], metres)
+                     for i, metres in enumerate(haversine_many(lats, lngs))}
+            for fix in device_fixes:
+                events.extend(self.apply(fix, steps.get(id(fix))))
+        return events
+
+    def summary(self, imei, day=None):
+        """
+        Odometer, current / last trip and (for `day` 'YYYY-MM-DD') that day's
+        totals for one device.
+        """
+        device = self.devices.get(imei)
+        if device is None:
+            return None
+        return {
+            'imei': imei,
+            'odometer_km': round(device.odometer / 1000, 3),
+            'state': device.state,
+            'current_trip': device.trip.to_dict() if device.trip else None,
+            'last_trip': device.trips[-1].to_dict() if device.trips else None,
+            'day': self.daily.get((imei, day)) if day else None,
+        }
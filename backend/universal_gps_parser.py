@@ -1,6 +1,216 @@
 import re
+import sys
+import time
+import calendar
 import datetime
 
+
+# Standard packet trigger (parts[1]) -> alarm name. Mirrors parser/tk103.ts
+STANDARD_ALARMS = {
+    'help me': 'sos',
+    'low battery': 'low_battery',
+    'move': 'movement',
+    'speed': 'overspeed',
+    'stockade': 'geofence',
+    'accalarm': 'acc_alarm',
+}
+
+
+class GPSFix:
+    """
+    Compact, slotted fix record. Alternative to the per-message result dict
+    when millions of fixes are held in memory (trip/state analysis).
+    - timestamp is epoch seconds (UTC)
+    - flags is a bitmask of the FLAG_* constants
+    - raw is only kept when requested (keep_raw=True)
+    """
+    __slots__ = ('type', 'format', 'imei', 'timestamp', 'latitude', 'longitude',
+                 'speed', 'course', 'flags', 'fuel', 'alarm', 'raw')
+
+    FLAG_GPS_VALID = 1
+    FLAG_ACC = 2
+    FLAG_DOOR = 4
+    FLAG_ALARM = 8
+
+    def __init__(self, type, format, imei, timestamp=None, latitude=None, longitude=None,
+                 speed=0.0, course=0.0, flags=0, fuel=None, alarm=None, raw=None):
+        self.type = type
+        self.format = format
+        self.imei = imei
+        self.timestamp = timestamp
+        self.latitude = latitude
+        self.longitude = longitude
+        self.speed = speed
+        self.course = course
+        self.flags = flags
+        self.fuel = fuel
+        self.alarm = alarm
+        self.raw = raw
+
+    @property
+    def gps_valid(self):
+        return bool(self.flags & GPSFix.FLAG_GPS_VALID)
+
+    @property
+    def acc_status(self):
+        return bool(self.flags & GPSFix.FLAG_ACC)
+
+    @property
+    def door_status(self):
+        return bool(self.flags & GPSFix.FLAG_DOOR)
+
+    @classmethod
+    def from_result(cls, result, keep_raw=False):
+        """
+        Builds a record from a parse_message() result dict.
+        GPSFix instances are passed through unchanged, None stays None.
+        """
+        if result is None or isinstance(result, cls):
+            return result
+        if isinstance(result, LazyMessage):
+            return result.fix()
+
+        flags = 0
+        if result.get('gps_status') in ('A', 'F'):
+            flags |= cls.FLAG_GPS_VALID
+        if result.get('acc_status'):
+            flags |= cls.FLAG_ACC
+        if result.get('door_status'):
+            flags |= cls.FLAG_DOOR
+        alarm = result.get('alarm')
+        if alarm:
+            flags |= cls.FLAG_ALARM
+
+        timestamp = result.get('timestamp')
+        return cls(
+            result['type'],
+            result.get('format'),
+            sys.intern(result['imei']),
+            _timestamp_to_epoch(timestamp) if timestamp else None,
+            result.get('latitude'),
+            result.get('longitude'),
+            result.get('speed', 0.0),
+            result.get('direction', 0.0),
+            flags,
+            result.get('fuel_tank1'),
+            alarm,
+            result.get('raw_data') if keep_raw else None,
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in GPSFix.__slots__}
+
+    def __repr__(self):
+        return (f"GPSFix(imei={self.imei!r}, type={self.type!r}, timestamp={self.timestamp}, "
+                f"lat={self.latitude}, lon={self.longitude}, speed={self.speed}, flags={self.flags})")
+
+
+class LazyMessage:
+    """
+    Header-only parse result (UniversalGPSParser.parse_header): type, format
+    and IMEI come from one short scan of the payload. The rest is decoded by
+    the full parser on first access of fix() or any GPSFix field, then cached.
+    - the header scan only validates what it reads; a packet with a good
+      header but a broken body decodes to fix() None (fields read as None)
+    - payload is the stripped raw packet (bytes)
+    """
+    __slots__ = ('type', 'format', 'imei', 'payload', '_fix')
+
+    _PENDING = object()
+
+    def __init__(self, type, format, imei, payload, fix=_PENDING):
+        self.type = type
+        self.format = format
+        self.imei = imei
+        self.payload = payload
+        self._fix = fix
+
+    @property
+    def decoded(self):
+        return self._fix is not LazyMessage._PENDING
+
+    def fix(self, keep_raw=False):
+        """
+        The fully decoded GPSFix (or None if the body does not parse).
+        """
+        if self._fix is LazyMessage._PENDING:
+            self._fix = UniversalGPSParser.parse_message(self.payload, record=True, keep_raw=keep_raw)
+        return self._fix
+
+    def __repr__(self):
+        return (f"LazyMessage(imei={self.imei!r}, type={self.type!r}, format={self.format!r}, "
+                f"decoded={self.decoded})")
+
+
+def _decoded_field(name):
+    def get(self):
+        fix = self.fix()
+        return getattr(fix, name) if fix is not None else None
+    return property(get, doc=f"GPSFix.{name}, decoded on first access")
+
+
+for _name in ('timestamp', 'latitude', 'longitude', 'speed', 'course', 'flags', 'fuel', 'alarm',
+              'gps_valid', 'acc_status', 'door_status'):
+    setattr(LazyMessage, _name, _decoded_field(_name))
+
+
+_IMEI_RE = re.compile(r'imei:(\d+)')
+
+# Raw socket buffers accepted by parse_message (see UniversalGPSParser._route_bytes)
+BYTES_TYPES = (bytes, bytearray, memoryview)
+_BYTES_WHITESPACE = b' \t\n\r\x0b\x0c'
+
+
+def _ddmm_bytes_to_decimal(coord, direction):
+    """
+    Bytes counterpart of UniversalGPSParser._convert_ddmm_to_decimal.
+    """
+    if not coord or not direction:
+        return None
+    try:
+        val = float(coord)
+    except ValueError:
+        return None
+    deg = int(val / 100)
+    decimal = deg + ((val - (deg * 100)) / 60)
+    if direction in (b'S', b'W', b's', b'w'):
+        decimal = -decimal
+    return decimal
+
+
+def _timestamp_to_epoch(timestamp):
+    """
+    'YYYY-MM-DD HH:MM:SS' (as produced by the parser, UTC) -> epoch seconds.
+    """
+    try:
+        return calendar.timegm((
+            int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]),
+        ))
+    except (TypeError, ValueError):
+        return None
+
+
+def _reject(reason, payload=None, detail=None):
+    """
+    Reports why a message is returned as None (see parser_metrics.py);
+    a no-op while UniversalGPSParser.metrics is None.
+    """
+    metrics = UniversalGPSParser.metrics
+    if metrics is not None:
+        metrics.reject(reason, payload, detail)
+    return None
+
+
+def epoch_to_timestamp(epoch):
+    """
+    Epoch seconds -> 'YYYY-MM-DD HH:MM:SS' (UTC), the parser's timestamp format.
+    """
+    if epoch is None:
+        return None
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
 class UniversalGPSParser:
     """
     Comprehensive class for parsing GPS tracker data.
@@ -8,43 +218,225 @@ class UniversalGPSParser:
     - gps_tracker.py (Main data parser)
     - monitor_gps_server_v2.py (Heartbeat/Regex parser)
     - gps_server.py / test_gps.py (Message type identification)
+
+    Messages are routed through a first-character dispatch table
+    (see register_format, formats are registered at the bottom of this module).
     """
+
+    # first char -> ((prefix, handler), ...) for str / first byte -> same for bytes
+    _dispatch = {}
+    _bytes_dispatch = {}
+    # first byte -> ((prefix, header_handler), ...) for parse_header
+    _header_dispatch = {}
+
+    # ParserMetrics instance, or None (default) to skip all instrumentation
+    metrics = None
     
     @staticmethod
-    def parse_message(message):
+    def parse_message(message, record=False, keep_raw=False):
         """
         Main entry point. Inspects the message and routes to the appropriate parser.
+        Accepts str, or bytes/bytearray/memoryview straight from the socket.
+        With record=True a compact GPSFix is returned instead of the result dict
+        (the raw payload is only kept on the record if keep_raw=True).
+        """
+        if UniversalGPSParser.metrics is not None:
+            return UniversalGPSParser._parse_measured(message, record, keep_raw)
+        if isinstance(message, BYTES_TYPES):
+            return UniversalGPSParser._route_bytes(message, record, keep_raw)
+
+        result = UniversalGPSParser._route_message(message)
+        if record and result is not None:
+            return GPSFix.from_result(result, keep_raw)
+        return result
+
+    @staticmethod
+    def _parse_measured(message, record, keep_raw):
+        """
+        parse_message() with metrics enabled: same routing, timed.
         """
+        started = time.perf_counter_ns()
+        if isinstance(message, BYTES_TYPES):
+            result = UniversalGPSParser._route_bytes(message, record, keep_raw)
+        else:
+            result = UniversalGPSParser._route_message(message)
+            if record and result is not None:
+                result = GPSFix.from_result(result, keep_raw)
+        UniversalGPSParser.metrics.observe(result, time.perf_counter_ns() - started, message)
+        return result
+
+    @staticmethod
+    def enable_metrics(metrics=None):
+        """
+        Turns instrumentation on (a fresh ParserMetrics unless one is given)
+        and returns the metrics object.
+        """
+        if metrics is None:
+            from parser_metrics import ParserMetrics
+            metrics = ParserMetrics()
+        UniversalGPSParser.metrics = metrics
+        return metrics
+
+    @staticmethod
+    def disable_metrics():
+        UniversalGPSParser.metrics = None
+
+    @staticmethod
+    def _route_message(message):
         if not message or not isinstance(message, str):
-            return None
-            
+            return _reject('empty')
+
         message = message.strip()
-        
-        # 1. Standard Data Packet (imei:...)
-        # Handled by gps_tracker.py logic and monitor_gps_server_v2.py
-        if message.startswith('imei:'):
-            return UniversalGPSParser.parse_standard_data(message)
-            
-        # 2. Simple Heartbeat (Just IMEI)
-        # Handled by monitor_gps_server_v2.py
-        # Pattern: 15 digits followed by semicolon
-        if re.match(r'^\d{15};?$', message):
-            return {
-                'type': 'heartbeat_simple',
-                'imei': message.strip(';')
-            }
+        if not message:
+            return _reject('empty')
+
+        # First-character dispatch: at most a couple of startswith() per packet
+        for prefix, handler in UniversalGPSParser._dispatch.get(message[0], ()):
+            if message.startswith(prefix):
+                return handler(message)
+        return _reject('unknown_prefix', message)
+
+    @staticmethod
+    def parse_header(message):
+        """
+        Lazy mode for routing / filtering: returns a LazyMessage with type,
+        format and IMEI only (None for what parse_message would reject by its
+        header). Accepts str or bytes; str is encoded as latin-1 once.
+        """
+        if isinstance(message, str):
+            message = message.encode('latin-1', 'replace')
+        elif isinstance(message, memoryview):
+            message = message.tobytes()
+        elif not isinstance(message, BYTES_TYPES):
+            return _reject('empty')
 
-        # 3. Command/Heartbeat (##,imei:...)
-        # Observed in gps_server.py and test_gps.py
-        if message.startswith('##,imei:'):
-            return UniversalGPSParser.parse_command_heartbeat(message)
+        start, end = 0, len(message)
+        while start < end and message[start] in _BYTES_WHITESPACE:
+            start += 1
+        while end > start and message[end - 1] in _BYTES_WHITESPACE:
+            end -= 1
+        if start == end:
+            return _reject('empty')
 
-        # 4. HQ Data Packet (*HQ,...)
-        # Observed in gps_server.py and test_gps.py
-        if message.startswith('*HQ,'):
-            return UniversalGPSParser.parse_hq_data(message)
+        for prefix, handler in UniversalGPSParser._header_dispatch.get(message[start], ()):
+            if message.startswith(prefix, start):
+                return handler(message, start, end)
+        return _reject('unknown_prefix', message[start:end])
 
-        return None
+    @staticmethod
+    def register_format(prefix, handler, bytes_handler=None, first_chars=None, header_handler=None):
+        """
+        Registers a message format in the dispatch table.
+        - handler(message) receives the stripped str message and returns a result dict or None
+        - bytes_handler(buf, start, end, record, keep_raw) is the optional raw buffer
+          counterpart; without it bytes input is decoded and passed to handler
+        - first_chars lists the leading characters to route on when the prefix is
+          empty (e.g. the digits of a bare IMEI heartbeat); defaults to prefix[0]
+        - header_handler(buf, start, end) returns a LazyMessage for parse_header;
+          without it parse_header decodes the message fully
+        Longer prefixes sharing a first character are tried first.
+        """
+        if bytes_handler is None:
+            bytes_handler = UniversalGPSParser._decoding_handler(handler)
+        if header_handler is None:
+            header_handler = UniversalGPSParser._decoded_header(bytes_handler)
+        bytes_prefix = prefix.encode('latin-1')
+
+        for char in (first_chars or prefix[0]):
+            entries = UniversalGPSParser._dispatch.get(char, ()) + ((prefix, handler),)
+            UniversalGPSParser._dispatch[char] = tuple(sorted(entries, key=lambda e: -len(e[0])))
+
+            byte = ord(char)
+            entries = UniversalGPSParser._bytes_dispatch.get(byte, ()) + ((bytes_prefix, bytes_handler),)
+            UniversalGPSParser._bytes_dispatch[byte] = tuple(sorted(entries, key=lambda e: -len(e[0])))
+
+            entries = UniversalGPSParser._header_dispatch.get(byte, ()) + ((bytes_prefix, header_handler),)
+            UniversalGPSParser._header_dispatch[byte] = tuple(sorted(entries, key=lambda e: -len(e[0])))
+
+    @staticmethod
+    def _decoding_handler(handler):
+        def parse_bytes(buf, start, end, record, keep_raw):
+            result = handler(buf[start:end].decode('latin-1'))
+            if record and result is not None:
+                return GPSFix.from_result(result, keep_raw)
+            return result
+        return parse_bytes
+
+    @staticmethod
+    def _decoded_header(bytes_handler):
+        # Formats without a header scan (heartbeats: the header is the message)
+        def parse_header(buf, start, end):
+            fix = bytes_handler(buf, start, end, True, False)
+            if fix is None:
+                return None
+            return LazyMessage(fix.type, fix.format, fix.imei, buf[start:end], fix)
+        return parse_header
+
+    @staticmethod
+    def _standard_header(buf, start, end):
+        digits_end = start + 5
+        while digits_end < end and 0x30 <= buf[digits_end] <= 0x39:
+            digits_end += 1
+        if digits_end == start + 5:
+            return _reject('bad_imei', buf[start:end])
+        return LazyMessage('location_update', 'standard', sys.intern(buf[start + 5:digits_end].decode('ascii')),
+                           buf[start:end])
+
+    @staticmethod
+    def _hq_header(buf, start, end):
+        comma = buf.find(b',', start + 4, end)
+        if comma == -1:
+            return _reject('too_few_fields', buf[start:end])
+        return LazyMessage('location_update', 'hq', sys.intern(buf[start + 4:comma].decode('latin-1')),
+                           buf[start:end])
+
+    @staticmethod
+    def _simulator_header(buf, start, end):
+        if buf[end - 1] != 0x29:  # ')'
+            return _reject('too_few_fields', buf[start:end])
+        comma = buf.find(b',', start + 1, end)
+        if comma == -1:
+            return _reject('not_a_fix', buf[start:end])
+        return LazyMessage('location_update', 'simulator', sys.intern(buf[start + 1:comma].decode('latin-1')),
+                           buf[start:end])
+
+    @staticmethod
+    def iter_parse(messages, skip_invalid=False, record=False, keep_raw=False):
+        """
+        Lazily parses an iterable of messages (list, file lines, socket chunks).
+        Yields one result per input, or only the valid ones if skip_invalid is set.
+        """
+        parse = UniversalGPSParser.parse_message
+        if skip_invalid:
+            for message in messages:
+                result = parse(message, record, keep_raw)
+                if result is not None:
+                    yield result
+        else:
+            for message in messages:
+                yield parse(message, record, keep_raw)
+
+    @staticmethod
+    def parse_many(messages, record=False, keep_raw=False):
+        """
+        Bulk mode. Parses the whole batch at once and returns (results, summary).
+        results keeps input order (None for unparseable messages).
+        summary counts messages per format ('standard', 'hq', 'simulator',
+        'heartbeat_simple', 'heartbeat_command') plus 'invalid'.
+        """
+        parse = UniversalGPSParser.parse_message
+        results = [parse(message, record, keep_raw) for message in messages]
+
+        summary = {}
+        for result in results:
+            if result is None:
+                key = 'invalid'
+            elif record:
+                key = result.format or result.type
+            else:
+                key = result.get('format') or result['type']
+            summary[key] = summary.get(key, 0) + 1
+        return results, summary
 
     @staticmethod
     def parse_standard_data(message):
@@ -61,18 +453,18 @@ class UniversalGPSParser:
             parts = message.strip(';').split(',')
             
             # Extract IMEI
-            imei_match = re.match(r'imei:(\d+)', parts[0])
+            imei_match = _IMEI_RE.match(parts[0])
             if not imei_match:
-                return None
+                return _reject('bad_imei', message)
             imei = imei_match.group(1)
 
             # Need enough parts for basic location
             if len(parts) < 12: 
-                return None
+                return _reject('too_few_fields', message)
 
             # Parse datetime
-            # Format usually YYMMDDHHMM
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # Format usually YYMMDDHHMM; without one the consumer's arrival time applies
+            timestamp = None
             if len(parts) > 2:
                 date_time = parts[2]
                 if len(date_time) >= 10:
@@ -132,10 +524,15 @@ class UniversalGPSParser:
                 if '%' in parts[17]:
                     result['fuel_tank2'] = float(parts[17].strip('%'))
 
+            # Alarm / Status detection (same rules as parser/tk103.ts)
+            # Trigger is at index 1 ("tracker", "help me", "low battery", ...)
+            result['alarm'] = STANDARD_ALARMS.get(parts[1].lower())
+            result['acc_status'] = 'State:ACC=1' in message or 'acc on' in message
+            result['door_status'] = 'Door=1' in message
+
             return result
         except Exception as e:
-            print(f"Error parsing standard data: {e}")
-            return None
+            return _reject('parse_error', message, f"standard: {e}")
 
     @staticmethod
     def parse_command_heartbeat(message):
@@ -155,7 +552,7 @@ class UniversalGPSParser:
                 }
         except Exception:
             pass
-        return None
+        return _reject('bad_imei', message)
 
     @staticmethod
     def parse_hq_data(message):
@@ -172,7 +569,7 @@ class UniversalGPSParser:
             parts = content.split(',')
             
             if len(parts) < 10:
-                return None
+                return _reject('too_few_fields', message)
                 
             imei = parts[1]
             time_str = parts[3] # HHMMSS
@@ -184,7 +581,9 @@ class UniversalGPSParser:
             lon_dir = parts[8]
             
             speed = parts[9]
+            course = parts[10] if len(parts) > 10 else ''
             date_str = parts[11] # DDMMYY
+            vehicle_state = parts[12] if len(parts) > 12 else '' # Hex status (FFFFFFFF)
             
             # Construct timestamp
             # Date: DDMMYY -> 20YY-MM-DD
@@ -207,13 +606,280 @@ class UniversalGPSParser:
                 'raw_data': message,
                 'latitude': UniversalGPSParser._convert_ddmm_to_decimal(raw_lat, lat_dir),
                 'longitude': UniversalGPSParser._convert_ddmm_to_decimal(raw_lon, lon_dir),
-                'speed': float(speed) if speed else 0.0
+                'speed': float(speed) if speed else 0.0,
+                'direction': float(course) if course else 0.0,
+                'acc_status': False,
+                'door_status': False
             }
+
+            # Hex status decoding (Bit 0: ACC, Bit 1: Door)
+            if len(vehicle_state) >= 2:
+                try:
+                    state_val = int(vehicle_state, 16)
+                    result['acc_status'] = (state_val & 1) == 1
+                    result['door_status'] = (state_val & 2) == 2
+                except ValueError:
+                    pass
             return result
             
         except Exception as e:
-            print(f"Error parsing HQ data: {e}")
-            return None
+            return _reject('parse_error', message, f"hq: {e}")
+
+    @staticmethod
+    def parse_simulator_data(message):
+        """
+        Parses the simulator format (same rules as parser/tk103.ts):
+        (ID,LOC,LAT,LNG,SPEED,ACC,DISTANCE,GPS)
+        Coordinates are already decimal degrees. There is no device time, so
+        timestamp is None and consumers use the arrival time (as for
+        heartbeats).
+        The BP05 login frame "(0<IMEI>BP05)" has a single field and is not a fix.
+        """
+        try:
+            if not message.endswith(')'):
+                return _reject('too_few_fields', message)
+            parts = message[1:-1].split(',')
+            if len(parts) == 1:
+                return _reject('not_a_fix', message)
+            if len(parts) < 4:
+                return _reject('too_few_fields', message)
+
+            speed = float(parts[4]) if len(parts) > 4 and parts[4] else 0.0
+            if len(parts) > 5 and parts[5]:
+                acc_status = parts[5] == '1'
+            else:
+                acc_status = speed > 0
+            gps_valid = parts[7] == '1' if len(parts) > 7 and parts[7] else True
+
+            return {
+                'type': 'location_update',
+                'format': 'simulator',
+                'imei': parts[0],
+                'timestamp': None,
+                'gps_status': 'A' if gps_valid else 'V',
+                'raw_data': message,
+                'latitude': float(parts[2]),
+                'longitude': float(parts[3]),
+                'speed': speed,
+                'acc_status': acc_status,
+                'trip_distance': float(parts[6]) if len(parts) > 6 and parts[6] else 0.0
+            }
+        except ValueError as e:
+            return _reject('parse_error', message, f"simulator: {e}")
+
+    @staticmethod
+    def _route_bytes(buf, record=False, keep_raw=False):
+        """
+        Raw socket buffer path. The packet is never decoded as a whole: it is
+        split once (bounded to the fields that are used) and numeric fields are
+        converted straight from bytes. Only IMEI/status text is decoded, plus the
+        full payload for 'raw_data' (dict output, or records with keep_raw=True).
+        """
+        if isinstance(buf, memoryview):
+            # memoryview has no find/split; one flat copy, still no decoding
+            buf = buf.tobytes()
+
+        start, end = 0, len(buf)
+        while start < end and buf[start] in _BYTES_WHITESPACE:
+            start += 1
+        while end > start and buf[end - 1] in _BYTES_WHITESPACE:
+            end -= 1
+        if start == end:
+            return _reject('empty')
+
+        for prefix, handler in UniversalGPSParser._bytes_dispatch.get(buf[start], ()):
+            if buf.startswith(prefix, start):
+                return handler(buf, start, end, record, keep_raw)
+        return _reject('unknown_prefix', buf[start:end])
+
+    @staticmethod
+    def parse_simple_heartbeat(message):
+        """
+        Parses a bare IMEI heartbeat: 15 digits, optional trailing semicolon.
+        """
+        imei = message[:-1] if message.endswith(';') else message
+        if len(imei) == 15 and imei.isdecimal():
+            return {
+                'type': 'heartbeat_simple',
+                'imei': imei
+            }
+        return _reject('bad_imei', message)
+
+    @staticmethod
+    def _parse_simple_heartbeat_bytes(buf, start, end, record, keep_raw):
+        length = end - start
+        if (length == 15 or (length == 16 and buf[end - 1] == 0x3B)) and buf[start:start + 15].isdigit():
+            imei = buf[start:start + 15].decode('ascii')
+            if record:
+                return GPSFix('heartbeat_simple', None, sys.intern(imei))
+            return {'type': 'heartbeat_simple', 'imei': imei}
+        return _reject('bad_imei', buf[start:end])
+
+    @staticmethod
+    def _parse_command_heartbeat_bytes(buf, start, end, record, keep_raw):
+        parts = buf[start:end].split(b',', 3)
+        imei = parts[1][5:].split(b':', 1)[0].decode('latin-1')
+        raw = buf[start:end].decode('latin-1') if (keep_raw or not record) else None
+        if record:
+            return GPSFix('heartbeat_command', None, sys.intern(imei), raw=raw)
+        return {
+            'type': 'heartbeat_command',
+            'imei': imei,
+            'status': parts[2].decode('latin-1').strip(';') if len(parts) > 2 else None,
+            'raw_data': raw
+        }
+
+    @staticmethod
+    def _parse_standard_bytes(buf, start, end, record, keep_raw):
+        """
+        Bytes counterpart of parse_standard_data (same fields, same rules).
+        """
+        try:
+            raw_end = end
+            while end > start and buf[end - 1] == 0x3B:  # strip(';')
+                end -= 1
+
+            # Fields 0..17 are used; the tail stays in one unsplit element
+            parts = buf[start:end].split(b',', 18)
+
+            imei_field = parts[0]
+            digits_end = 5
+            while digits_end < len(imei_field) and 0x30 <= imei_field[digits_end] <= 0x39:
+                digits_end += 1
+            if digits_end == 5:
+                return _reject('bad_imei', buf[start:raw_end])
+            imei = imei_field[5:digits_end].decode('ascii')
+
+            count = len(parts)
+            if count < 12:
+                return _reject('too_few_fields', buf[start:raw_end])
+
+            date_time = parts[2]
+            if len(date_time) >= 10:
+                date_time = date_time.decode('latin-1')
+                seconds = date_time[10:12] if len(date_time) >= 12 else '00'
+                timestamp = f"20{date_time[0:2]}-{date_time[2:4]}-{date_time[4:6]} {date_time[6:8]}:{date_time[8:10]}:{seconds}"
+            else:
+                timestamp = None
+
+            gps_status = parts[4].decode('latin-1')
+            latitude = _ddmm_bytes_to_decimal(parts[7], parts[8])
+            longitude = _ddmm_bytes_to_decimal(parts[9], parts[10])
+            speed = float(parts[11]) if parts[11] else 0.0
+            alarm = STANDARD_ALARMS.get(parts[1].decode('latin-1').lower())
+            acc_status = buf.find(b'State:ACC=1', start, raw_end) >= 0 or buf.find(b'acc on', start, raw_end) >= 0
+            door_status = buf.find(b'Door=1', start, raw_end) >= 0
+            raw = buf[start:raw_end].decode('latin-1') if (keep_raw or not record) else None
+
+            # Converted in both modes so record=True rejects what the dict path rejects
+            direction = (float(parts[12]) if parts[12] else 0.0) if count > 12 else None
+            altitude = (float(parts[13]) if parts[13] else 0.0) if count > 13 else None
+            fuel_tank1 = None
+            if count > 16 and b'%' in parts[16]:
+                fuel_tank1 = float(parts[16].strip(b'%'))
+            fuel_tank2 = None
+            if count > 17 and b'%' in parts[17]:
+                fuel_tank2 = float(parts[17].strip(b'%'))
+
+            if record:
+                flags = GPSFix.FLAG_GPS_VALID if gps_status in ('A', 'F') else 0
+                if acc_status:
+                    flags |= GPSFix.FLAG_ACC
+                if door_status:
+                    flags |= GPSFix.FLAG_DOOR
+                if alarm:
+                    flags |= GPSFix.FLAG_ALARM
+                return GPSFix('location_update', 'standard', sys.intern(imei),
+                              _timestamp_to_epoch(timestamp), latitude, longitude, speed,
+                              direction or 0.0, flags, fuel_tank1, alarm, raw)
+
+            result = {
+                'type': 'location_update',
+                'format': 'standard',
+                'imei': imei,
+                'timestamp': timestamp,
+                'sim_number': parts[3].decode('latin-1'),
+                'gps_status': gps_status,
+                'raw_data': raw,
+                'latitude': latitude,
+                'longitude': longitude,
+                'speed': speed,
+            }
+            if direction is not None:
+                result['direction'] = direction
+            if altitude is not None:
+                result['altitude'] = altitude
+            if fuel_tank1 is not None:
+                result['fuel_tank1'] = fuel_tank1
+            if fuel_tank2 is not None:
+                result['fuel_tank2'] = fuel_tank2
+            result['alarm'] = alarm
+            result['acc_status'] = acc_status
+            result['door_status'] = door_status
+            return result
+        except Exception as e:
+            return _reject('parse_error', buf[start:end], f"standard: {e}")
+
+    @staticmethod
+    def _parse_hq_bytes(buf, start, end, record, keep_raw):
+        """
+        Bytes counterpart of parse_hq_data (same fields, same rules).
+        """
+        try:
+            raw_end = end
+            if buf[end - 1] == 0x23:  # trailing '#'
+                end -= 1
+
+            # Fields 0..12 are used; the tail stays in one unsplit element
+            parts = buf[start:end].split(b',', 13)
+            if len(parts) < 12:
+                return _reject('too_few_fields', buf[start:raw_end])
+
+            imei = parts[1].decode('latin-1')
+            time_str = parts[3].decode('latin-1')
+            date_str = parts[11].decode('latin-1')
+            timestamp = f"20{date_str[4:6]}-{date_str[2:4]}-{date_str[0:2]} {time_str[0:2]}:{time_str[2:4]}:{time_str[4:6]}"
+            status = parts[4].decode('latin-1')
+            latitude = _ddmm_bytes_to_decimal(parts[5], parts[6])
+            longitude = _ddmm_bytes_to_decimal(parts[7], parts[8])
+            speed = float(parts[9]) if parts[9] else 0.0
+            course = float(parts[10]) if parts[10] else 0.0
+
+            acc_status = door_status = False
+            if len(parts) > 12 and len(parts[12]) >= 2:
+                try:
+                    state_val = int(parts[12], 16)
+                    acc_status = (state_val & 1) == 1
+                    door_status = (state_val & 2) == 2
+                except ValueError:
+                    pass
+            raw = buf[start:raw_end].decode('latin-1') if (keep_raw or not record) else None
+
+            if record:
+                flags = GPSFix.FLAG_GPS_VALID if status in ('A', 'F') else 0
+                if acc_status:
+                    flags |= GPSFix.FLAG_ACC
+                if door_status:
+                    flags |= GPSFix.FLAG_DOOR
+                return GPSFix('location_update', 'hq', sys.intern(imei), _timestamp_to_epoch(timestamp),
+                              latitude, longitude, speed, course, flags, None, None, raw)
+
+            return {
+                'type': 'location_update',
+                'format': 'hq',
+                'imei': imei,
+                'timestamp': timestamp,
+                'gps_status': status,
+                'raw_data': raw,
+                'latitude': latitude,
+                'longitude': longitude,
+                'speed': speed,
+                'direction': course,
+                'acc_status': acc_status,
+                'door_status': door_status
+            }
+        except Exception as e:
+            return _reject('parse_error', buf[start:end], f"hq: {e}")
 
     @staticmethod
     def _convert_ddmm_to_decimal(coord_str, direction):
@@ -244,6 +910,22 @@ class UniversalGPSParser:
             return None
 
 
+# Dispatch table (first character -> prefix -> parser)
+UniversalGPSParser.register_format('imei:', UniversalGPSParser.parse_standard_data,
+                                   UniversalGPSParser._parse_standard_bytes,
+                                   header_handler=UniversalGPSParser._standard_header)
+UniversalGPSParser.register_format('', UniversalGPSParser.parse_simple_heartbeat,
+                                   UniversalGPSParser._parse_simple_heartbeat_bytes,
+                                   first_chars='0123456789')
+UniversalGPSParser.register_format('##,imei:', UniversalGPSParser.parse_command_heartbeat,
+                                   UniversalGPSParser._parse_command_heartbeat_bytes)
+UniversalGPSParser.register_format('*HQ,', UniversalGPSParser.parse_hq_data,
+                                   UniversalGPSParser._parse_hq_bytes,
+                                   header_handler=UniversalGPSParser._hq_header)
+UniversalGPSParser.register_format('(', UniversalGPSParser.parse_simulator_data,
+                                   header_handler=UniversalGPSParser._simulator_header)
+
+
 # Example usage
 if __name__ == "__main__":
     parser = UniversalGPSParser()
@@ -253,7 +935,8 @@ if __name__ == "__main__":
         "imei:1234567,tracker,230520120000,,F,120000,A,3124.5678,N,12124.5678,E,0.00,0,10.0,0,0,80%,80%,25;",
         "123456789012345;",
         "##,imei:359586018966098,A",
-        "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,0,0,0,0,0,0,0,0#"
+        "*HQ,359586018966098,V1,123519,A,3123.1234,N,00433.9876,E,0.08,0,231023,0,0,0,0,0,0,0,0#",
+        "(359586018966098,LOC,33.5731,-7.5896,42.5,1,12.4,1)"
     ]
     
     print("Testing Universal GPS Parser:")